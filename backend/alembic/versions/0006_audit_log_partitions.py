@@ -0,0 +1,101 @@
+"""partition audit logs by month
+
+Revision ID: 0006_audit_log_partitions
+Revises: 0005_nodes
+Create Date: 2024-01-01 00:00:00.000000
+"""
+
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0006_audit_log_partitions"
+down_revision: Union[str, None] = "0005_nodes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + (month.month == 12), month.month % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        op.drop_index(op.f("ix_audit_logs_id"), table_name="audit_logs")
+        op.create_index("ix_audit_logs_created_at", "audit_logs", ["created_at"])
+        op.create_index("ix_audit_logs_actor_created_at", "audit_logs", ["actor", "created_at"])
+        op.create_index("ix_audit_logs_action_created_at", "audit_logs", ["action", "created_at"])
+        return
+
+    op.execute("ALTER TABLE audit_logs RENAME TO audit_logs_legacy")
+    op.execute("ALTER SEQUENCE audit_logs_id_seq OWNED BY NONE")
+    op.execute(
+        """
+        CREATE TABLE audit_logs (
+            id integer NOT NULL DEFAULT nextval('audit_logs_id_seq'),
+            actor varchar(100) NOT NULL,
+            action varchar(100) NOT NULL,
+            detail text,
+            created_at timestamptz NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.execute("ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id")
+    op.execute("CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT")
+
+    today = datetime.now(timezone.utc).date().replace(day=1)
+    oldest = bind.execute(sa.text("SELECT min(created_at) FROM audit_logs_legacy")).scalar()
+    month = oldest.date().replace(day=1) if oldest else today
+    last = _next_month(_next_month(today))
+    while month <= last:
+        upper = _next_month(month)
+        op.execute(
+            f"CREATE TABLE audit_logs_{month:%Y_%m} PARTITION OF audit_logs "
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00+00') TO ('{upper.isoformat()} 00:00+00')"
+        )
+        month = upper
+
+    op.execute(
+        "INSERT INTO audit_logs (id, actor, action, detail, created_at) "
+        "SELECT id, actor, action, detail, coalesce(created_at, now()) FROM audit_logs_legacy"
+    )
+    op.execute("DROP TABLE audit_logs_legacy")
+    op.create_index("ix_audit_logs_created_at", "audit_logs", ["created_at"])
+    op.create_index("ix_audit_logs_actor_created_at", "audit_logs", ["actor", "created_at"])
+    op.create_index("ix_audit_logs_action_created_at", "audit_logs", ["action", "created_at"])
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    op.drop_index("ix_audit_logs_action_created_at", table_name="audit_logs")
+    op.drop_index("ix_audit_logs_actor_created_at", table_name="audit_logs")
+    op.drop_index("ix_audit_logs_created_at", table_name="audit_logs")
+    if bind.dialect.name != "postgresql":
+        op.create_index(op.f("ix_audit_logs_id"), "audit_logs", ["id"], unique=False)
+        return
+
+    op.execute("ALTER TABLE audit_logs RENAME TO audit_logs_partitioned")
+    op.execute("ALTER SEQUENCE audit_logs_id_seq OWNED BY NONE")
+    op.execute(
+        """
+        CREATE TABLE audit_logs (
+            id integer NOT NULL DEFAULT nextval('audit_logs_id_seq') PRIMARY KEY,
+            actor varchar(100) NOT NULL,
+            action varchar(100) NOT NULL,
+            detail text,
+            created_at timestamptz
+        )
+        """
+    )
+    op.execute("ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id")
+    op.execute(
+        "INSERT INTO audit_logs (id, actor, action, detail, created_at) "
+        "SELECT id, actor, action, detail, created_at FROM audit_logs_partitioned"
+    )
+    op.execute("DROP TABLE audit_logs_partitioned CASCADE")
+    op.create_index(op.f("ix_audit_logs_id"), "audit_logs", ["id"], unique=False)
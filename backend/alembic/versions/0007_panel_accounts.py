@@ -0,0 +1,39 @@
+"""add panel accounts
+
+Revision ID: 0007_panel_accounts
+Revises: 0006_audit_log_partitions
+Create Date: 2024-01-01 00:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0007_panel_accounts"
+down_revision: Union[str, None] = "0006_audit_log_partitions"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "panel_accounts",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(length=50), nullable=False),
+        sa.Column("password_hash", sa.String(length=255), nullable=False),
+        sa.Column("role", sa.Enum("ADMIN", "RESELLER", name="role"), nullable=False),
+        sa.Column("is_active", sa.Boolean(), nullable=False, server_default=sa.true()),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("username", name="uq_panel_accounts_username"),
+    )
+    op.create_index(op.f("ix_panel_accounts_id"), "panel_accounts", ["id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_panel_accounts_id"), table_name="panel_accounts")
+    op.drop_table("panel_accounts")
+    sa.Enum(name="role").drop(op.get_bind(), checkfirst=True)
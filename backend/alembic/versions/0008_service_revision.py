@@ -0,0 +1,31 @@
+"""track subscription content revisions on services and nodes
+
+Revision ID: 0008_service_revision
+Revises: 0007_panel_accounts
+Create Date: 2024-01-01 00:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0008_service_revision"
+down_revision: Union[str, None] = "0007_panel_accounts"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("services", sa.Column("revision", sa.Integer(), nullable=False, server_default="1"))
+    op.add_column("services", sa.Column("revised_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("nodes", sa.Column("revised_at", sa.DateTime(timezone=True), nullable=True))
+    op.execute("UPDATE services SET revised_at = coalesce(created_at, CURRENT_TIMESTAMP)")
+    op.execute("UPDATE nodes SET revised_at = coalesce(created_at, CURRENT_TIMESTAMP)")
+
+
+def downgrade() -> None:
+    op.drop_column("nodes", "revised_at")
+    op.drop_column("services", "revised_at")
+    op.drop_column("services", "revision")
@@ -0,0 +1,49 @@
+"""add incrementally maintained reseller stats
+
+Revision ID: 0009_reseller_stats
+Revises: 0008_service_revision
+Create Date: 2024-01-01 00:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0009_reseller_stats"
+down_revision: Union[str, None] = "0008_service_revision"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "reseller_stats",
+        sa.Column("reseller_id", sa.Integer(), nullable=False),
+        sa.Column("users_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("services_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("active_services_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("traffic_used_bytes", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["reseller_id"], ["resellers.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("reseller_id"),
+    )
+    # Backfill from the current rows; later drift is corrected by the reconciler.
+    op.execute(
+        """
+        INSERT INTO reseller_stats (reseller_id, users_count, services_count, active_services_count,
+                                    traffic_used_bytes, updated_at)
+        SELECT r.id,
+               (SELECT count(*) FROM users u WHERE u.reseller_id = r.id),
+               (SELECT count(*) FROM services s WHERE s.reseller_id = r.id),
+               (SELECT count(*) FROM services s WHERE s.reseller_id = r.id AND s.is_active IS NOT FALSE),
+               (SELECT coalesce(sum(s.traffic_used_bytes), 0) FROM services s WHERE s.reseller_id = r.id),
+               CURRENT_TIMESTAMP
+        FROM resellers r
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("reseller_stats")
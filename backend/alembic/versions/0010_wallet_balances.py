@@ -0,0 +1,60 @@
+"""materialized wallet balances and checkpoints
+
+Revision ID: 0010_wallet_balances
+Revises: 0009_reseller_stats
+Create Date: 2024-01-01 00:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0010_wallet_balances"
+down_revision: Union[str, None] = "0009_reseller_stats"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "reseller_wallets",
+        sa.Column("reseller_id", sa.Integer(), nullable=False),
+        sa.Column("balance", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["reseller_id"], ["resellers.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("reseller_id"),
+    )
+    op.create_table(
+        "wallet_checkpoints",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("reseller_id", sa.Integer(), nullable=False),
+        sa.Column("transaction_id", sa.Integer(), nullable=False),
+        sa.Column("balance", sa.BigInteger(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["reseller_id"], ["resellers.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_wallet_checkpoints_reseller_created_at", "wallet_checkpoints", ["reseller_id", "created_at"])
+    op.create_index(
+        "ix_wallet_transactions_reseller_created_at", "wallet_transactions", ["reseller_id", "created_at"]
+    )
+    # Seed balances from the existing ledger; from here on they are maintained with each transaction.
+    op.execute(
+        """
+        INSERT INTO reseller_wallets (reseller_id, balance, updated_at)
+        SELECT reseller_id,
+               sum(CASE WHEN type = 'DEBIT' THEN -amount ELSE amount END),
+               CURRENT_TIMESTAMP
+        FROM wallet_transactions
+        GROUP BY reseller_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_wallet_transactions_reseller_created_at", table_name="wallet_transactions")
+    op.drop_index("ix_wallet_checkpoints_reseller_created_at", table_name="wallet_checkpoints")
+    op.drop_table("wallet_checkpoints")
+    op.drop_table("reseller_wallets")
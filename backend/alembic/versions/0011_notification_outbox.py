@@ -0,0 +1,38 @@
+"""retry bookkeeping and pending index for the notification outbox
+
+Revision ID: 0011_notification_outbox
+Revises: 0010_wallet_balances
+Create Date: 2024-01-01 00:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0011_notification_outbox"
+down_revision: Union[str, None] = "0010_wallet_balances"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("notification_events", sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("notification_events", sa.Column("next_attempt_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("notification_events", sa.Column("last_error", sa.Text(), nullable=True))
+    # Only undelivered rows are indexed, so the dispatcher's poll stays cheap however large the history grows.
+    op.create_index(
+        "ix_notification_events_pending",
+        "notification_events",
+        ["id"],
+        postgresql_where=sa.text("processed_at IS NULL"),
+        sqlite_where=sa.text("processed_at IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_notification_events_pending", table_name="notification_events")
+    op.drop_column("notification_events", "last_error")
+    op.drop_column("notification_events", "next_attempt_at")
+    op.drop_column("notification_events", "attempts")
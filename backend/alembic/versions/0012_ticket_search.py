@@ -0,0 +1,78 @@
+"""support ticket summaries, thread pagination and full-text search indexes
+
+Revision ID: 0012_ticket_search
+Revises: 0011_notification_outbox
+Create Date: 2024-01-01 00:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0012_ticket_search"
+down_revision: Union[str, None] = "0011_notification_outbox"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("support_tickets", sa.Column("last_message_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("support_tickets", sa.Column("last_message_preview", sa.String(length=200), nullable=True))
+    op.add_column("support_tickets", sa.Column("last_sender_role", sa.String(length=20), nullable=True))
+    op.add_column("support_tickets", sa.Column("message_count", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("support_tickets", sa.Column("unread_by_admin", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("support_tickets", sa.Column("unread_by_reseller", sa.Integer(), nullable=False, server_default="0"))
+
+    # Backfill the summary from the existing threads; unread counters start at zero.
+    op.execute(
+        """
+        UPDATE support_tickets SET
+            message_count = (SELECT count(*) FROM support_ticket_messages m WHERE m.ticket_id = support_tickets.id),
+            last_message_at = COALESCE(
+                (SELECT max(m.created_at) FROM support_ticket_messages m WHERE m.ticket_id = support_tickets.id),
+                support_tickets.created_at
+            ),
+            last_message_preview = (
+                SELECT substr(m.message, 1, 200) FROM support_ticket_messages m
+                WHERE m.ticket_id = support_tickets.id ORDER BY m.id DESC LIMIT 1
+            ),
+            last_sender_role = (
+                SELECT m.sender_role FROM support_ticket_messages m
+                WHERE m.ticket_id = support_tickets.id ORDER BY m.id DESC LIMIT 1
+            )
+        """
+    )
+
+    op.create_index("ix_support_tickets_last_message", "support_tickets", ["last_message_at", "id"])
+    op.create_index(
+        "ix_support_tickets_created_by_last_message", "support_tickets", ["created_by", "last_message_at", "id"]
+    )
+    op.create_index("ix_support_ticket_messages_ticket_id_id", "support_ticket_messages", ["ticket_id", "id"])
+
+    if op.get_bind().dialect.name == "postgresql":
+        # Expression indexes must match app.tickets._ts_vector exactly to be used.
+        op.execute(
+            "CREATE INDEX ix_support_tickets_subject_fts ON support_tickets "
+            "USING gin (to_tsvector('simple'::regconfig, subject))"
+        )
+        op.execute(
+            "CREATE INDEX ix_support_ticket_messages_message_fts ON support_ticket_messages "
+            "USING gin (to_tsvector('simple'::regconfig, message))"
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_support_ticket_messages_message_fts")
+        op.execute("DROP INDEX IF EXISTS ix_support_tickets_subject_fts")
+    op.drop_index("ix_support_ticket_messages_ticket_id_id", table_name="support_ticket_messages")
+    op.drop_index("ix_support_tickets_created_by_last_message", table_name="support_tickets")
+    op.drop_index("ix_support_tickets_last_message", table_name="support_tickets")
+    op.drop_column("support_tickets", "unread_by_reseller")
+    op.drop_column("support_tickets", "unread_by_admin")
+    op.drop_column("support_tickets", "message_count")
+    op.drop_column("support_tickets", "last_sender_role")
+    op.drop_column("support_tickets", "last_message_preview")
+    op.drop_column("support_tickets", "last_message_at")
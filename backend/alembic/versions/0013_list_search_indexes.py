@@ -0,0 +1,53 @@
+"""trigram and btree indexes for user/service search, filtering and sorting
+
+Revision ID: 0013_list_search_indexes
+Revises: 0012_ticket_search
+Create Date: 2024-01-01 00:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0013_list_search_indexes"
+down_revision: Union[str, None] = "0012_ticket_search"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGRAM_INDEXES = (
+    ("ix_users_email_trgm", "users", "email"),
+    ("ix_users_full_name_trgm", "users", "full_name"),
+    ("ix_services_name_trgm", "services", "name"),
+    ("ix_services_endpoint_trgm", "services", "endpoint"),
+)
+
+
+def upgrade() -> None:
+    op.create_index("ix_users_full_name", "users", ["full_name"])
+    op.create_index("ix_services_name", "services", ["name"])
+    op.create_index("ix_services_expires_at", "services", ["expires_at"])
+    # Must match app.models.SERVICE_USAGE_RATIO for filters and sorts to use it.
+    op.execute(
+        "CREATE INDEX ix_services_usage_ratio ON services "
+        "((CAST(traffic_used_bytes AS FLOAT) / nullif(traffic_limit_bytes, 0)))"
+    )
+
+    if op.get_bind().dialect.name == "postgresql":
+        # Trigram GIN indexes let ILIKE '%term%' avoid a sequential scan.
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for name, table, column in TRIGRAM_INDEXES:
+            op.create_index(
+                name, table, [column], postgresql_using="gin", postgresql_ops={column: "gin_trgm_ops"}
+            )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        for name, table, _ in reversed(TRIGRAM_INDEXES):
+            op.drop_index(name, table_name=table)
+    op.drop_index("ix_services_usage_ratio", table_name="services")
+    op.drop_index("ix_services_expires_at", table_name="services")
+    op.drop_index("ix_services_name", table_name="services")
+    op.drop_index("ix_users_full_name", table_name="users")
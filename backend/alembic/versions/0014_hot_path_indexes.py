@@ -0,0 +1,43 @@
+"""indexes for reseller-scoped listings, active-expiry scans and node/plan lookups
+
+Revision ID: 0014_hot_path_indexes
+Revises: 0013_list_search_indexes
+Create Date: 2024-01-01 00:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0014_hot_path_indexes"
+down_revision: Union[str, None] = "0013_list_search_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # crud.list_users/list_services filter on reseller_id and order by id; reconcile counts use the same prefix.
+    op.create_index("ix_users_reseller_id_id", "users", ["reseller_id", "id"])
+    op.create_index("ix_services_reseller_id_id", "services", ["reseller_id", "id"])
+    # Active services by expiry; the predicate matches Service.is_active.isnot(False) in crud.list_services.
+    op.create_index(
+        "ix_services_active_expires_at",
+        "services",
+        ["expires_at"],
+        postgresql_where=sa.text("is_active IS NOT false"),
+        sqlite_where=sa.text("is_active IS NOT 0"),
+    )
+    # service_nodes(service_id) is already covered by uq_service_node; node-side lookups were not.
+    op.create_index("ix_service_nodes_node_id", "service_nodes", ["node_id"])
+    # wallet.purchase_plan reads max(ends_at) for a reseller.
+    op.create_index("ix_reseller_subscriptions_reseller_ends_at", "reseller_subscriptions", ["reseller_id", "ends_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_reseller_subscriptions_reseller_ends_at", table_name="reseller_subscriptions")
+    op.drop_index("ix_service_nodes_node_id", table_name="service_nodes")
+    op.drop_index("ix_services_active_expires_at", table_name="services")
+    op.drop_index("ix_services_reseller_id_id", table_name="services")
+    op.drop_index("ix_users_reseller_id_id", table_name="users")
@@ -0,0 +1,76 @@
+"""persist xray client uuid and stats key on subscription tokens
+
+Revision ID: 0015_client_stats_keys
+Revises: 0014_hot_path_indexes
+Create Date: 2024-01-01 00:00:00.000000
+"""
+
+import hashlib
+import uuid
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0015_client_stats_keys"
+down_revision: Union[str, None] = "0014_hot_path_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    op.add_column("subscription_tokens", sa.Column("client_uuid", sa.String(length=36), nullable=True))
+    op.add_column("subscription_tokens", sa.Column("stats_key", sa.String(length=16), nullable=True))
+
+    # Same derivations as models.client_uuid_for/stats_key_for, inlined so the
+    # migration keeps working if the models change.
+    bind = op.get_bind()
+    tokens = sa.table(
+        "subscription_tokens",
+        sa.column("id", sa.Integer),
+        sa.column("token", sa.String),
+        sa.column("client_uuid", sa.String),
+        sa.column("stats_key", sa.String),
+    )
+    fill = (
+        sa.update(tokens)
+        .where(tokens.c.id == sa.bindparam("b_id"))
+        .values(client_uuid=sa.bindparam("b_client_uuid"), stats_key=sa.bindparam("b_stats_key"))
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(tokens.c.id, tokens.c.token).where(tokens.c.id > last_id).order_by(tokens.c.id).limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            fill,
+            [
+                {
+                    "b_id": token_id,
+                    "b_client_uuid": str(uuid.uuid5(uuid.NAMESPACE_URL, token)),
+                    "b_stats_key": hashlib.blake2b(token.encode(), digest_size=8).hexdigest(),
+                }
+                for token_id, token in rows
+            ],
+        )
+        last_id = rows[-1].id
+
+    with op.batch_alter_table("subscription_tokens") as batch:
+        batch.alter_column("client_uuid", existing_type=sa.String(length=36), nullable=False)
+        batch.alter_column("stats_key", existing_type=sa.String(length=16), nullable=False)
+        batch.create_unique_constraint("uq_subscription_tokens_client_uuid", ["client_uuid"])
+        # Node stats arrive keyed by this value; attribution is one lookup on its index.
+        batch.create_unique_constraint("uq_subscription_tokens_stats_key", ["stats_key"])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("subscription_tokens") as batch:
+        batch.drop_constraint("uq_subscription_tokens_stats_key", type_="unique")
+        batch.drop_constraint("uq_subscription_tokens_client_uuid", type_="unique")
+        batch.drop_column("stats_key")
+        batch.drop_column("client_uuid")
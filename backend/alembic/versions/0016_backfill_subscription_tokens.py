@@ -0,0 +1,69 @@
+"""give every service a subscription token
+
+Revision ID: 0016_backfill_subscription_tokens
+Revises: 0015_client_stats_keys
+Create Date: 2024-01-01 00:00:00.000000
+"""
+
+import hashlib
+import secrets
+import uuid
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0016_backfill_subscription_tokens"
+down_revision: Union[str, None] = "0015_client_stats_keys"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    # The Xray render only lists services that have a token, so services that
+    # predate token-at-creation get one here rather than silently dropping out.
+    # Token and derivations match crud/models, inlined so the migration keeps
+    # working if they change.
+    bind = op.get_bind()
+    services = sa.table("services", sa.column("id", sa.Integer))
+    tokens = sa.table(
+        "subscription_tokens",
+        sa.column("token", sa.String),
+        sa.column("service_id", sa.Integer),
+        sa.column("client_uuid", sa.String),
+        sa.column("stats_key", sa.String),
+        sa.column("created_at", sa.DateTime(timezone=True)),
+    )
+    missing = (
+        sa.select(services.c.id)
+        .where(~sa.exists().where(tokens.c.service_id == services.c.id))
+        .order_by(services.c.id)
+        .limit(BATCH_SIZE)
+    )
+    while True:
+        service_ids = bind.execute(missing).scalars().all()
+        if not service_ids:
+            break
+        now = datetime.now(timezone.utc)
+        rows = []
+        for service_id in service_ids:
+            token = secrets.token_urlsafe(32)
+            rows.append(
+                {
+                    "token": token,
+                    "service_id": service_id,
+                    "client_uuid": str(uuid.uuid5(uuid.NAMESPACE_URL, token)),
+                    "stats_key": hashlib.blake2b(token.encode(), digest_size=8).hexdigest(),
+                    "created_at": now,
+                }
+            )
+        bind.execute(sa.insert(tokens), rows)
+
+
+def downgrade() -> None:
+    # Tokens may already be in use by clients; they are kept.
+    pass
@@ -0,0 +1,32 @@
+"""order the usage ratio index descending with unlimited services last
+
+Revision ID: 0017_usage_ratio_nulls_last
+Revises: 0016_backfill_subscription_tokens
+Create Date: 2024-01-01 00:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0017_usage_ratio_nulls_last"
+down_revision: Union[str, None] = "0016_backfill_subscription_tokens"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+RATIO = "(CAST(traffic_used_bytes AS FLOAT) / nullif(traffic_limit_bytes, 0))"
+
+
+def upgrade() -> None:
+    # crud.list_services sorts the ratio NULLS LAST with id as tie-breaker; the
+    # dashboard's sort=-usage_ratio reads this index front to back.
+    # SQLite already sorts NULLs last when descending and rejects NULLS LAST in indexes.
+    nulls_last = " NULLS LAST" if op.get_bind().dialect.name == "postgresql" else ""
+    op.drop_index("ix_services_usage_ratio", table_name="services")
+    op.execute(f"CREATE INDEX ix_services_usage_ratio ON services ({RATIO} DESC{nulls_last}, id DESC)")
+
+
+def downgrade() -> None:
+    op.drop_index("ix_services_usage_ratio", table_name="services")
+    op.execute(f"CREATE INDEX ix_services_usage_ratio ON services ({RATIO})")
@@ -0,0 +1,41 @@
+"""make support_tickets.last_message_at non-null
+
+Revision ID: 0018_ticket_last_message_not_null
+Revises: 0017_usage_ratio_nulls_last
+Create Date: 2024-01-01 00:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0018_ticket_last_message_not_null"
+down_revision: Union[str, None] = "0017_usage_ratio_nulls_last"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The inbox keyset compares and orders on the raw column; a NULL would sort
+    # first on Postgres and never satisfy the cursor's "<", so tickets opened
+    # without a message start at their creation time instead.
+    op.execute(
+        "UPDATE support_tickets SET last_message_at = COALESCE(created_at, CURRENT_TIMESTAMP) "
+        "WHERE last_message_at IS NULL"
+    )
+    with op.batch_alter_table("support_tickets") as batch:
+        batch.alter_column(
+            "last_message_at",
+            existing_type=sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("support_tickets") as batch:
+        batch.alter_column(
+            "last_message_at", existing_type=sa.DateTime(timezone=True), nullable=True, server_default=None
+        )
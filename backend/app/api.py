@@ -1,19 +1,50 @@
 from __future__ import annotations
 
-from typing import Annotated, Optional
+from datetime import datetime
+from typing import Annotated, Any, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+import orjson
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
-from . import crud, schemas
+from . import audit, backup, bulk, connection_limits, crud, exports, reseller_stats, schemas, tickets, wallet, xray
 from .auth import get_current_user
+from .config import Settings, get_settings
 from .db import get_db
-from .models import Role, ServiceProtocol
+from .dependencies import require_role
+from .audit import audit_writer
+from .events import invalidation_bus
+from .models import Role, ServiceProtocol, SupportTicketStatus
+from .subscription import subscription_cache_stats
+from .token_filter import token_filter
 
 router = APIRouter(prefix="/api", tags=["api"])
 
 DbDep = Annotated[Session, Depends(get_db)]
 CurrentUser = Annotated[schemas.UserPublic, Depends(get_current_user)]
+AdminUser = Annotated[schemas.UserPublic, Depends(require_role(schemas.Role.ADMIN))]
+ResellerUser = Annotated[schemas.UserPublic, Depends(require_role(schemas.Role.RESELLER))]
+SettingsDep = Annotated[Settings, Depends(get_settings)]
+
+
+def _sort_pattern(fields: dict) -> str:
+    return f"^-?({'|'.join(fields)})$"
+
+
+class _UTCJSONResponse(ORJSONResponse):
+    """``ORJSONResponse`` writing UTC datetimes with a ``Z`` suffix, as the pydantic-serialized routes do."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z)
+
+
+def _own_reseller_id(db: Session, current_user: schemas.UserPublic) -> int:
+    reseller = crud.get_reseller_by_username(db, current_user.username)
+    if reseller is None:
+        raise HTTPException(status_code=404, detail="Reseller mapping not found")
+    return reseller.id
 
 
 # Users
@@ -23,15 +54,35 @@ def list_users(
     current_user: CurrentUser,
     limit: int = Query(50, ge=1, le=100),
     offset: int = Query(0, ge=0),
-) -> schemas.PaginatedUsers:
-    reseller_id = None
+    q: Optional[str] = Query(None, min_length=1, max_length=255, description="Substring of email or full name"),
+    reseller_id: Optional[int] = Query(None, description="Admin only; resellers always see their own users"),
+    sort: str = Query("id", pattern=_sort_pattern(crud.USER_SORT_FIELDS)),
+) -> _UTCJSONResponse:
     if current_user.role == Role.RESELLER:
         reseller = crud.get_reseller_by_username(db, current_user.username)
         if reseller is None:
             raise HTTPException(status_code=404, detail="Reseller mapping not found")
         reseller_id = reseller.id
-    users = crud.list_users(db, limit=limit, offset=offset, reseller_id=reseller_id)
-    return schemas.PaginatedUsers(items=[schemas.UserOut.from_orm(u) for u in users], limit=limit, offset=offset)
+    # Hot dashboard path: column rows straight to orjson, no ORM instances or per-item model validation.
+    rows = crud.list_user_rows(db, limit=limit, offset=offset, reseller_id=reseller_id, search=q, sort=sort)
+    return _UTCJSONResponse({"items": [dict(row) for row in rows], "limit": limit, "offset": offset})
+
+
+# Declared before /users/{user_id} so "export" is not parsed as an id.
+@router.get("/users/export", response_class=StreamingResponse)
+def export_users(
+    db: DbDep,
+    current_user: CurrentUser,
+    export_format: str = Query(exports.NDJSON, alias="format", pattern="^(ndjson|csv)$"),
+    q: Optional[str] = Query(None, min_length=1, max_length=255),
+    reseller_id: Optional[int] = Query(None, description="Admin only; resellers always export their own users"),
+) -> StreamingResponse:
+    if current_user.role == Role.RESELLER:
+        reseller_id = _own_reseller_id(db, current_user)
+    audit_writer.record(current_user.username, "users.export", f"reseller_id={reseller_id} q={q}")
+    stmt = crud.user_export_stmt(reseller_id, search=q)
+    columns = [column.key for column in crud.USER_LIST_COLUMNS]
+    return exports.export_response(db, stmt, export_format, columns, "users")
 
 
 @router.post("/users", response_model=schemas.UserOut, status_code=status.HTTP_201_CREATED)
@@ -88,7 +139,7 @@ def update_user(
     return schemas.UserOut.from_orm(updated)
 
 
-@router.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT, response_model=None)
 def delete_user(
     user_id: int,
     db: DbDep,
@@ -113,16 +164,102 @@ def list_services(
     current_user: CurrentUser,
     limit: int = Query(50, ge=1, le=100),
     offset: int = Query(0, ge=0),
-) -> schemas.PaginatedServices:
-    reseller_id = None
+    q: Optional[str] = Query(None, min_length=1, max_length=255, description="Substring of name or endpoint"),
+    reseller_id: Optional[int] = Query(None, description="Admin only; resellers always see their own services"),
+    is_active: Optional[bool] = Query(None),
+    expires_after: Optional[datetime] = Query(None),
+    expires_before: Optional[datetime] = Query(None),
+    min_usage: Optional[float] = Query(None, ge=0, description="Minimum traffic_used / traffic_limit"),
+    max_usage: Optional[float] = Query(None, ge=0, description="Maximum traffic_used / traffic_limit"),
+    sort: str = Query("id", pattern=_sort_pattern(crud.SERVICE_SORT_FIELDS)),
+) -> _UTCJSONResponse:
     if current_user.role == Role.RESELLER:
         reseller = crud.get_reseller_by_username(db, current_user.username)
         if reseller is None:
             raise HTTPException(status_code=404, detail="Reseller mapping not found")
         reseller_id = reseller.id
-    services = crud.list_services(db, limit=limit, offset=offset, reseller_id=reseller_id)
-    items = [schemas.ServiceOut.from_orm(s) for s in services]
-    return schemas.PaginatedServices(items=items, limit=limit, offset=offset)
+    rows = crud.list_service_rows(
+        db,
+        limit=limit,
+        offset=offset,
+        reseller_id=reseller_id,
+        search=q,
+        is_active=is_active,
+        expires_after=expires_after,
+        expires_before=expires_before,
+        min_usage_ratio=min_usage,
+        max_usage_ratio=max_usage,
+        sort=sort,
+    )
+    return _UTCJSONResponse({"items": [dict(row) for row in rows], "limit": limit, "offset": offset})
+
+
+@router.get("/services/export", response_class=StreamingResponse)
+def export_services(
+    db: DbDep,
+    current_user: CurrentUser,
+    export_format: str = Query(exports.NDJSON, alias="format", pattern="^(ndjson|csv)$"),
+    q: Optional[str] = Query(None, min_length=1, max_length=255),
+    reseller_id: Optional[int] = Query(None, description="Admin only; resellers always export their own services"),
+    is_active: Optional[bool] = Query(None),
+    expires_after: Optional[datetime] = Query(None),
+    expires_before: Optional[datetime] = Query(None),
+) -> StreamingResponse:
+    if current_user.role == Role.RESELLER:
+        reseller_id = _own_reseller_id(db, current_user)
+    audit_writer.record(current_user.username, "services.export", f"reseller_id={reseller_id} q={q}")
+    stmt = crud.service_export_stmt(
+        reseller_id, search=q, is_active=is_active, expires_after=expires_after, expires_before=expires_before
+    )
+    columns = [column.key for column in crud.SERVICE_LIST_COLUMNS]
+    return exports.export_response(db, stmt, export_format, columns, "services")
+
+
+def _bulk_target(db: Session, current_user: schemas.UserPublic, payload: schemas.BulkServiceTarget):
+    reseller_id = _own_reseller_id(db, current_user) if current_user.role == Role.RESELLER else None
+    return bulk.target_ids(payload, reseller_id)
+
+
+def _bulk_result(outcome: bulk.BulkOutcome, config_apply: Optional[schemas.XrayApplyResponse] = None) -> schemas.BulkResult:
+    return schemas.BulkResult(matched=outcome.matched, updated=outcome.updated, config_apply=config_apply)
+
+
+@router.post("/services/bulk/reset-usage", response_model=schemas.BulkResult)
+def bulk_reset_usage(payload: schemas.BulkServiceTarget, db: DbDep, current_user: CurrentUser) -> schemas.BulkResult:
+    outcome = bulk.reset_usage(db, _bulk_target(db, current_user, payload))
+    audit_writer.record(current_user.username, "services.bulk_reset_usage", f"updated={outcome.updated}")
+    return _bulk_result(outcome)
+
+
+@router.post("/services/bulk/extend-expiry", response_model=schemas.BulkResult)
+def bulk_extend_expiry(payload: schemas.BulkExtendExpiry, db: DbDep, current_user: CurrentUser) -> schemas.BulkResult:
+    outcome = bulk.extend_expiry(db, _bulk_target(db, current_user, payload), payload.days)
+    audit_writer.record(
+        current_user.username, "services.bulk_extend_expiry", f"days={payload.days} updated={outcome.updated}"
+    )
+    return _bulk_result(outcome)
+
+
+@router.post("/services/bulk/set-active", response_model=schemas.BulkResult)
+def bulk_set_active(
+    payload: schemas.BulkSetActive, db: DbDep, current_user: CurrentUser, settings: SettingsDep
+) -> schemas.BulkResult:
+    outcome = bulk.set_active(db, _bulk_target(db, current_user, payload), payload.is_active)
+    audit_writer.record(
+        current_user.username, "services.bulk_set_active", f"is_active={payload.is_active} updated={outcome.updated}"
+    )
+    # Disabled services drop out of the Xray client list: one apply for the whole batch.
+    config_apply = xray.apply_xray_config(db, settings) if outcome.updated else None
+    return _bulk_result(outcome, config_apply)
+
+
+@router.post("/services/bulk/assign-node", response_model=schemas.BulkResult)
+def bulk_assign_node(payload: schemas.BulkAssignNode, db: DbDep, current_user: AdminUser) -> schemas.BulkResult:
+    outcome = bulk.assign_node(db, _bulk_target(db, current_user, payload), payload.node_id)
+    audit_writer.record(
+        current_user.username, "services.bulk_assign_node", f"node_id={payload.node_id} updated={outcome.updated}"
+    )
+    return _bulk_result(outcome)
 
 
 @router.post("/services", response_model=schemas.ServiceOut, status_code=status.HTTP_201_CREATED)
@@ -197,7 +334,7 @@ def update_service(
     return schemas.ServiceOut.from_orm(updated)
 
 
-@router.delete("/services/{service_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/services/{service_id}", status_code=status.HTTP_204_NO_CONTENT, response_model=None)
 def delete_service(
     service_id: int,
     db: DbDep,
@@ -232,3 +369,251 @@ def generate_token(
         raise HTTPException(status_code=404, detail="Service not found")
     token = crud.ensure_subscription_token(db, service)
     return schemas.SubscriptionTokenOut.from_orm(token)
+
+
+# Diagnostics
+@router.get("/diagnostics/token-filter")
+def token_filter_stats(current_user: AdminUser) -> dict:
+    return token_filter.stats()
+
+
+@router.get("/diagnostics/invalidation-bus")
+def invalidation_bus_stats(current_user: AdminUser) -> dict:
+    return invalidation_bus.stats()
+
+
+@router.get("/diagnostics/load-shedding")
+def load_shedding_stats(request: Request, current_user: AdminUser) -> dict:
+    limiter = getattr(request.app.state, "concurrency_limiter", None)
+    if limiter is None:
+        raise HTTPException(status_code=404, detail="Load shedding is disabled")
+    return limiter.stats()
+
+
+@router.get("/diagnostics/subscription-cache")
+def subscription_cache_diagnostics(current_user: AdminUser) -> dict:
+    return subscription_cache_stats()
+
+
+@router.get("/limits/active-ips")
+def active_ips(current_user: AdminUser, limit: int = Query(100, ge=1, le=1000)) -> list[dict]:
+    return connection_limits.active_ip_counts(limit)
+
+
+# Reports
+@router.get("/reports/resellers", response_model=list[schemas.ResellerStatsOut])
+def reseller_reports(db: DbDep, current_user: AdminUser) -> list[schemas.ResellerStatsOut]:
+    return [schemas.ResellerStatsOut.from_orm(row) for row in reseller_stats.list_stats(db)]
+
+
+@router.get("/reports/reseller", response_model=schemas.ResellerStatsOut)
+def my_reseller_report(db: DbDep, current_user: CurrentUser) -> schemas.ResellerStatsOut:
+    reseller = crud.get_reseller_by_username(db, current_user.username)
+    if reseller is None:
+        raise HTTPException(status_code=404, detail="Reseller mapping not found")
+    return schemas.ResellerStatsOut.from_orm(reseller_stats.get_stats(db, reseller.id))
+
+
+# Plans and wallet
+@router.get("/plans", response_model=list[schemas.PlanOut])
+def list_plans(db: DbDep, current_user: CurrentUser) -> list[schemas.PlanOut]:
+    return [schemas.PlanOut.from_orm(plan) for plan in wallet.list_plans(db)]
+
+
+@router.post("/plans", response_model=schemas.PlanOut, status_code=status.HTTP_201_CREATED)
+def create_plan(payload: schemas.PlanCreate, db: DbDep, current_user: AdminUser) -> schemas.PlanOut:
+    return schemas.PlanOut.from_orm(wallet.create_plan(db, **payload.dict()))
+
+
+@router.post("/plans/{plan_id}/purchase", response_model=schemas.PlanPurchaseOut)
+def purchase_plan(plan_id: int, db: DbDep, current_user: ResellerUser) -> schemas.PlanPurchaseOut:
+    subscription, balance = wallet.purchase_plan(db, _own_reseller_id(db, current_user), plan_id)
+    return schemas.PlanPurchaseOut(
+        subscription_id=subscription.id,
+        plan_id=subscription.plan_id,
+        starts_at=subscription.starts_at,
+        ends_at=subscription.ends_at,
+        balance=balance,
+    )
+
+
+@router.get("/wallet", response_model=schemas.WalletOut)
+def get_wallet(db: DbDep, current_user: ResellerUser) -> schemas.WalletOut:
+    reseller_id = _own_reseller_id(db, current_user)
+    return schemas.WalletOut(reseller_id=reseller_id, balance=wallet.get_balance(db, reseller_id))
+
+
+@router.post("/wallet/credit", response_model=schemas.WalletOut)
+def credit_wallet(payload: schemas.WalletCredit, db: DbDep, current_user: AdminUser) -> schemas.WalletOut:
+    balance = wallet.credit(db, payload.reseller_id, payload.amount, payload.reason)
+    return schemas.WalletOut(reseller_id=payload.reseller_id, balance=balance)
+
+
+@router.get("/wallet/statement", response_model=schemas.WalletStatement)
+def wallet_statement(
+    db: DbDep,
+    current_user: ResellerUser,
+    since: datetime = Query(...),
+    until: Optional[datetime] = Query(None),
+) -> schemas.WalletStatement:
+    result = wallet.statement(db, _own_reseller_id(db, current_user), since, until or datetime.utcnow())
+    return schemas.WalletStatement(
+        **{**result, "transactions": [schemas.WalletTransactionOut.from_orm(row) for row in result["transactions"]]}
+    )
+
+
+# Support tickets
+@router.get("/tickets", response_model=schemas.PaginatedTickets)
+def list_tickets(
+    db: DbDep,
+    current_user: CurrentUser,
+    ticket_status: Optional[SupportTicketStatus] = Query(None, alias="status"),
+    unread: bool = Query(False),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+) -> schemas.PaginatedTickets:
+    items = tickets.list_tickets(
+        db, current_user, ticket_status=ticket_status, unread_only=unread, limit=limit, cursor=cursor
+    )
+    next_cursor = tickets.encode_cursor(items[-1]) if len(items) == limit else None
+    return schemas.PaginatedTickets(items=[schemas.TicketOut.from_orm(t) for t in items], next_cursor=next_cursor)
+
+
+@router.post("/tickets", response_model=schemas.TicketOut, status_code=status.HTTP_201_CREATED)
+def create_ticket(payload: schemas.TicketCreate, db: DbDep, current_user: CurrentUser) -> schemas.TicketOut:
+    return schemas.TicketOut.from_orm(tickets.create_ticket(db, current_user, payload.subject, payload.message))
+
+
+@router.get("/tickets/search", response_model=list[schemas.TicketSearchHit])
+def search_tickets(
+    db: DbDep,
+    current_user: CurrentUser,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+) -> list[schemas.TicketSearchHit]:
+    return [
+        schemas.TicketSearchHit(**schemas.TicketOut.from_orm(ticket).dict(), rank=rank)
+        for ticket, rank in tickets.search_tickets(db, current_user, q, limit)
+    ]
+
+
+@router.get("/tickets/{ticket_id}", response_model=schemas.TicketOut)
+def get_ticket(ticket_id: int, db: DbDep, current_user: CurrentUser) -> schemas.TicketOut:
+    return schemas.TicketOut.from_orm(tickets.get_ticket(db, ticket_id, current_user))
+
+
+@router.get("/tickets/{ticket_id}/messages", response_model=list[schemas.TicketMessageOut])
+def list_ticket_messages(
+    ticket_id: int,
+    db: DbDep,
+    current_user: CurrentUser,
+    after: Optional[int] = Query(None),
+    before: Optional[int] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+) -> list[schemas.TicketMessageOut]:
+    rows = tickets.list_messages(db, ticket_id, current_user, after_id=after, before_id=before, limit=limit)
+    return [schemas.TicketMessageOut.from_orm(row) for row in rows]
+
+
+@router.post(
+    "/tickets/{ticket_id}/messages", response_model=schemas.TicketMessageOut, status_code=status.HTTP_201_CREATED
+)
+def reply_ticket(
+    ticket_id: int, payload: schemas.TicketReply, db: DbDep, current_user: CurrentUser
+) -> schemas.TicketMessageOut:
+    return schemas.TicketMessageOut.from_orm(tickets.add_message(db, ticket_id, current_user, payload.message))
+
+
+@router.post("/tickets/{ticket_id}/read", response_model=schemas.TicketOut)
+def mark_ticket_read(ticket_id: int, db: DbDep, current_user: CurrentUser) -> schemas.TicketOut:
+    return schemas.TicketOut.from_orm(tickets.mark_read(db, ticket_id, current_user))
+
+
+@router.put("/tickets/{ticket_id}/status", response_model=schemas.TicketOut)
+def update_ticket_status(
+    ticket_id: int, payload: schemas.TicketStatusUpdate, db: DbDep, current_user: CurrentUser
+) -> schemas.TicketOut:
+    ticket = tickets.set_status(db, ticket_id, current_user, SupportTicketStatus(payload.status))
+    return schemas.TicketOut.from_orm(ticket)
+
+
+# Audit log
+@router.get("/audit-logs", response_model=schemas.PaginatedAuditLogs)
+def list_audit_logs(
+    db: DbDep,
+    current_user: AdminUser,
+    actor: Optional[str] = Query(None),
+    action: Optional[str] = Query(None),
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+) -> schemas.PaginatedAuditLogs:
+    entries = audit.query_audit_logs(
+        db, actor=actor, action=action, since=since, until=until, limit=limit, cursor=cursor
+    )
+    next_cursor = audit.encode_cursor(entries[-1]) if len(entries) == limit else None
+    return schemas.PaginatedAuditLogs(items=[schemas.AuditLogOut.from_orm(e) for e in entries], next_cursor=next_cursor)
+
+
+# Backups: chunked, resumable uploads
+@router.post("/backups/uploads", response_model=schemas.BackupUploadStatus, status_code=status.HTTP_201_CREATED)
+def start_backup_upload(
+    payload: schemas.BackupUploadCreate,
+    settings: SettingsDep,
+    current_user: AdminUser,
+) -> schemas.BackupUploadStatus:
+    return schemas.BackupUploadStatus(**backup.start_upload(settings, total_size=payload.total_size, sha256=payload.sha256))
+
+
+@router.get("/backups/uploads/{upload_id}", response_model=schemas.BackupUploadStatus)
+def get_backup_upload(
+    upload_id: str,
+    settings: SettingsDep,
+    current_user: AdminUser,
+) -> schemas.BackupUploadStatus:
+    return schemas.BackupUploadStatus(**backup.get_upload_status(settings, upload_id))
+
+
+@router.put("/backups/uploads/{upload_id}", response_model=schemas.BackupUploadStatus)
+async def put_backup_upload_chunk(
+    upload_id: str,
+    request: Request,
+    settings: SettingsDep,
+    current_user: AdminUser,
+    offset: int = Query(..., ge=0),
+    chunk_sha256: Optional[str] = Header(None, alias="X-Chunk-SHA256"),
+) -> schemas.BackupUploadStatus:
+    limit = settings.backup_upload_chunk_max_bytes
+    if int(request.headers.get("content-length") or 0) > limit:
+        raise HTTPException(status_code=413, detail="Chunk too large")
+    # Read the body incrementally so a chunk without (or lying about) its length stops at the limit.
+    data = bytearray()
+    async for piece in request.stream():
+        data += piece
+        if len(data) > limit:
+            raise HTTPException(status_code=413, detail="Chunk too large")
+    # Hashing, the offset check and the file write block, so they run off the event loop.
+    result = await run_in_threadpool(
+        backup.append_upload_chunk, settings, upload_id, offset=offset, data=bytes(data), chunk_sha256=chunk_sha256
+    )
+    return schemas.BackupUploadStatus(**result)
+
+
+@router.post("/backups/uploads/{upload_id}/complete")
+def complete_backup_upload(
+    upload_id: str,
+    db: DbDep,
+    settings: SettingsDep,
+    current_user: AdminUser,
+) -> dict:
+    return backup.complete_upload(settings, upload_id, current_user.username, db)
+
+
+@router.delete("/backups/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT, response_model=None)
+def abort_backup_upload(
+    upload_id: str,
+    settings: SettingsDep,
+    current_user: AdminUser,
+) -> None:
+    backup.abort_upload(settings, upload_id)
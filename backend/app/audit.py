@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import atexit
+import base64
+import logging
+import queue
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import and_, insert, or_, select, text
+from sqlalchemy.orm import Session
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+
+def _month_start(value: datetime) -> date:
+    return value.date().replace(day=1)
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + (month.month == 12), month.month % 12 + 1, 1)
+
+
+def ensure_month_partition(db: Session, month: date) -> None:
+    """Create and attach the ``audit_logs`` partition for ``month`` if missing.
+
+    Rows that already landed in the default partition for that month are moved
+    into the new partition before it is attached, otherwise Postgres refuses
+    the attach. No-op on databases other than Postgres.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    name = f"audit_logs_{month:%Y_%m}"
+    if db.scalar(text("SELECT to_regclass(:name)"), {"name": name}) is not None:
+        return
+    lower, upper = f"{month.isoformat()} 00:00+00", f"{_next_month(month).isoformat()} 00:00+00"
+    db.execute(text(f"CREATE TABLE {name} (LIKE audit_logs INCLUDING DEFAULTS)"))
+    db.execute(
+        text(
+            f"WITH moved AS (DELETE FROM audit_logs_default WHERE created_at >= :lower AND created_at < :upper "
+            f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+        ),
+        {"lower": lower, "upper": upper},
+    )
+    db.execute(text(f"ALTER TABLE audit_logs ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')"))
+    db.commit()
+    logger.info("Created audit log partition", extra={"partition": name})
+
+
+class AuditWriter:
+    """Buffer audit rows in memory and write them in batches from a background thread.
+
+    ``record`` only enqueues, so request handlers no longer pay for a commit per
+    audited action. The queue is bounded; when it is full ``record`` blocks,
+    applying backpressure rather than dropping entries. ``stop`` drains every
+    queued row before returning and is registered with ``atexit`` as a last
+    resort when the lifespan shutdown hook does not run.
+
+    The writer is bound to a database by ``start``, which the app lifespan
+    calls with its session factory; nothing is written before that. With
+    ``background=False`` each ``record`` is written synchronously instead,
+    which is what tests use.
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable[[], Session]] = None,
+        *,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        max_queue: int = 10_000,
+        max_retries: int = 5,
+    ) -> None:
+        self._session_factory = session_factory
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_retries = max_retries
+        self._queue: queue.Queue[dict[str, Any]] = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._partitions: set[date] = set()
+        self._atexit_registered = False
+        self._synchronous = False
+
+    def record(self, actor: str, action: str, detail: str | None = None) -> None:
+        self._queue.put({"actor": actor, "action": action, "detail": detail, "created_at": datetime.now(timezone.utc)})
+        if self._synchronous:
+            self.flush()
+
+    def start(self, session_factory: Optional[Callable[[], Session]] = None, *, background: bool = True) -> None:
+        with self._lock:
+            if session_factory is not None:
+                self._session_factory = session_factory
+            self._synchronous = not background
+            if not background or (self._thread and self._thread.is_alive()):
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def stop(self, timeout: float = 10.0) -> None:
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        self._stop.set()
+        if thread:
+            thread.join(timeout)
+        self.flush()
+        self._synchronous = False
+
+    def flush(self) -> None:
+        """Synchronously write everything currently queued."""
+        while True:
+            batch = self._take(block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def _take(self, block: bool) -> list[dict[str, Any]]:
+        batch: list[dict[str, Any]] = []
+        try:
+            batch.append(self._queue.get(timeout=self._flush_interval) if block else self._queue.get_nowait())
+            while len(batch) < self._batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._take(block=True)
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: list[dict[str, Any]]) -> None:
+        for attempt in range(self._max_retries if self._session_factory is not None else 0):
+            try:
+                with self._session_factory() as db:
+                    for month in {_month_start(row["created_at"]) for row in batch} - self._partitions:
+                        ensure_month_partition(db, month)
+                        self._partitions.add(month)
+                    db.execute(insert(AuditLog), batch)
+                    db.commit()
+                return
+            except Exception:
+                logger.exception("Audit batch write failed", extra={"rows": len(batch), "attempt": attempt + 1})
+                time.sleep(min(2**attempt * 0.1, 5.0))
+        # Keep the trail in the logs rather than losing it silently.
+        for row in batch:
+            logger.error("Audit entry not persisted", extra={**row, "created_at": row["created_at"].isoformat()})
+
+
+audit_writer = AuditWriter()
+
+
+def encode_cursor(entry: AuditLog) -> str:
+    raw = f"{entry.created_at.isoformat()}|{entry.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, entry_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(entry_id)
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+
+
+def query_audit_logs(
+    db: Session,
+    *,
+    actor: Optional[str] = None,
+    action: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+) -> list[AuditLog]:
+    """Newest-first audit entries, keyset-paginated on ``(created_at, id)``.
+
+    Filters map onto the ``(actor, created_at)``/``(action, created_at)`` indexes
+    and a bounded time range lets Postgres prune month partitions.
+    """
+    stmt = select(AuditLog)
+    if actor:
+        stmt = stmt.where(AuditLog.actor == actor)
+    if action:
+        stmt = stmt.where(AuditLog.action == action)
+    if since:
+        stmt = stmt.where(AuditLog.created_at >= since)
+    if until:
+        stmt = stmt.where(AuditLog.created_at < until)
+    if cursor:
+        created_at, entry_id = _decode_cursor(cursor)
+        stmt = stmt.where(
+            or_(AuditLog.created_at < created_at, and_(AuditLog.created_at == created_at, AuditLog.id < entry_id))
+        )
+    stmt = stmt.order_by(AuditLog.created_at.desc(), AuditLog.id.desc()).limit(limit)
+    return db.scalars(stmt).all()
@@ -1,70 +1,205 @@
 from __future__ import annotations
 
 import logging
-from typing import Dict, Optional
+import time
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
+from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
 
 from . import schemas
-from .security import create_access_token, decode_token, get_password_hash, verify_password
+from .cache import TTLCache
+from .config import Settings, get_settings
+from .db import get_db
+from .events import EventKind, InvalidationEvent, emit, invalidation_bus
+from .models import PanelAccount, Role
+from .security import (
+    create_access_token,
+    decode_token,
+    get_hash_pool,
+    get_password_hash,
+    is_token_revoked,
+    revoke_token,
+    token_digest,
+    verify_and_update_password,
+)
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
-class InMemoryUserStore:
-    def __init__(self) -> None:
-        self._users: Dict[str, tuple[str, schemas.Role]] = {}
+@dataclass(frozen=True)
+class _AccountRecord:
+    username: str
+    password_hash: str
+    role: schemas.Role
+    is_active: bool
 
-    def add_user(self, username: str, password: str, role: schemas.Role) -> None:
-        password_hash = get_password_hash(password)
-        self._users[username] = (password_hash, role)
+    def public(self) -> schemas.UserPublic:
+        return schemas.UserPublic(username=self.username, role=self.role)
+
+
+class DatabaseUserStore:
+    """Panel credentials stored in ``panel_accounts`` behind a short-lived per-process cache.
+
+    Every worker reads the same rows, so password or role changes are visible
+    everywhere once the cache entry expires (or is invalidated). bcrypt work is
+    pushed onto the bounded :class:`~app.security.PasswordHashPool`.
+    """
+
+    @cached_property
+    def _cache(self) -> TTLCache[str, _AccountRecord]:
+        # Built on first use so the module-level store does not read settings at import.
+        return TTLCache(maxsize=4096, ttl=get_settings().account_cache_ttl_seconds)
+
+    def _load(self, db: Session, username: str) -> Optional[_AccountRecord]:
+        record = self._cache.get(username)
+        if record is not None:
+            return record
+        account = db.scalar(select(PanelAccount).where(PanelAccount.username == username))
+        if account is None:
+            return None
+        record = _AccountRecord(account.username, account.password_hash, schemas.Role(account.role.value), account.is_active)
+        self._cache.set(username, record)
+        return record
+
+    def _store_hash(self, db: Session, username: str, password_hash: str) -> None:
+        db.execute(update(PanelAccount).where(PanelAccount.username == username).values(password_hash=password_hash))
+        emit(db, EventKind.ACCOUNT_CHANGED, username)
+        db.commit()
+
+    def add_user(self, db: Session, username: str, password: str, role: schemas.Role) -> None:
+        db.add(PanelAccount(username=username, password_hash=get_password_hash(password), role=Role(role.value)))
+        emit(db, EventKind.ACCOUNT_CHANGED, username)
+        db.commit()
         logger.info("Seeded user", extra={"username": username, "role": role})
 
-    def authenticate(self, username: str, password: str, expected_role: schemas.Role) -> Optional[schemas.UserPublic]:
-        if username not in self._users:
+    def set_password(self, db: Session, username: str, password: str) -> None:
+        self._store_hash(db, username, get_password_hash(password))
+
+    async def authenticate(
+        self, db: Session, username: str, password: str, expected_role: schemas.Role
+    ) -> Optional[schemas.UserPublic]:
+        record = await run_in_threadpool(self._load, db, username)
+        if record is None or not record.is_active or record.role != expected_role:
             return None
-        stored_hash, role = self._users[username]
-        if role != expected_role:
+        valid, new_hash = await get_hash_pool().run(verify_and_update_password, password, record.password_hash)
+        if not valid:
             return None
-        if not verify_password(password, stored_hash):
+        if new_hash:
+            await run_in_threadpool(self._store_hash, db, username, new_hash)
+            logger.info("Rehashed password with current cost", extra={"username": username})
+        return record.public()
+
+    def get_user(self, db: Session, username: str) -> Optional[schemas.UserPublic]:
+        record = self._load(db, username)
+        if record is None or not record.is_active:
             return None
-        return schemas.UserPublic(username=username, role=role)
+        return record.public()
 
-    def get_user(self, username: str) -> Optional[schemas.UserPublic]:
-        if username not in self._users:
-            return None
-        _, role = self._users[username]
-        return schemas.UserPublic(username=username, role=role)
+    def invalidate(self, username: Optional[str] = None) -> None:
+        if username is None:
+            self._cache.clear()
+            _token_cache().clear()
+        else:
+            self._cache.pop(username)
+            _token_cache().evict(lambda _, entry: entry.user.username == username)
+
+
+@dataclass
+class _VerifiedToken:
+    claims: dict
+    user: schemas.UserPublic
+    checked_at: float = field(default_factory=time.time)
+
+
+# Verified JWT claims keyed by token digest, held until the token's ``exp``.
+# Signature verification and the account lookup happen once per token; after
+# that only the Redis revocation flag and the account are re-checked, at most
+# every ``jwt_revalidate_seconds``.
+@lru_cache(maxsize=1)
+def _token_cache() -> TTLCache[str, _VerifiedToken]:
+    return TTLCache(maxsize=get_settings().jwt_cache_size)
+
+
+def _forget_token(digest: str) -> None:
+    _token_cache().pop(digest)
 
 
-user_store = InMemoryUserStore()
+user_store = DatabaseUserStore()
 
+invalidation_bus.on(EventKind.ACCOUNT_CHANGED, user_store.invalidate)
+invalidation_bus.on(EventKind.JWT_REVOKED, _forget_token)
+invalidation_bus.on_flush(user_store.invalidate)
 
-def get_current_user(request: Request) -> schemas.UserPublic:
+
+def seed_accounts(db: Session, settings: Settings) -> None:
+    """Create the env-configured admin/reseller logins if they do not exist yet."""
+    seeds = [(settings.admin_username, settings.admin_password, schemas.Role.ADMIN)]
+    if settings.reseller_username and settings.reseller_password:
+        seeds.append((settings.reseller_username, settings.reseller_password, schemas.Role.RESELLER))
+    for username, password, role in seeds:
+        if db.scalar(select(PanelAccount.id).where(PanelAccount.username == username)) is None:
+            user_store.add_user(db, username, password, role)
+
+
+def _request_token(request: Request) -> Optional[str]:
     token = None
     auth_header = request.headers.get("Authorization")
     if auth_header and auth_header.startswith("Bearer "):
         token = auth_header.split(" ", 1)[1]
     if not token:
         token = request.cookies.get("access_token")
+    return token
+
+
+def _resolve_user(db: Session, claims: dict) -> schemas.UserPublic:
+    user = user_store.get_user(db, claims["sub"])
+    if not user or user.role != schemas.Role(claims["role"]):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found or role mismatch")
+    return user
+
+
+def get_current_user(request: Request, db: Session = Depends(get_db)) -> schemas.UserPublic:
+    token = _request_token(request)
     if not token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
 
+    digest = token_digest(token)
+    entry = _token_cache().get(digest)
+    if entry is not None:
+        if time.time() - entry.checked_at < get_settings().jwt_revalidate_seconds:
+            return entry.user
+        if is_token_revoked(digest):
+            _token_cache().pop(digest)
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
+        try:
+            entry.user = _resolve_user(db, entry.claims)
+        except HTTPException:
+            _token_cache().pop(digest)
+            raise
+        entry.checked_at = time.time()
+        return entry.user
+
     payload = decode_token(token)
     if not payload or "sub" not in payload or "role" not in payload:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    if is_token_revoked(digest):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
 
-    user = user_store.get_user(payload["sub"])
-    if not user or user.role != schemas.Role(payload["role"]):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found or role mismatch")
+    user = _resolve_user(db, payload)
+    _token_cache().set(digest, _VerifiedToken(claims=payload, user=user), expires_at=float(payload["exp"]))
     return user
 
 
 @router.post("/login", response_model=schemas.TokenResponse)
-def login(payload: schemas.LoginRequest, response: Response) -> schemas.TokenResponse:
-    user = user_store.authenticate(payload.username, payload.password, payload.role_tab)
+async def login(payload: schemas.LoginRequest, response: Response, db: Session = Depends(get_db)) -> schemas.TokenResponse:
+    user = await user_store.authenticate(db, payload.username, payload.password, payload.role_tab)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials or role")
     token = create_access_token(subject=user.username, role=user.role)
@@ -78,6 +213,17 @@ def login(payload: schemas.LoginRequest, response: Response) -> schemas.TokenRes
     return schemas.TokenResponse(access_token=token, user=user)
 
 
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT, response_model=None)
+def logout(request: Request, response: Response, current_user: schemas.UserPublic = Depends(get_current_user)) -> None:
+    token = _request_token(request)
+    digest = token_digest(token)
+    entry = _token_cache().pop(digest)
+    claims = entry.claims if entry else decode_token(token) or {}
+    revoke_token(digest, float(claims.get("exp", time.time())))
+    invalidation_bus.publish([InvalidationEvent(EventKind.JWT_REVOKED, digest)])
+    response.delete_cookie("access_token")
+
+
 @router.get("/me", response_model=schemas.UserPublic)
 def read_current_user(current_user: schemas.UserPublic = Depends(get_current_user)) -> schemas.UserPublic:
     return current_user
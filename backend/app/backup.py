@@ -1,22 +1,47 @@
 from __future__ import annotations
 
+import fcntl
+import hashlib
 import json
+import logging
 import os
+import re
 import tarfile
+import threading
+import time
 import uuid
+import zlib
+from collections import deque
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Optional
 import shutil
 import subprocess
 
 from fastapi import HTTPException, status, UploadFile
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
 
 from .config import Settings
-from .models import AuditLog
-from .db import get_db
+from .audit import audit_writer
+from .db import get_db, get_engine
 from sqlalchemy.orm import Session
 
+logger = logging.getLogger(__name__)
+
+# Called as progress(phase, table, done, total); total is None when unknown (pg_dump).
+ProgressCallback = Callable[[str, str, int, Optional[int]], None]
+
+_DUMP_DIR = "db"
+_LEGACY_DUMP = "db.dump"
+# pg_dump/pg_restore -v name the table as "schema.table"; the parallel
+# restore's "finished item <id> TABLE DATA <tag>" carries only the bare tag.
+_PROGRESS_PATTERNS = (
+    re.compile(r'dumping contents of table "(?P<table>[^"]+)"'),
+    re.compile(r'processing data for table "(?P<table>[^"]+)"'),
+    re.compile(r"finished item \d+ TABLE DATA (?P<table>\S+)$"),
+)
+
 
 def _safe_join(base: Path, name: str) -> Path:
     candidate = (base / name).resolve()
@@ -30,21 +55,92 @@ def _current_revision() -> str:
     return "head"
 
 
-def create_backup(settings: Settings, db_session: Session, actor: str) -> dict[str, Any]:
+def _libpq_url(url: str, database: str | None = None) -> str:
+    parsed = make_url(url).set(drivername="postgresql")
+    if database is not None:
+        parsed = parsed.set(database=database)
+    return parsed.render_as_string(hide_password=False)
+
+
+def _parse_progress_line(line: str) -> str | None:
+    for pattern in _PROGRESS_PATTERNS:
+        match = pattern.search(line)
+        if match:
+            return match.group("table")
+    return None
+
+
+def _run_with_progress(
+    cmd: list[str], phase: str, progress: ProgressCallback | None = None, total: int | None = None
+) -> list[str]:
+    """Run pg_dump/pg_restore in verbose mode and report each table as it completes."""
+    seen: list[str] = []
+    seen_tables: set[str] = set()
+    # A parallel restore reports a table as "public.users" from the worker and
+    # then as "users" when the item finishes. A bare tag is paired with an
+    # earlier schema-qualified table of that name, so "public.x" and "audit.x"
+    # still count as two tables.
+    unpaired: dict[str, int] = {}
+    tail: deque[str] = deque(maxlen=20)
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    assert proc.stderr is not None
+    for line in proc.stderr:
+        tail.append(line.rstrip())
+        table = _parse_progress_line(line.rstrip())
+        if table is None or table in seen_tables:
+            continue
+        schema, _, name = table.rpartition(".")
+        if schema:
+            seen_tables.add(table)
+            unpaired[name] = unpaired.get(name, 0) + 1
+        elif unpaired.get(name):
+            unpaired[name] -= 1
+            continue
+        seen.append(table)
+        logger.info("Backup progress", extra={"phase": phase, "table": table, "done": len(seen), "total": total})
+        if progress:
+            progress(phase, table, len(seen), total)
+    returncode = proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr="\n".join(tail))
+    return seen
+
+
+def _count_table_data(dump_path: Path) -> int | None:
+    try:
+        proc = subprocess.run(["pg_restore", "-l", str(dump_path)], check=True, capture_output=True, text=True)
+    except Exception:
+        return None
+    return sum(1 for line in proc.stdout.splitlines() if not line.startswith(";") and " TABLE DATA " in line)
+
+
+def create_backup(
+    settings: Settings, db_session: Session, actor: str, progress: ProgressCallback | None = None
+) -> dict[str, Any]:
     backup_dir = Path(settings.backup_dir)
     backup_dir.mkdir(parents=True, exist_ok=True)
     backup_id = uuid.uuid4().hex
     work_dir = backup_dir / backup_id
     work_dir.mkdir(parents=True, exist_ok=True)
 
-    db_dump_path = work_dir / "db.dump"
+    db_dump_path = work_dir / _DUMP_DIR
+    cmd = [
+        "pg_dump",
+        "-Fd",
+        "-j",
+        str(max(settings.backup_dump_jobs, 1)),
+        "-v",
+        "-f",
+        str(db_dump_path),
+        _libpq_url(settings.database_url),
+    ]
     try:
-        subprocess.run(
-            ["pg_dump", "-Fc", settings.database_url, "-f", str(db_dump_path)],
-            check=True,
-            capture_output=True,
-        )
+        tables = _run_with_progress(cmd, "dump", progress)
+    except subprocess.CalledProcessError as exc:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise HTTPException(status_code=500, detail=f"pg_dump failed: {exc.stderr or exc}") from exc
     except Exception as exc:
+        shutil.rmtree(work_dir, ignore_errors=True)
         raise HTTPException(status_code=500, detail=f"pg_dump failed: {exc}") from exc
 
     settings_json = {
@@ -62,13 +158,19 @@ def create_backup(settings: Settings, db_session: Session, actor: str) -> dict[s
     (work_dir / "version.json").write_text(json.dumps(version_json))
 
     archive_path = backup_dir / f"{backup_id}.tar.gz"
-    with tarfile.open(archive_path, "w:gz") as tar:
-        for filename in ["db.dump", "settings.json", "version.json"]:
+    # Table data in a directory-format dump is already compressed per file.
+    with tarfile.open(archive_path, "w:gz", compresslevel=1) as tar:
+        for filename in [_DUMP_DIR, "settings.json", "version.json"]:
             tar.add(work_dir / filename, arcname=filename)
 
     shutil.rmtree(work_dir, ignore_errors=True)
-    _log(db_session, actor, "backup_create", str(archive_path))
-    return {"id": backup_id, "path": str(archive_path), "created_at": version_json["created_at"]}
+    _log(actor, "backup_create", str(archive_path))
+    return {
+        "id": backup_id,
+        "path": str(archive_path),
+        "created_at": version_json["created_at"],
+        "tables": len(tables),
+    }
 
 
 def list_backups(settings: Settings) -> list[dict[str, Any]]:
@@ -96,32 +198,424 @@ def download_backup(settings: Settings, backup_id: str) -> Path:
     return path
 
 
+_READ_CHUNK = 1024 * 1024
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_META_CAPTURE_LIMIT = 64 * 1024
+
+
+class _ArchiveStreamValidator:
+    """Validate a ``.tar.gz`` backup incrementally as its bytes arrive.
+
+    Compressed input is inflated chunk by chunk and tar headers are checked as
+    soon as they are complete, so a bad archive is rejected mid-upload instead
+    of after the whole file has landed on disk. Member payloads are skipped
+    without buffering except for ``version.json`` and pax/longname headers.
+    """
+
+    def __init__(self) -> None:
+        self._inflate = zlib.decompressobj(wbits=31)
+        self._buffer = bytearray()
+        self._skip = 0
+        self._capture: str | None = None
+        self._capture_left = 0
+        self._captured = bytearray()
+        self._long_name: str | None = None
+        self.members: list[str] = []
+        self.version: dict[str, Any] | None = None
+        self.end_of_archive = False
+
+    def feed(self, data: bytes) -> None:
+        try:
+            self._buffer += self._inflate.decompress(data)
+        except zlib.error as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid backup: {exc}") from exc
+        self._drain()
+
+    def finish(self) -> dict[str, Any] | None:
+        if not self._inflate.eof or not self.end_of_archive:
+            raise HTTPException(status_code=400, detail="Invalid backup: archive is truncated")
+        has_dump = _LEGACY_DUMP in self.members or f"{_DUMP_DIR}/toc.dat" in self.members
+        if not has_dump or "version.json" not in self.members:
+            raise HTTPException(status_code=400, detail="Invalid backup contents")
+        return self.version
+
+    def _drain(self) -> None:
+        buf = self._buffer
+        while True:
+            if self._skip:
+                take = min(self._skip, len(buf))
+                if self._capture is not None and self._capture_left:
+                    kept = min(take, self._capture_left)
+                    self._captured += buf[:kept]
+                    self._capture_left -= kept
+                del buf[:take]
+                self._skip -= take
+                if self._skip:
+                    return
+                self._end_capture()
+                continue
+            if self.end_of_archive or len(buf) < tarfile.BLOCKSIZE:
+                if self.end_of_archive:
+                    buf.clear()
+                return
+            block = bytes(buf[: tarfile.BLOCKSIZE])
+            del buf[: tarfile.BLOCKSIZE]
+            if block == tarfile.NUL * tarfile.BLOCKSIZE:
+                self.end_of_archive = True
+                continue
+            try:
+                info = tarfile.TarInfo.frombuf(block, tarfile.ENCODING, "surrogateescape")
+            except tarfile.HeaderError as exc:
+                raise HTTPException(status_code=400, detail=f"Invalid backup: {exc}") from exc
+            self._skip = -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            if info.type in (tarfile.XHDTYPE, tarfile.GNUTYPE_LONGNAME):
+                self._start_capture(info.type.decode(), info.size)
+            elif info.type != tarfile.XGLTYPE:
+                name = self._long_name or info.name
+                self._long_name = None
+                self._check_member(name, info)
+                if name == "version.json":
+                    self._start_capture(name, info.size)
+            if not self._skip:
+                self._end_capture()
+
+    def _start_capture(self, kind: str, size: int) -> None:
+        if size > _META_CAPTURE_LIMIT:
+            raise HTTPException(status_code=400, detail="Invalid backup: oversized metadata member")
+        self._capture = kind
+        self._capture_left = size
+        self._captured = bytearray()
+
+    def _end_capture(self) -> None:
+        kind, payload = self._capture, bytes(self._captured)
+        self._capture = None
+        if kind == tarfile.GNUTYPE_LONGNAME.decode():
+            self._long_name = payload.rstrip(tarfile.NUL).decode(tarfile.ENCODING, "surrogateescape")
+        elif kind == tarfile.XHDTYPE.decode():
+            for record in payload.decode("utf-8", "surrogateescape").splitlines():
+                _, _, keyword = record.partition(" ")
+                if keyword.startswith("path="):
+                    self._long_name = keyword[len("path=") :]
+        elif kind == "version.json":
+            try:
+                self.version = json.loads(payload.decode())
+            except ValueError as exc:
+                raise HTTPException(status_code=400, detail=f"Invalid backup: {exc}") from exc
+
+    def _check_member(self, name: str, info: tarfile.TarInfo) -> None:
+        parts = Path(name).parts
+        if name.startswith("/") or ".." in parts or info.issym() or info.islnk():
+            raise HTTPException(status_code=400, detail="Unsafe archive path")
+        self.members.append(name.rstrip("/"))
+
+
 def upload_backup(settings: Settings, file: UploadFile, actor: str, db_session: Session) -> dict[str, Any]:
     backup_dir = Path(settings.backup_dir)
     backup_dir.mkdir(parents=True, exist_ok=True)
     backup_id = uuid.uuid4().hex
     dest = backup_dir / f"{backup_id}.tar.gz"
-    with dest.open("wb") as f:
-        shutil.copyfileobj(file.file, f)
-    _validate_backup(dest)
-    _log(db_session, actor, "backup_upload", str(dest))
+    validator = _ArchiveStreamValidator()
+    written = 0
+    try:
+        with dest.open("wb") as f:
+            while chunk := file.file.read(_READ_CHUNK):
+                written += len(chunk)
+                if written > settings.backup_upload_max_bytes:
+                    raise HTTPException(status_code=413, detail="Backup exceeds maximum upload size")
+                validator.feed(chunk)
+                f.write(chunk)
+        validator.finish()
+    except Exception:
+        dest.unlink(missing_ok=True)
+        raise
+    _log(actor, "backup_upload", str(dest))
     return {"id": backup_id, "path": str(dest)}
 
 
-def restore_backup(settings: Settings, backup_id: str, db_session: Session, actor: str) -> str:
+# Chunked uploads
+#
+# A client starts an upload with the final size and SHA-256, then PUTs chunks
+# at explicit offsets. After a dropped connection it asks for the current
+# offset and resumes from there. Progress lives in ``uploads/<id>.part`` plus a
+# JSON sidecar, so any worker can continue an upload; each worker keeps the
+# running hash and archive validator in memory and rebuilds them from the part
+# file when it sees an upload for the first time. Chunk writes are serialized
+# per upload, and uploads idle for longer than BACKUP_UPLOAD_TTL_SECONDS are
+# swept, files and state alike, whenever a new upload starts.
+class _UploadState:
+    def __init__(self) -> None:
+        self.offset = 0
+        self.sha256 = hashlib.sha256()
+        self.validator = _ArchiveStreamValidator()
+
+    def feed(self, data: bytes) -> None:
+        self.validator.feed(data)
+        self.sha256.update(data)
+        self.offset += len(data)
+
+
+_upload_states: dict[str, _UploadState] = {}
+_upload_locks: dict[str, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def _upload_lock(upload_id: str) -> threading.Lock:
+    with _registry_lock:
+        return _upload_locks.setdefault(upload_id, threading.Lock())
+
+
+def _forget_upload(upload_id: str) -> None:
+    with _registry_lock:
+        _upload_states.pop(upload_id, None)
+        _upload_locks.pop(upload_id, None)
+
+
+def _uploads_dir(settings: Settings) -> Path:
+    path = (Path(settings.backup_dir) / "uploads").resolve()
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _upload_paths(settings: Settings, upload_id: str) -> tuple[Path, Path]:
+    if not _UPLOAD_ID_RE.match(upload_id):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    base = _uploads_dir(settings)
+    meta_path = base / f"{upload_id}.json"
+    if not meta_path.exists():
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return base / f"{upload_id}.part", meta_path
+
+
+def _read_upload_meta(meta_path: Path) -> dict[str, Any]:
+    # Called under the upload's lock; the upload may have completed or been swept since the path was checked.
+    try:
+        return json.loads(meta_path.read_text())
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found") from None
+
+
+def _upload_state(upload_id: str, part_path: Path) -> _UploadState:
+    state = _upload_states.get(upload_id)
+    if state is not None and state.offset == part_path.stat().st_size:
+        return state
+    state = _UploadState()
+    with part_path.open("rb") as f:
+        while chunk := f.read(_READ_CHUNK):
+            state.feed(chunk)
+    with _registry_lock:
+        _upload_states[upload_id] = state
+    return state
+
+
+def _upload_status(upload_id: str, meta: dict[str, Any], offset: int) -> dict[str, Any]:
+    return {"id": upload_id, "offset": offset, "total_size": meta["total_size"], "complete": offset == meta["total_size"]}
+
+
+def sweep_stale_uploads(settings: Settings, now: float | None = None) -> int:
+    """Delete uploads idle for longer than ``backup_upload_ttl_seconds``; returns how many were removed."""
+    cutoff = (now if now is not None else time.time()) - settings.backup_upload_ttl_seconds
+    base = _uploads_dir(settings)
+    removed = 0
+    upload_ids = {path.stem for path in base.iterdir() if path.suffix in (".part", ".json")}
+    for upload_id in sorted(upload_ids):
+        part_path, meta_path = base / f"{upload_id}.part", base / f"{upload_id}.json"
+        with _upload_lock(upload_id):
+            stamps = []
+            for file_path in (part_path, meta_path):
+                try:
+                    stamps.append(file_path.stat().st_mtime)
+                except FileNotFoundError:
+                    pass
+            # Both gone means it was completed, aborted or swept meanwhile.
+            if not stamps or max(stamps) >= cutoff:
+                continue
+            part_path.unlink(missing_ok=True)
+            meta_path.unlink(missing_ok=True)
+        _forget_upload(upload_id)
+        removed += 1
+        logger.info("Removed stale backup upload", extra={"upload_id": upload_id})
+    # State and locks of uploads another worker completed or aborted.
+    with _registry_lock:
+        known = set(_upload_states) | set(_upload_locks)
+    finished = [upload_id for upload_id in known if not (base / f"{upload_id}.json").exists()]
+    for upload_id in finished:
+        _forget_upload(upload_id)
+    return removed
+
+
+def start_upload(settings: Settings, *, total_size: int, sha256: str) -> dict[str, Any]:
+    sweep_stale_uploads(settings)
+    if total_size <= 0:
+        raise HTTPException(status_code=400, detail="total_size must be positive")
+    if total_size > settings.backup_upload_max_bytes:
+        raise HTTPException(status_code=413, detail="Backup exceeds maximum upload size")
+    upload_id = uuid.uuid4().hex
+    base = _uploads_dir(settings)
+    meta = {
+        "total_size": total_size,
+        "sha256": sha256.lower(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    (base / f"{upload_id}.part").touch()
+    (base / f"{upload_id}.json").write_text(json.dumps(meta))
+    return _upload_status(upload_id, meta, 0)
+
+
+def get_upload_status(settings: Settings, upload_id: str) -> dict[str, Any]:
+    part_path, meta_path = _upload_paths(settings, upload_id)
+    with _upload_lock(upload_id):
+        return _upload_status(upload_id, _read_upload_meta(meta_path), part_path.stat().st_size)
+
+
+def append_upload_chunk(
+    settings: Settings, upload_id: str, *, offset: int, data: bytes, chunk_sha256: str | None
+) -> dict[str, Any]:
+    part_path, meta_path = _upload_paths(settings, upload_id)
+    if chunk_sha256 and hashlib.sha256(data).hexdigest() != chunk_sha256.lower():
+        raise HTTPException(status_code=400, detail="Chunk checksum mismatch")
+    with _upload_lock(upload_id):
+        meta = _read_upload_meta(meta_path)
+        with part_path.open("ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            current = part_path.stat().st_size
+            if offset != current:
+                raise HTTPException(status_code=409, detail=f"Offset mismatch; resume from {current}")
+            if current + len(data) > meta["total_size"]:
+                raise HTTPException(status_code=413, detail="Chunk exceeds declared upload size")
+            state = _upload_state(upload_id, part_path)
+            try:
+                state.feed(data)
+            except HTTPException:
+                with _registry_lock:
+                    _upload_states.pop(upload_id, None)
+                raise
+            f.write(data)
+            f.flush()
+            return _upload_status(upload_id, meta, state.offset)
+
+
+def complete_upload(settings: Settings, upload_id: str, actor: str, db_session: Session) -> dict[str, Any]:
+    part_path, meta_path = _upload_paths(settings, upload_id)
+    with _upload_lock(upload_id):
+        meta = _read_upload_meta(meta_path)
+        state = _upload_state(upload_id, part_path)
+        if state.offset != meta["total_size"]:
+            raise HTTPException(status_code=409, detail=f"Upload incomplete; resume from {state.offset}")
+        if state.sha256.hexdigest() != meta["sha256"]:
+            raise HTTPException(status_code=400, detail="Upload checksum mismatch")
+        state.validator.finish()
+        dest = Path(settings.backup_dir) / f"{upload_id}.tar.gz"
+        part_path.replace(dest)
+        meta_path.unlink(missing_ok=True)
+    _forget_upload(upload_id)
+    _log(actor, "backup_upload", str(dest))
+    return {"id": upload_id, "path": str(dest)}
+
+
+def abort_upload(settings: Settings, upload_id: str) -> None:
+    part_path, meta_path = _upload_paths(settings, upload_id)
+    with _upload_lock(upload_id):
+        part_path.unlink(missing_ok=True)
+        meta_path.unlink(missing_ok=True)
+    _forget_upload(upload_id)
+
+
+def _pg_restore(settings: Settings, dump_path: Path, target_url: str, progress: ProgressCallback | None) -> None:
+    # pg_restore -j works for both directory dumps and legacy custom-format files.
+    cmd = ["pg_restore", "-j", str(max(settings.backup_restore_jobs, 1)), "-v", "-d", target_url, str(dump_path)]
+    _run_with_progress(cmd, "restore", progress, total=_count_table_data(dump_path))
+
+
+def _restore_via_staging(
+    settings: Settings, dump_path: Path, db_session: Session, progress: ProgressCallback | None
+) -> str:
+    """Restore into a fresh staging database, then swap it in by renaming.
+
+    The live database keeps serving while pg_restore runs; downtime is limited
+    to terminating connections and two renames. The previous database is kept
+    under a timestamped name for manual rollback. If a rename fails, the live
+    database is renamed back and accepts connections again before the error
+    propagates.
+    """
+    live_name = make_url(settings.database_url).database
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    staging_name = f"{live_name}_restore_staging"
+    previous_name = f"{live_name}_pre_restore_{stamp}"
+    admin_engine = create_engine(
+        _libpq_url(settings.database_url, database="postgres"), isolation_level="AUTOCOMMIT", future=True
+    )
+    try:
+        quote = admin_engine.dialect.identifier_preparer.quote
+        with admin_engine.connect() as conn:
+            conn.execute(text(f"DROP DATABASE IF EXISTS {quote(staging_name)}"))
+            conn.execute(text(f"CREATE DATABASE {quote(staging_name)}"))
+        _pg_restore(settings, dump_path, _libpq_url(settings.database_url, database=staging_name), progress)
+
+        db_session.invalidate()
+        get_engine().dispose()
+        with admin_engine.connect() as conn:
+            conn.execute(text(f"ALTER DATABASE {quote(live_name)} ALLOW_CONNECTIONS false"))
+            moved_aside = False
+            try:
+                conn.execute(
+                    text(
+                        "SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+                        "WHERE datname = :name AND pid <> pg_backend_pid()"
+                    ),
+                    {"name": live_name},
+                )
+                conn.execute(text(f"ALTER DATABASE {quote(live_name)} RENAME TO {quote(previous_name)}"))
+                moved_aside = True
+                conn.execute(text(f"ALTER DATABASE {quote(staging_name)} RENAME TO {quote(live_name)}"))
+            except Exception:
+                try:
+                    if moved_aside:
+                        conn.execute(text(f"ALTER DATABASE {quote(previous_name)} RENAME TO {quote(live_name)}"))
+                    conn.execute(text(f"ALTER DATABASE {quote(live_name)} ALLOW_CONNECTIONS true"))
+                except Exception:
+                    logger.critical(
+                        "Could not roll back the database swap",
+                        extra={"database": live_name, "previous": previous_name if moved_aside else None},
+                        exc_info=True,
+                    )
+                raise
+            conn.execute(text(f"ALTER DATABASE {quote(live_name)} ALLOW_CONNECTIONS true"))
+    finally:
+        admin_engine.dispose()
+    logger.info("Swapped restored database in", extra={"database": live_name, "previous": previous_name})
+    return previous_name
+
+
+def restore_backup(
+    settings: Settings,
+    backup_id: str,
+    db_session: Session,
+    actor: str,
+    progress: ProgressCallback | None = None,
+    staging: bool | None = None,
+) -> str:
     archive = download_backup(settings, backup_id)
     _validate_backup(archive, expect_revision=_current_revision())
     extract_dir = Path(settings.backup_dir) / f"restore_{backup_id}"
     extract_dir.mkdir(parents=True, exist_ok=True)
     with tarfile.open(archive, "r:gz") as tar:
         _safe_extract(tar, extract_dir)
-    db_dump = extract_dir / "db.dump"
+    db_dump = extract_dir / _DUMP_DIR
+    if not db_dump.is_dir():
+        db_dump = extract_dir / _LEGACY_DUMP
+    use_staging = settings.backup_restore_staging if staging is None else staging
     try:
-        subprocess.run(["pg_restore", "-d", settings.database_url, str(db_dump)], check=True, capture_output=True)
+        if use_staging:
+            _restore_via_staging(settings, db_dump, db_session, progress)
+        else:
+            _pg_restore(settings, db_dump, _libpq_url(settings.database_url), progress)
+    except subprocess.CalledProcessError as exc:
+        raise HTTPException(status_code=500, detail=f"pg_restore failed: {exc.stderr or exc}") from exc
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"pg_restore failed: {exc}") from exc
-    _log(db_session, actor, "backup_restore", backup_id)
-    shutil.rmtree(extract_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(extract_dir, ignore_errors=True)
+    _log(actor, "backup_restore", backup_id)
     return "restored"
 
 
@@ -137,7 +631,8 @@ def _validate_backup(path: Path, expect_revision: str | None = None) -> None:
     try:
         with tarfile.open(path, "r:gz") as tar:
             names = tar.getnames()
-            if "db.dump" not in names or "version.json" not in names:
+            has_dump = _LEGACY_DUMP in names or f"{_DUMP_DIR}/toc.dat" in names
+            if not has_dump or "version.json" not in names:
                 raise HTTPException(status_code=400, detail="Invalid backup contents")
             version = tar.extractfile("version.json")
             if version:
@@ -150,6 +645,5 @@ def _validate_backup(path: Path, expect_revision: str | None = None) -> None:
         raise HTTPException(status_code=400, detail=f"Invalid backup: {exc}") from exc
 
 
-def _log(db: Session, actor: str, action: str, detail: str) -> None:
-    db.add(AuditLog(actor=actor, action=action, detail=detail))
-    db.commit()
+def _log(actor: str, action: str, detail: str) -> None:
+    audit_writer.record(actor, action, detail)
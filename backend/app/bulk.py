@@ -0,0 +1,132 @@
+"""Set-based lifecycle operations on many services at once.
+
+Each operation selects its services with one ID subquery (an explicit ID list,
+the list filters, or both), applies one ``UPDATE ... WHERE id IN (...)`` and
+commits once, so resetting usage for a whole reseller is a single transaction
+instead of one commit per service. Reseller aggregates are adjusted with one
+grouped delta per reseller rather than per row.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import case, func, insert, literal, select, update, delete
+from sqlalchemy.orm import Session
+
+from . import crud, reseller_stats
+from .events import EventKind, emit
+from .models import Node, Service, ServiceNode, SubscriptionToken
+from .schemas import BulkServiceTarget
+
+
+@dataclass
+class BulkOutcome:
+    matched: int
+    updated: int
+
+
+def target_ids(target: BulkServiceTarget, reseller_id: int | None = None):
+    """The ID subquery for ``target``; resellers pass their own ``reseller_id`` and cannot widen it."""
+    if target.service_ids is None and target.filter is None:
+        raise HTTPException(status_code=400, detail="Specify service_ids or a filter")
+    filters = target.filter
+    if filters is not None:
+        return crud.service_ids_stmt(
+            reseller_id or filters.reseller_id,
+            service_ids=target.service_ids,
+            search=filters.q,
+            is_active=filters.is_active,
+            expires_after=filters.expires_after,
+            expires_before=filters.expires_before,
+            min_usage_ratio=filters.min_usage,
+            max_usage_ratio=filters.max_usage,
+        )
+    return crud.service_ids_stmt(reseller_id, service_ids=target.service_ids)
+
+
+def _lock(db: Session, ids) -> int:
+    """Lock the selected rows for the rest of the transaction and count them.
+
+    With the rows locked, the per-reseller aggregates read next agree with what
+    the UPDATE changes, so concurrent usage writes cannot skew the stats deltas.
+    """
+    return db.scalar(select(func.count()).select_from(ids.with_for_update().subquery()))
+
+
+def _per_reseller(db: Session, value, *conditions) -> list[tuple[int, int]]:
+    stmt = (
+        select(Service.reseller_id, value)
+        .where(Service.reseller_id.isnot(None), *conditions)
+        .group_by(Service.reseller_id)
+    )
+    return db.execute(stmt).all()
+
+
+def _update(db: Session, *conditions, **values) -> int:
+    result = db.execute(
+        update(Service).where(*conditions).values(**values).execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def reset_usage(db: Session, ids) -> BulkOutcome:
+    matched = _lock(db, ids)
+    selected = (Service.id.in_(ids), Service.traffic_used_bytes != 0)
+    for reseller_id, used in _per_reseller(db, func.sum(Service.traffic_used_bytes), *selected):
+        reseller_stats.apply_delta(db, reseller_id, traffic_bytes=-int(used or 0))
+    updated = _update(db, *selected, traffic_used_bytes=0)
+    db.commit()
+    return BulkOutcome(matched, updated)
+
+
+def extend_expiry(db: Session, ids, days: int) -> BulkOutcome:
+    """Push expiry out by ``days``, counting from now for services already expired or without one."""
+    matched = _lock(db, ids)
+    now = datetime.utcnow()
+    start = case((Service.expires_at.is_(None), now), (Service.expires_at < now, now), else_=Service.expires_at)
+    if db.get_bind().dialect.name == "sqlite":
+        expires_at = func.datetime(start, f"+{days} days")
+    else:
+        expires_at = start + timedelta(days=days)
+    updated = _update(db, Service.id.in_(ids), expires_at=expires_at)
+    db.commit()
+    return BulkOutcome(matched, updated)
+
+
+def set_active(db: Session, ids, is_active: bool) -> BulkOutcome:
+    """Enable or disable services; only rows whose state actually changes are updated."""
+    matched = _lock(db, ids)
+    changing = Service.is_active.is_(False) if is_active else Service.is_active.isnot(False)
+    selected = (Service.id.in_(ids), changing)
+    sign = 1 if is_active else -1
+    for reseller_id, count in _per_reseller(db, func.count(), *selected):
+        reseller_stats.apply_delta(db, reseller_id, active_services=sign * count)
+    updated = _update(db, *selected, is_active=is_active)
+    db.commit()
+    return BulkOutcome(matched, updated)
+
+
+def assign_node(db: Session, ids, node_id: int) -> BulkOutcome:
+    """Move services onto ``node_id``, replacing their current node assignments.
+
+    Core statements bypass the ORM flush hook that bumps service revisions, so
+    the bump is done here in the same UPDATE, and the affected subscriptions
+    are invalidated in one batch when the transaction commits.
+    """
+    if db.get(Node, node_id) is None:
+        raise HTTPException(status_code=404, detail="Node not found")
+    matched = _lock(db, ids)
+    db.execute(delete(ServiceNode).where(ServiceNode.service_id.in_(ids)).execution_options(synchronize_session=False))
+    db.execute(
+        insert(ServiceNode).from_select(
+            ["service_id", "node_id"], select(Service.id, literal(node_id)).where(Service.id.in_(ids))
+        )
+    )
+    updated = _update(db, Service.id.in_(ids), revision=Service.revision + 1, revised_at=datetime.utcnow())
+    for token in db.scalars(select(SubscriptionToken.token).where(SubscriptionToken.service_id.in_(ids))):
+        emit(db, EventKind.SUBSCRIPTION_CHANGED, token)
+    db.commit()
+    return BulkOutcome(matched, updated)
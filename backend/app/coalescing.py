@@ -0,0 +1,148 @@
+"""Request coalescing for subscription fetches.
+
+Many devices on one account, plus client retries, hit the same ``/sub/{token}``
+within milliseconds. ``SingleFlight`` lets concurrent identical requests inside
+a worker share one lookup and render: the first caller computes, the rest wait
+for its result (or its exception). ``FillLock`` extends this across workers for
+render cache fills: one worker renders a body version and parks it in Redis,
+the others wait briefly and read it back instead of rendering it again.
+"""
+
+from __future__ import annotations
+
+import logging
+import secrets
+import threading
+import time
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+import redis
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_FILL_POLL_SECONDS = 0.02
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight(Generic[K, V]):
+    """At most one in-flight computation per key; concurrent callers share it."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[K, _Call] = {}
+        self.leaders = 0
+        self.merged = 0
+
+    def do(self, key: K, fn: Callable[[], V]) -> V:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.merged += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"leaders": self.leaders, "merged": self.merged, "inflight": len(self._calls)}
+
+
+class FillLock:
+    """Cross-worker single-flight for cache fills, coordinated through Redis.
+
+    Keys must identify the exact content (e.g. include its version), so a body
+    found in Redis is always safe to serve. The worker that wins ``SET NX``
+    renders and stores the body; the others poll for it until ``timeout`` and
+    then render it themselves. Redis failures fall back to rendering locally.
+    """
+
+    def __init__(self, prefix: str, *, client: Optional[redis.Redis] = None) -> None:
+        self.prefix = prefix
+        self._client = client
+        self._counts = {"filled": 0, "shared": 0, "timeouts": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def _get_redis(self) -> redis.Redis:
+        if self._client is None:
+            self._client = redis.from_url(get_settings().redis_url)
+        return self._client
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def fill(self, key: str, render: Callable[[], bytes]) -> bytes:
+        settings = get_settings()
+        timeout = settings.subscription_fill_lock_timeout_seconds
+        body_key, lock_key = f"{self.prefix}:body:{key}", f"{self.prefix}:lock:{key}"
+        try:
+            r = self._get_redis()
+            body = r.get(body_key)
+            if body is not None:
+                self._count("shared")
+                return body
+            owner = secrets.token_hex(8)
+            if not r.set(lock_key, owner, nx=True, px=int(timeout * 1000)):
+                deadline = time.monotonic() + timeout
+                while time.monotonic() < deadline:
+                    time.sleep(_FILL_POLL_SECONDS)
+                    body = r.get(body_key)
+                    if body is not None:
+                        self._count("shared")
+                        return body
+                self._count("timeouts")
+                return render()
+        except redis.RedisError:
+            logger.warning("Fill lock unavailable", exc_info=True)
+            self._count("errors")
+            return render()
+
+        try:
+            body = render()
+            r.set(body_key, body, px=int(settings.subscription_cache_ttl_seconds * 1000))
+            self._count("filled")
+            return body
+        except redis.RedisError:
+            logger.warning("Fill lock store failed", exc_info=True)
+            self._count("errors")
+            return body
+        finally:
+            try:
+                # Not atomic, but the worst case after an expiry race is one extra render elsewhere.
+                if r.get(lock_key) == owner.encode():
+                    r.delete(lock_key)
+            except redis.RedisError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
@@ -1,18 +1,94 @@
 import os
 from functools import lru_cache
-from pydantic import Field
+from typing import Optional
+from pydantic import Field, field_validator, model_validator
 from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
     app_name: str = Field("Nightking VPN Panel", env="APP_NAME")
+    app_version: str = Field("0.1.0", env="APP_VERSION")
     environment: str = Field("development", env="ENVIRONMENT")
+    debug: bool = Field(False, env="DEBUG")
     postgres_user: str = Field("postgres", env="POSTGRES_USER")
     postgres_password: str = Field("postgres", env="POSTGRES_PASSWORD")
     postgres_db: str = Field("nightking", env="POSTGRES_DB")
     postgres_host: str = Field("db", env="POSTGRES_HOST")
     postgres_port: int = Field(5432, env="POSTGRES_PORT")
+    # Built from the POSTGRES_* settings unless set explicitly.
+    database_url: Optional[str] = Field(None, env="DATABASE_URL")
+    # Size of the engine's connection pool; sync routes also share the
+    # threadpool below, and load shedding keeps /sub within both.
+    db_pool_size: int = Field(5, env="DB_POOL_SIZE")
+    db_max_overflow: int = Field(10, env="DB_MAX_OVERFLOW")
+    threadpool_size: int = Field(40, env="THREADPOOL_SIZE")
     redis_url: str = Field("redis://redis:6379/0", env="REDIS_URL")
+    secret_key: str = Field("change-me", env="SECRET_KEY")
+    jwt_algorithm: str = Field("HS256", env="JWT_ALGORITHM")
+    access_token_expires_minutes: int = Field(60, env="ACCESS_TOKEN_EXPIRES_MINUTES")
+    admin_username: str = Field("admin", env="ADMIN_USERNAME")
+    admin_password: str = Field("changeme", env="ADMIN_PASSWORD")
+    reseller_username: Optional[str] = Field("reseller", env="RESELLER_USERNAME")
+    reseller_password: Optional[str] = Field("changeme", env="RESELLER_PASSWORD")
+    bcrypt_rounds: int = Field(12, env="BCRYPT_ROUNDS")
+    password_hash_workers: int = Field(2, env="PASSWORD_HASH_WORKERS")
+    password_hash_max_pending: int = Field(32, env="PASSWORD_HASH_MAX_PENDING")
+    account_cache_ttl_seconds: float = Field(30.0, env="ACCOUNT_CACHE_TTL_SECONDS")
+    jwt_cache_size: int = Field(10_000, env="JWT_CACHE_SIZE")
+    jwt_revalidate_seconds: float = Field(5.0, env="JWT_REVALIDATE_SECONDS")
+    token_filter_error_rate: float = Field(0.001, env="TOKEN_FILTER_ERROR_RATE")
+    token_filter_refresh_seconds: float = Field(5.0, env="TOKEN_FILTER_REFRESH_SECONDS")
+    token_filter_rebuild_seconds: float = Field(600.0, env="TOKEN_FILTER_REBUILD_SECONDS")
+    ip_limit_window_seconds: int = Field(300, env="IP_LIMIT_WINDOW_SECONDS")
+    concurrent_window_seconds: int = Field(60, env="CONCURRENT_WINDOW_SECONDS")
+    invalidation_channel: str = Field("nightking:invalidations", env="INVALIDATION_CHANNEL")
+    reseller_stats_reconcile_seconds: float = Field(3600.0, env="RESELLER_STATS_RECONCILE_SECONDS")
+    wallet_checkpoint_seconds: float = Field(3600.0, env="WALLET_CHECKPOINT_SECONDS")
+    notification_sinks: str = Field("", env="NOTIFICATION_SINKS")
+    notification_batch_size: int = Field(100, env="NOTIFICATION_BATCH_SIZE")
+    notification_poll_seconds: float = Field(2.0, env="NOTIFICATION_POLL_SECONDS")
+    notification_max_attempts: int = Field(8, env="NOTIFICATION_MAX_ATTEMPTS")
+    subscription_domain: str = Field("localhost", env="SUBSCRIPTION_DOMAIN")
+    subscription_port: int = Field(2053, env="SUBSCRIPTION_PORT")
+    subscription_scheme: str = Field("https", env="SUBSCRIPTION_SCHEME")
+    xray_config_path: str = Field("/etc/xray/config.json", env="XRAY_CONFIG_PATH")
+    xray_inbound_port: Optional[int] = Field(None, env="XRAY_INBOUND_PORT")
+    xray_status_host: str = Field("xray", env="XRAY_STATUS_HOST")
+    xray_reload_command: Optional[str] = Field(None, env="XRAY_RELOAD_COMMAND")
+    subscription_cache_ttl_seconds: float = Field(30.0, env="SUBSCRIPTION_CACHE_TTL_SECONDS")
+    subscription_coalescing_enabled: bool = Field(True, env="SUBSCRIPTION_COALESCING_ENABLED")
+    subscription_fill_lock_enabled: bool = Field(False, env="SUBSCRIPTION_FILL_LOCK_ENABLED")
+    subscription_fill_lock_timeout_seconds: float = Field(2.0, env="SUBSCRIPTION_FILL_LOCK_TIMEOUT_SECONDS")
+    load_shedding_enabled: bool = Field(True, env="LOAD_SHEDDING_ENABLED")
+    concurrency_limit_initial: int = Field(40, env="CONCURRENCY_LIMIT_INITIAL")
+    concurrency_limit_min: int = Field(8, env="CONCURRENCY_LIMIT_MIN")
+    concurrency_limit_max: int = Field(400, env="CONCURRENCY_LIMIT_MAX")
+    concurrency_protected_share: float = Field(0.2, env="CONCURRENCY_PROTECTED_SHARE")
+    shed_retry_after_seconds: int = Field(5, env="SHED_RETRY_AFTER_SECONDS")
+    query_count_warn: int = Field(50, env="QUERY_COUNT_WARN")
+    backup_dir: str = Field("/var/lib/nightking/backups", env="BACKUP_DIR")
+    backup_dump_jobs: int = Field(2, env="BACKUP_DUMP_JOBS")
+    backup_restore_jobs: int = Field(2, env="BACKUP_RESTORE_JOBS")
+    backup_restore_staging: bool = Field(False, env="BACKUP_RESTORE_STAGING")
+    backup_upload_max_bytes: int = Field(10 * 1024**3, env="BACKUP_UPLOAD_MAX_BYTES")
+    backup_upload_chunk_max_bytes: int = Field(16 * 1024**2, env="BACKUP_UPLOAD_CHUNK_MAX_BYTES")
+    backup_upload_ttl_seconds: float = Field(24 * 3600.0, env="BACKUP_UPLOAD_TTL_SECONDS")
+
+    @field_validator("concurrency_protected_share")
+    @classmethod
+    def _check_protected_share(cls, value: float) -> float:
+        if not 0 <= value < 1:
+            raise ValueError("concurrency_protected_share must be in [0, 1)")
+        return value
+
+    @model_validator(mode="after")
+    def _default_database_url(self) -> "Settings":
+        if not self.database_url:
+            self.database_url = (
+                f"postgresql+psycopg2://{self.postgres_user}:{self.postgres_password}"
+                f"@{self.postgres_host}:{self.postgres_port}/{self.postgres_db}"
+            )
+        return self
 
     class Config:
         env_file = os.getenv("ENV_FILE", ".env")
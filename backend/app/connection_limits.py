@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import time
+from typing import Optional
+
+import redis
+from fastapi import HTTPException, status
+
+from .config import get_settings
+from .models import Service
+
+logger = logging.getLogger(__name__)
+
+_cl_redis = None
+_check_script = None
+_view_script = None
+
+ACTIVE_INDEX_KEY = "svc:active"
+
+# One round trip per /sub hit: trim both sliding windows, admit or reject the
+# caller, record it, and bump the service in the active index used by the
+# admin view. Returns {allowed, distinct_ips, concurrent_clients}, where
+# allowed is 1 (ok), 0 (ip_limit hit) or -1 (concurrent_limit hit).
+_CHECK_LUA = """
+local now = tonumber(ARGV[1])
+local ip_window = tonumber(ARGV[2])
+local client_window = tonumber(ARGV[3])
+local ip_limit = tonumber(ARGV[4])
+local client_limit = tonumber(ARGV[5])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - ip_window)
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - client_window)
+local ips = redis.call('ZCARD', KEYS[1])
+local clients = redis.call('ZCARD', KEYS[2])
+local known_ip = redis.call('ZSCORE', KEYS[1], ARGV[6])
+local known_client = redis.call('ZSCORE', KEYS[2], ARGV[7])
+if ip_limit > 0 and not known_ip and ips >= ip_limit then
+  return {0, ips, clients}
+end
+if client_limit > 0 and not known_client and clients >= client_limit then
+  return {-1, ips, clients}
+end
+redis.call('ZADD', KEYS[1], now, ARGV[6])
+redis.call('PEXPIRE', KEYS[1], ip_window)
+redis.call('ZADD', KEYS[2], now, ARGV[7])
+redis.call('PEXPIRE', KEYS[2], client_window)
+redis.call('ZADD', KEYS[3], now, ARGV[8])
+if not known_ip then ips = ips + 1 end
+if not known_client then clients = clients + 1 end
+return {1, ips, clients}
+"""
+
+# Admin view: walk only services seen within the window (from the active
+# index) and count their live IPs. The per-service keys are derived inside the
+# script, which is fine on a single Redis but not cluster-safe.
+_VIEW_LUA = """
+local cutoff = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', cutoff)
+local ids = redis.call('ZREVRANGEBYSCORE', KEYS[1], '+inf', cutoff, 'LIMIT', 0, tonumber(ARGV[2]))
+local out = {}
+for _, id in ipairs(ids) do
+  out[#out + 1] = id
+  out[#out + 1] = redis.call('ZCOUNT', '{svc:' .. id .. '}:ips', cutoff, '+inf')
+end
+return out
+"""
+
+
+def _get_redis():
+    global _cl_redis, _check_script, _view_script
+    if _cl_redis is None:
+        _cl_redis = redis.from_url(get_settings().redis_url)
+        _check_script = _cl_redis.register_script(_CHECK_LUA)
+        _view_script = _cl_redis.register_script(_VIEW_LUA)
+    return _cl_redis
+
+
+def _keys(service_id: int) -> list[str]:
+    # Hash tag keeps both per-service sets in the same slot.
+    return [f"{{svc:{service_id}}}:ips", f"{{svc:{service_id}}}:clients", ACTIVE_INDEX_KEY]
+
+
+def client_fingerprint(client_ip: str, user_agent: Optional[str]) -> str:
+    return hashlib.sha1(f"{client_ip}|{user_agent or ''}".encode()).hexdigest()[:16]
+
+
+def enforce_connection_limits(service: Service, client_ip: str, user_agent: Optional[str]) -> None:
+    """Apply ``ip_limit``/``concurrent_limit`` for a subscription fetch.
+
+    Distinct client IPs are tracked in a sorted set per service over
+    ``ip_limit_window_seconds``; concurrent clients (IP + User-Agent) over the
+    shorter ``concurrent_window_seconds``. Callers already inside a window
+    are always admitted. Redis failures fail open.
+    """
+    settings = get_settings()
+    try:
+        _get_redis()
+        allowed, _, _ = _check_script(
+            keys=_keys(service.id),
+            args=[
+                int(time.time() * 1000),
+                settings.ip_limit_window_seconds * 1000,
+                settings.concurrent_window_seconds * 1000,
+                service.ip_limit or 0,
+                service.concurrent_limit or 0,
+                client_ip,
+                client_fingerprint(client_ip, user_agent),
+                service.id,
+            ],
+        )
+    except redis.RedisError:
+        logger.warning("Connection limit check unavailable", exc_info=True)
+        return
+    if allowed == 0:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="IP limit reached")
+    if allowed == -1:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Concurrent limit reached")
+
+
+def active_ip_counts(limit: int = 100) -> list[dict[str, int]]:
+    """Distinct IPs per recently active service, most recently seen first, without scanning keys."""
+    settings = get_settings()
+    _get_redis()
+    cutoff = int(time.time() * 1000) - settings.ip_limit_window_seconds * 1000
+    flat = _view_script(keys=[ACTIVE_INDEX_KEY], args=[cutoff, limit])
+    return [{"service_id": int(flat[i]), "distinct_ips": int(flat[i + 1])} for i in range(0, len(flat), 2)]
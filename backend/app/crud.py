@@ -1,37 +1,123 @@
 from __future__ import annotations
 
 import secrets
-from typing import Iterable, Optional
+from datetime import datetime
+from typing import Iterable, Mapping, Optional
 
-from sqlalchemy import select
+from sqlalchemy import RowMapping, bindparam, or_, select, update
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 
-from .models import Reseller, Service, ServiceProtocol, SubscriptionToken, User
+from . import reseller_stats
+from .events import EventKind, emit
+from .models import SERVICE_USAGE_RATIO, Reseller, Service, ServiceNode, ServiceProtocol, SubscriptionToken, User
+
+USER_SORT_FIELDS = {"id": User.id, "email": User.email, "full_name": User.full_name, "created_at": User.created_at}
+# Columns behind schemas.UserOut/ServiceOut, selected directly by the list fast path.
+USER_LIST_COLUMNS = (User.id, User.email, User.full_name, User.reseller_id, User.created_at)
+SERVICE_LIST_COLUMNS = (
+    Service.id,
+    Service.name,
+    Service.user_id,
+    Service.reseller_id,
+    Service.protocol,
+    Service.endpoint,
+    Service.traffic_limit_bytes,
+    Service.traffic_used_bytes,
+    Service.expires_at,
+    Service.ip_limit,
+    Service.concurrent_limit,
+    Service.is_active,
+    Service.created_at,
+)
+SERVICE_SORT_FIELDS = {
+    "id": Service.id,
+    "name": Service.name,
+    "endpoint": Service.endpoint,
+    "expires_at": Service.expires_at,
+    "created_at": Service.created_at,
+    "traffic_used_bytes": Service.traffic_used_bytes,
+    "usage_ratio": SERVICE_USAGE_RATIO,
+}
+# Unlimited services have no usage ratio; they go after every limited one.
+SERVICE_NULLS_LAST = frozenset({"usage_ratio"})
 
 
 def paginate(query, limit: int, offset: int):
     return query.limit(limit).offset(offset)
 
 
+def _contains(column, term: str):
+    """Case-insensitive substring match with LIKE wildcards in ``term`` taken literally."""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return column.ilike(f"%{escaped}%", escape="\\")
+
+
+def _order(stmt, fields: dict, sort: str, id_column, nulls_last: frozenset[str] = frozenset()):
+    """Apply ``sort`` (a field name, ``-`` prefixed for descending) with ``id`` as the tie-breaker.
+
+    Fields named in ``nulls_last`` sort NULLs last in both directions, on every dialect.
+    """
+    descending = sort.startswith("-")
+    name = sort.lstrip("-")
+    column = fields[name].desc() if descending else fields[name]
+    order = [column.nulls_last() if name in nulls_last else column]
+    if fields[name] is not id_column:
+        order.append(id_column.desc() if descending else id_column)
+    return stmt.order_by(*order)
+
+
 # Resellers
 def get_reseller_by_username(db: Session, username: str) -> Optional[Reseller]:
     return db.scalar(select(Reseller).where(Reseller.auth_username == username))
 
 
 # Users
-def list_users(db: Session, limit: int, offset: int, reseller_id: int | None = None) -> Iterable[User]:
-    stmt = select(User)
+def _users_stmt(entities, limit: int | None, offset: int, reseller_id: int | None, search: str | None, sort: str):
+    stmt = select(*entities)
     if reseller_id:
         stmt = stmt.where(User.reseller_id == reseller_id)
-    stmt = stmt.order_by(User.id)
-    stmt = paginate(stmt, limit, offset)
-    return db.scalars(stmt).all()
+    if search:
+        stmt = stmt.where(or_(_contains(User.email, search), _contains(User.full_name, search)))
+    stmt = _order(stmt, USER_SORT_FIELDS, sort, User.id)
+    return stmt if limit is None else paginate(stmt, limit, offset)
+
+
+def list_users(
+    db: Session,
+    limit: int,
+    offset: int,
+    reseller_id: int | None = None,
+    *,
+    search: str | None = None,
+    sort: str = "id",
+) -> Iterable[User]:
+    """Users filtered by a substring of email or name; ``search`` is served by the trigram indexes on Postgres."""
+    return db.scalars(_users_stmt((User,), limit, offset, reseller_id, search, sort)).all()
+
+
+def list_user_rows(
+    db: Session,
+    limit: int,
+    offset: int,
+    reseller_id: int | None = None,
+    *,
+    search: str | None = None,
+    sort: str = "id",
+) -> list[RowMapping]:
+    """``list_users`` as plain column mappings, skipping ORM instances for read-only listings."""
+    return db.execute(_users_stmt(USER_LIST_COLUMNS, limit, offset, reseller_id, search, sort)).mappings().all()
+
+
+def user_export_stmt(reseller_id: int | None = None, *, search: str | None = None):
+    """Every matching user as list columns in id order, unpaginated, for ``exports.stream_rows``."""
+    return _users_stmt(USER_LIST_COLUMNS, None, 0, reseller_id, search, "id")
 
 
 def create_user(db: Session, email: str, full_name: str, reseller_id: int | None) -> User:
     user = User(email=email, full_name=full_name, reseller_id=reseller_id)
     db.add(user)
+    reseller_stats.apply_delta(db, reseller_id, users=1)
     db.commit()
     db.refresh(user)
     return user
@@ -53,29 +139,113 @@ def update_user(db: Session, user: User, *, email: str, full_name: str) -> User:
 
 
 def delete_user(db: Session, user: User) -> None:
+    for service in user.services:
+        if service.subscription_token:
+            emit(db, EventKind.SUBSCRIPTION_DELETED, service.subscription_token.token)
+        reseller_stats.apply_delta(db, service.reseller_id, **reseller_stats.service_delta(service, -1))
+    reseller_stats.apply_delta(db, user.reseller_id, users=-1)
     db.delete(user)
     db.commit()
 
 
 # Services
-def list_services(db: Session, limit: int, offset: int, reseller_id: int | None = None) -> Iterable[Service]:
-    stmt = select(Service)
+def _services_stmt(
+    entities,
+    limit: int | None,
+    offset: int,
+    reseller_id: int | None,
+    *,
+    search: str | None = None,
+    is_active: bool | None = None,
+    expires_after: datetime | None = None,
+    expires_before: datetime | None = None,
+    min_usage_ratio: float | None = None,
+    max_usage_ratio: float | None = None,
+    sort: str = "id",
+):
+    stmt = select(*entities)
     if reseller_id:
         stmt = stmt.where(Service.reseller_id == reseller_id)
-    stmt = stmt.order_by(Service.id)
-    stmt = paginate(stmt, limit, offset)
-    return db.scalars(stmt).all()
+    if search:
+        stmt = stmt.where(or_(_contains(Service.name, search), _contains(Service.endpoint, search)))
+    if is_active is not None:
+        stmt = stmt.where(Service.is_active.isnot(False) if is_active else Service.is_active.is_(False))
+    if expires_after is not None:
+        stmt = stmt.where(Service.expires_at >= expires_after)
+    if expires_before is not None:
+        stmt = stmt.where(Service.expires_at < expires_before)
+    if min_usage_ratio is not None:
+        stmt = stmt.where(SERVICE_USAGE_RATIO >= min_usage_ratio)
+    if max_usage_ratio is not None:
+        stmt = stmt.where(SERVICE_USAGE_RATIO <= max_usage_ratio)
+    stmt = _order(stmt, SERVICE_SORT_FIELDS, sort, Service.id, SERVICE_NULLS_LAST)
+    return stmt if limit is None else paginate(stmt, limit, offset)
+
+
+def list_services(db: Session, limit: int, offset: int, reseller_id: int | None = None, **filters) -> Iterable[Service]:
+    """Services filtered by name/endpoint substring, state, expiry window and quota usage.
+
+    ``filters`` are the keyword arguments of ``_services_stmt``. Usage-ratio
+    filters only match services with a traffic limit.
+    """
+    return db.scalars(_services_stmt((Service,), limit, offset, reseller_id, **filters)).all()
+
+
+def list_service_rows(db: Session, limit: int, offset: int, reseller_id: int | None = None, **filters) -> list[RowMapping]:
+    """``list_services`` as plain column mappings, skipping ORM instances for read-only listings."""
+    return db.execute(_services_stmt(SERVICE_LIST_COLUMNS, limit, offset, reseller_id, **filters)).mappings().all()
+
+
+def service_export_stmt(reseller_id: int | None = None, **filters):
+    """Every matching service as list columns in id order, unpaginated, for ``exports.stream_rows``."""
+    return _services_stmt(SERVICE_LIST_COLUMNS, None, 0, reseller_id, **filters, sort="id")
+
+
+def service_ids_stmt(reseller_id: int | None = None, *, service_ids: list[int] | None = None, **filters):
+    """IDs of the matching services, unordered, for use as an ``IN`` subquery by set-based updates."""
+    stmt = _services_stmt((Service.id,), None, 0, reseller_id, **filters).order_by(None)
+    if service_ids is not None:
+        stmt = stmt.where(Service.id.in_(service_ids))
+    return stmt
 
 
 def create_service(
-    db: Session, *, name: str, user_id: int, reseller_id: int | None, protocol: ServiceProtocol, endpoint: str | None
+    db: Session,
+    *,
+    name: str,
+    user_id: int,
+    reseller_id: int | None,
+    protocol: ServiceProtocol,
+    endpoint: str | None,
+    traffic_limit_bytes: int | None = None,
+    expires_at: datetime | None = None,
+    ip_limit: int | None = None,
+    concurrent_limit: int | None = None,
+    is_active: bool = True,
+    token: str | None = None,
 ) -> Service:
-    service = Service(name=name, user_id=user_id, reseller_id=reseller_id, protocol=protocol, endpoint=endpoint)
+    """Create a service and its subscription token in one transaction.
+
+    Every service has a token from the moment it exists, so readers such as
+    the Xray render never have to create one. ``token`` keeps an imported value.
+    """
+    service = Service(
+        name=name,
+        user_id=user_id,
+        reseller_id=reseller_id,
+        protocol=protocol,
+        endpoint=endpoint,
+        traffic_limit_bytes=traffic_limit_bytes,
+        expires_at=expires_at,
+        ip_limit=ip_limit,
+        concurrent_limit=concurrent_limit,
+        is_active=is_active,
+    )
     db.add(service)
+    _add_token(db, service, token)
+    reseller_stats.apply_delta(db, reseller_id, **reseller_stats.service_delta(service))
     db.commit()
     db.refresh(service)
-    ensure_subscription_token(db, service)
-    db.refresh(service)
     return service
 
 
@@ -92,24 +262,106 @@ def update_service(
     service.name = name
     service.protocol = protocol
     service.endpoint = endpoint
+    if service.subscription_token:
+        emit(db, EventKind.SUBSCRIPTION_CHANGED, service.subscription_token.token)
     db.commit()
     db.refresh(service)
-    ensure_subscription_token(db, service)
-    db.refresh(service)
     return service
 
 
 def delete_service(db: Session, service: Service) -> None:
+    if service.subscription_token:
+        emit(db, EventKind.SUBSCRIPTION_DELETED, service.subscription_token.token)
+    reseller_stats.apply_delta(db, service.reseller_id, **reseller_stats.service_delta(service, -1))
     db.delete(service)
     db.commit()
 
 
+def add_usage(db: Session, service: Service, bytes_used: int) -> Service:
+    """Atomically add traffic to a service and its reseller's aggregate in one transaction."""
+    bytes_used = max(bytes_used, 0)
+    if bytes_used:
+        db.execute(
+            update(Service)
+            .where(Service.id == service.id)
+            .values(traffic_used_bytes=Service.traffic_used_bytes + bytes_used)
+            .execution_options(synchronize_session=False)
+        )
+        reseller_stats.apply_delta(db, service.reseller_id, traffic_bytes=bytes_used)
+        db.commit()
+        db.refresh(service)
+    return service
+
+
+def add_usage_by_stats_key(db: Session, usage: Mapping[str, int]) -> int:
+    """Add byte counts reported per Xray client, keyed by ``SubscriptionToken.stats_key``.
+
+    One lookup on the stats-key index resolves the whole batch, one executemany
+    UPDATE adds the bytes and reseller aggregates get one delta each. Unknown
+    keys (deleted services) are ignored. Returns how many services were updated.
+    """
+    usage = {key: bytes_used for key, bytes_used in usage.items() if bytes_used > 0}
+    if not usage:
+        return 0
+    rows = db.execute(
+        select(SubscriptionToken.stats_key, Service.id, Service.reseller_id)
+        .join(SubscriptionToken.service)
+        .where(SubscriptionToken.stats_key.in_(usage))
+    ).all()
+    if not rows:
+        return 0
+    services = Service.__table__
+    db.execute(
+        update(services)
+        .where(services.c.id == bindparam("b_id"))
+        .values(traffic_used_bytes=services.c.traffic_used_bytes + bindparam("b_bytes")),
+        [{"b_id": service_id, "b_bytes": usage[key]} for key, service_id, _ in rows],
+    )
+    per_reseller: dict[int, int] = {}
+    for key, _, reseller_id in rows:
+        if reseller_id is not None:
+            per_reseller[reseller_id] = per_reseller.get(reseller_id, 0) + usage[key]
+    for reseller_id, bytes_used in per_reseller.items():
+        reseller_stats.apply_delta(db, reseller_id, traffic_bytes=bytes_used)
+    db.commit()
+    return len(rows)
+
+
+def update_usage(db: Session, service: Service, *, traffic_used_bytes: int) -> Service:
+    reseller_stats.apply_delta(
+        db, service.reseller_id, traffic_bytes=traffic_used_bytes - (service.traffic_used_bytes or 0)
+    )
+    service.traffic_used_bytes = traffic_used_bytes
+    db.commit()
+    db.refresh(service)
+    return service
+
+
+def get_subscription_by_token(db: Session, token: str) -> Optional[SubscriptionToken]:
+    stmt = (
+        select(SubscriptionToken)
+        .where(SubscriptionToken.token == token)
+        .options(
+            joinedload(SubscriptionToken.service)
+            .selectinload(Service.service_nodes)
+            .joinedload(ServiceNode.node)
+        )
+    )
+    return db.scalar(stmt)
+
+
+def _add_token(db: Session, service: Service, token_value: str | None = None) -> SubscriptionToken:
+    token_value = token_value or secrets.token_urlsafe(32)
+    token = SubscriptionToken(token=token_value, service=service)
+    db.add(token)
+    emit(db, EventKind.TOKEN_CREATED, token_value)
+    return token
+
+
 def ensure_subscription_token(db: Session, service: Service) -> SubscriptionToken:
     if service.subscription_token:
         return service.subscription_token
-    token_value = secrets.token_urlsafe(32)
-    token = SubscriptionToken(token=token_value, service_id=service.id)
-    db.add(token)
+    token = _add_token(db, service)
     try:
         db.commit()
     except IntegrityError:
@@ -117,3 +369,28 @@ def ensure_subscription_token(db: Session, service: Service) -> SubscriptionToke
         raise
     db.refresh(token)
     return token
+
+
+def create_missing_subscription_tokens(
+    db: Session, protocol: ServiceProtocol | None = None, limit: int | None = None
+) -> int:
+    """Give services without a token one, in a single transaction; returns how many were created.
+
+    ``limit`` caps the batch; ``maintenance.backfill_subscription_tokens`` loops over batches.
+    """
+    stmt = select(Service.id).where(~Service.subscription_token.has()).order_by(Service.id).limit(limit)
+    if protocol is not None:
+        stmt = stmt.where(Service.protocol == protocol)
+    service_ids = db.scalars(stmt).all()
+    if not service_ids:
+        return 0
+    for service_id in service_ids:
+        token_value = secrets.token_urlsafe(32)
+        db.add(SubscriptionToken(token=token_value, service_id=service_id))
+        emit(db, EventKind.TOKEN_CREATED, token_value)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise
+    return len(service_ids)
@@ -1,31 +1,48 @@
 from __future__ import annotations
 
-from contextlib import contextmanager
+from functools import lru_cache
 from typing import Generator
 
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine, make_url
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session, sessionmaker
 
 from .config import get_settings
 
 
-def get_engine():
+@lru_cache(maxsize=1)
+def get_engine() -> Engine:
+    """The process-wide engine, created on first use rather than at import."""
     settings = get_settings()
+    pool = {}
+    if make_url(settings.database_url).get_backend_name() != "sqlite":
+        pool = {"pool_size": settings.db_pool_size, "max_overflow": settings.db_max_overflow}
     return create_engine(
         settings.database_url,
         echo=settings.environment == "development",
         future=True,
+        **pool,
     )
 
 
-engine = get_engine()
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
+@lru_cache(maxsize=1)
+def _session_factory() -> sessionmaker:
+    return sessionmaker(autocommit=False, autoflush=False, bind=get_engine(), future=True)
+
+
+def SessionLocal() -> Session:
+    """A new session; the first call creates the engine and its pool."""
+    return _session_factory()()
 
 
-@contextmanager
 def get_db() -> Generator[Session, None, None]:
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def upsert_insert(db: Session, model):
+    """``INSERT`` construct with ``on_conflict_do_*`` support for the session's dialect."""
+    return (postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert)(model)
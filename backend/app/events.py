@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import enum
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+import redis
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = "pending_invalidations"
+
+
+class EventKind(str, enum.Enum):
+    # key: subscription token
+    SUBSCRIPTION_CHANGED = "subscription.changed"
+    SUBSCRIPTION_DELETED = "subscription.deleted"
+    TOKEN_CREATED = "token.created"
+    # key: panel account username
+    ACCOUNT_CHANGED = "account.changed"
+    # key: JWT digest
+    JWT_REVOKED = "jwt.revoked"
+
+
+@dataclass(frozen=True)
+class InvalidationEvent:
+    kind: EventKind
+    key: str
+
+
+Handler = Callable[[str], None]
+
+
+class InvalidationBus:
+    """Fan cache invalidations out to every worker over Redis pub/sub.
+
+    Modules that hold per-process caches register a handler per
+    :class:`EventKind` plus a ``flush`` callback. Mutations queue events on the
+    SQLAlchemy session with :func:`emit`; they are applied locally and
+    published only once the transaction commits, and dropped on rollback.
+
+    Each worker runs one subscriber thread. Pub/sub is fire-and-forget, so after
+    any disconnect the subscriber flushes every registered cache before it
+    trusts the channel again; TTLs bound staleness while Redis is unreachable.
+    Events are only published to Redis once the bus has been started; the
+    channel defaults to ``INVALIDATION_CHANNEL`` and is resolved by ``start``.
+    """
+
+    def __init__(self, channel: Optional[str] = None) -> None:
+        self.channel = channel
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: dict[EventKind, list[Handler]] = defaultdict(list)
+        self._flush_handlers: list[Callable[[], None]] = []
+        self._redis: redis.Redis | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._connected = False
+
+    def on(self, kind: EventKind, handler: Handler) -> None:
+        self._handlers[kind].append(handler)
+
+    def on_flush(self, handler: Callable[[], None]) -> None:
+        self._flush_handlers.append(handler)
+
+    def dispatch(self, events: Iterable[InvalidationEvent]) -> None:
+        for item in events:
+            for handler in self._handlers.get(item.kind, ()):
+                try:
+                    handler(item.key)
+                except Exception:
+                    logger.exception("Invalidation handler failed", extra={"kind": item.kind.value})
+
+    def flush_all(self) -> None:
+        for handler in self._flush_handlers:
+            try:
+                handler()
+            except Exception:
+                logger.exception("Cache flush handler failed")
+
+    def publish(self, events: list[InvalidationEvent]) -> None:
+        if not events:
+            return
+        self.dispatch(events)
+        if self._thread is None:
+            return
+        message = json.dumps({"origin": self.origin, "events": [[e.kind.value, e.key] for e in events]})
+        try:
+            self._get_redis().publish(self.channel, message)
+        except redis.RedisError:
+            # Other workers fall back to their cache TTLs for this change.
+            logger.warning("Invalidation publish failed", extra={"events": len(events)}, exc_info=True)
+
+    def _get_redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = redis.from_url(get_settings().redis_url)
+        return self._redis
+
+    def _handle_message(self, data: bytes) -> None:
+        try:
+            payload = json.loads(data)
+            if payload.get("origin") == self.origin:
+                return
+            events = [InvalidationEvent(EventKind(kind), key) for kind, key in payload["events"]]
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed invalidation message")
+            return
+        self.dispatch(events)
+
+    def start(self, channel: Optional[str] = None) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self.channel = channel or self.channel or get_settings().invalidation_channel
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="invalidation-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {"origin": self.origin, "channel": self.channel, "connected": self._connected}
+
+    def _run(self) -> None:
+        backoff, missed = 0.5, False
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = self._get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                if missed:
+                    # Whatever was published while we were away is gone.
+                    self.flush_all()
+                    logger.info("Invalidation bus reconnected; flushed local caches")
+                self._connected, backoff, missed = True, 0.5, False
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        self._handle_message(message["data"])
+            except redis.RedisError:
+                logger.warning("Invalidation bus disconnected", exc_info=True)
+                missed = True
+            finally:
+                self._connected = False
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except redis.RedisError:
+                        pass
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+
+invalidation_bus = InvalidationBus()
+
+
+def emit(db: Session, kind: EventKind, key: Optional[str]) -> None:
+    """Queue an invalidation to be published when ``db`` commits."""
+    if not key:
+        return
+    if not db.in_transaction():
+        # Tie the event to a transaction so a rollback discards it; no connection is opened yet.
+        db.begin()
+    db.info.setdefault(_PENDING_KEY, []).append(InvalidationEvent(kind, key))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        invalidation_bus.publish(pending)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_pending(session: Session, previous_transaction) -> None:
+    # A savepoint rollback keeps its events: invalidating too much is harmless.
+    if not session.in_transaction():
+        session.info.pop(_PENDING_KEY, None)
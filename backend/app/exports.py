@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import csv
+import enum
+import io
+from datetime import datetime
+from typing import Any, Iterable, Iterator
+
+import orjson
+from fastapi.responses import StreamingResponse
+from sqlalchemy import RowMapping
+from sqlalchemy.orm import Session
+
+NDJSON = "ndjson"
+CSV = "csv"
+MEDIA_TYPES = {NDJSON: "application/x-ndjson", CSV: "text/csv; charset=utf-8"}
+BATCH_SIZE = 1000
+
+
+def stream_rows(db: Session, stmt, batch_size: int = BATCH_SIZE) -> Iterator[list[RowMapping]]:
+    """Rows of ``stmt`` in batches from a server-side cursor, so memory does not grow with the result."""
+    result = db.execute(stmt.execution_options(yield_per=batch_size))
+    yield from result.mappings().partitions()
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def ndjson_chunks(batches: Iterable[list[RowMapping]]) -> Iterator[bytes]:
+    for batch in batches:
+        yield b"".join(orjson.dumps(dict(row)) + b"\n" for row in batch)
+
+
+def csv_chunks(batches: Iterable[list[RowMapping]], columns: list[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows([_csv_value(row[column]) for column in columns] for row in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for an empty export.
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def export_response(db: Session, stmt, fmt: str, columns: list[str], filename: str) -> StreamingResponse:
+    """Stream ``stmt`` as NDJSON or CSV, one chunk per batch.
+
+    The body is produced after the request's dependencies have exited, so the
+    generator owns ``db`` from here on and closes it when the stream ends.
+    """
+
+    def body() -> Iterator[bytes]:
+        try:
+            batches = stream_rows(db, stmt)
+            yield from (csv_chunks(batches, columns) if fmt == CSV else ndjson_chunks(batches))
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
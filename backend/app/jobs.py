@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Any, Callable
+
+import redis
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+_jobs_redis = None
+
+
+def _get_redis():
+    global _jobs_redis
+    if _jobs_redis is None:
+        _jobs_redis = redis.from_url(get_settings().redis_url)
+    return _jobs_redis
+
+
+class PeriodicJob:
+    """Run ``func(db)`` every ``interval`` seconds on a background thread.
+
+    A Redis ``SET NX`` lease named after the job keeps several workers from
+    running it in the same interval; if Redis is unavailable every worker runs
+    it, so jobs must be idempotent.
+    """
+
+    def __init__(self, name: str, func: Callable[[Session], Any]) -> None:
+        self.name = name
+        self._func = func
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def _acquire(self, interval: float) -> bool:
+        try:
+            return bool(_get_redis().set(f"jobs:{self.name}", 1, nx=True, ex=max(int(interval * 0.9), 1)))
+        except redis.RedisError:
+            return True
+
+    def start(self, session_factory: Callable[[], Session], interval: float) -> None:
+        if interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(session_factory, interval), name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self, session_factory: Callable[[], Session], interval: float) -> None:
+        while not self._stop.wait(interval):
+            if not self._acquire(interval):
+                continue
+            try:
+                with session_factory() as db:
+                    result = self._func(db)
+                logger.info("Periodic job finished", extra={"job": self.name, "result": result})
+            except Exception:
+                logger.exception("Periodic job failed", extra={"job": self.name})
@@ -0,0 +1,207 @@
+"""Adaptive concurrency limit and load shedding for subscription traffic.
+
+Clients tend to refresh subscriptions in synchronized waves. Without a cap,
+every ``/sub`` request takes a threadpool slot and a DB connection and the
+admin panel stalls behind them. The limiter tracks latency and in-flight
+counts per route class, adjusts a concurrency limit from observed
+subscription latency and sheds subscription requests beyond their share of
+it with ``503`` and a jittered ``Retry-After``. Admin, auth and Xray routes
+are never shed and always keep ``protected_share`` of the limit. Health
+checks pass through uncounted.
+
+The adaptive limit can grow past what the process can actually run at once,
+so the subscription share is also capped at ``protected_share`` below the
+smaller of the threadpool and the DB connection pool.
+
+All state lives on the event loop thread, so no locking is needed.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import random
+import time
+from dataclasses import dataclass
+
+from .config import Settings
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION = "subscription"
+PROTECTED = "protected"
+ROUTE_CLASSES = (SUBSCRIPTION, PROTECTED)
+_PROTECTED_PREFIXES = ("/api/", "/auth/", "/xray/")
+
+
+def route_class(path: str) -> str | None:
+    if path.startswith("/sub/"):
+        return SUBSCRIPTION
+    if path.startswith(_PROTECTED_PREFIXES):
+        return PROTECTED
+    return None
+
+
+class GradientLimit:
+    """Concurrency limit steered by latency, after Netflix's Gradient2.
+
+    A fast EWMA of latency is compared with a baseline that stands in for the
+    no-load latency. While the fast one stays within ``tolerance`` of it the
+    limit grows by about ``sqrt(limit)`` per sample, and it shrinks in
+    proportion once queueing pushes latency up. Growth pauses while the limit
+    is not actually in use, so an idle period cannot inflate it.
+    """
+
+    def __init__(
+        self,
+        initial: float,
+        min_limit: float,
+        max_limit: float,
+        *,
+        tolerance: float = 2.0,
+        smoothing: float = 0.2,
+    ) -> None:
+        self.value = float(initial)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.short_latency: float | None = None
+        self.long_latency: float | None = None
+
+    def update(self, latency: float, inflight: int) -> float:
+        if self.short_latency is None or self.long_latency is None:
+            self.short_latency = self.long_latency = latency
+            return self.value
+        self.short_latency += 0.1 * (latency - self.short_latency)
+        # The baseline follows latency down quickly but up only slowly, so a
+        # sustained overload is not mistaken for the new no-load latency.
+        rate = 0.1 if latency < self.long_latency else 0.001
+        self.long_latency += rate * (latency - self.long_latency)
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_latency / self.short_latency))
+        if gradient == 1.0 and inflight < self.value / 2:
+            return self.value
+        target = self.value * gradient + math.sqrt(self.value)
+        self.value = max(self.min_limit, min(self.max_limit, (1 - self.smoothing) * self.value + self.smoothing * target))
+        return self.value
+
+
+@dataclass
+class _ClassStats:
+    inflight: int = 0
+    peak_inflight: int = 0
+    served: int = 0
+    shed: int = 0
+    latency_ms: float = 0.0
+
+
+class ConcurrencyLimiter:
+    def __init__(
+        self,
+        limit: GradientLimit,
+        *,
+        protected_share: float,
+        retry_after_seconds: int,
+        max_subscription: int | None = None,
+    ) -> None:
+        if not 0 <= protected_share < 1:
+            raise ValueError("protected_share must be in [0, 1)")
+        self.limit = limit
+        self.protected_share = protected_share
+        self.retry_after_seconds = retry_after_seconds
+        self.max_subscription = max_subscription
+        self._stats = {name: _ClassStats() for name in ROUTE_CLASSES}
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "ConcurrencyLimiter":
+        workers = min(settings.threadpool_size, settings.db_pool_size + settings.db_max_overflow)
+        return cls(
+            GradientLimit(settings.concurrency_limit_initial, settings.concurrency_limit_min, settings.concurrency_limit_max),
+            protected_share=settings.concurrency_protected_share,
+            retry_after_seconds=settings.shed_retry_after_seconds,
+            max_subscription=int(workers * (1 - settings.concurrency_protected_share)),
+        )
+
+    def subscription_capacity(self) -> int:
+        capacity = int(self.limit.value * (1 - self.protected_share))
+        if self.max_subscription is not None:
+            capacity = min(capacity, self.max_subscription)
+        return max(1, capacity)
+
+    def try_acquire(self, name: str) -> bool:
+        stats = self._stats[name]
+        if name == SUBSCRIPTION and stats.inflight >= self.subscription_capacity():
+            stats.shed += 1
+            return False
+        stats.inflight += 1
+        stats.peak_inflight = max(stats.peak_inflight, stats.inflight)
+        return True
+
+    def release(self, name: str, latency: float) -> None:
+        stats = self._stats[name]
+        stats.inflight -= 1
+        stats.served += 1
+        stats.latency_ms += 0.1 * (latency * 1000 - stats.latency_ms)
+        if name == SUBSCRIPTION:
+            self.limit.update(latency, stats.inflight + 1)
+
+    def retry_after(self) -> int:
+        # Jittered so shed clients do not come back as one synchronized wave.
+        return random.randint(self.retry_after_seconds, 2 * self.retry_after_seconds)
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit.value, 1),
+            "subscription_capacity": self.subscription_capacity(),
+            "max_subscription": self.max_subscription,
+            "protected_share": self.protected_share,
+            "classes": {
+                name: {
+                    "inflight": s.inflight,
+                    "peak_inflight": s.peak_inflight,
+                    "served": s.served,
+                    "shed": s.shed,
+                    "latency_ms": round(s.latency_ms, 2),
+                }
+                for name, s in self._stats.items()
+            },
+        }
+
+
+class LoadSheddingMiddleware:
+    """Admit or shed each HTTP request through ``limiter`` according to its route class."""
+
+    def __init__(self, app, *, limiter: ConcurrencyLimiter) -> None:
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send) -> None:
+        name = route_class(scope.get("path", "")) if scope["type"] == "http" else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+        if not self.limiter.try_acquire(name):
+            await _shed(send, self.limiter.retry_after())
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release(name, time.perf_counter() - started)
+
+
+async def _shed(send, retry_after: int) -> None:
+    body = b"Service temporarily overloaded, retry later"
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+                (b"cache-control", b"no-store"),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
@@ -1,38 +1,107 @@
+"""ASGI entry point.
+
+Run with ``uvicorn app.main:create_app --factory``. Importing this module
+builds nothing and reads no settings; routers and workers are imported by
+:func:`create_app` and its lifespan, so tooling that only needs the package
+does not pay for the API surface or the backup tooling behind it.
+"""
+
 from __future__ import annotations
 
 import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from .config import get_settings
+from .config import Settings, get_settings
 from .logging_config import configure_logging
 
-configure_logging()
 logger = logging.getLogger(__name__)
-settings = get_settings()
 
-app = FastAPI(title=settings.app_name)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+def _lifespan(settings: Settings):
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        from anyio import to_thread
+
+        from . import auth
+        from .audit import audit_writer
+        from .db import SessionLocal
+        from .events import invalidation_bus
+        from .notifications import dispatcher_from_settings
+        from .reseller_stats import stats_reconciler
+        from .token_filter import token_filter
+        from .wallet import wallet_checkpointer
+
+        # The engine, Redis clients and workers come up here, not at import, so
+        # importing the app (tests, tooling, worker boot) stays cheap.
+        logger.info("Starting application", extra={"environment": settings.environment})
+        to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_size
+        outbox_dispatcher = dispatcher_from_settings(settings)
+        audit_writer.start(SessionLocal)
+        invalidation_bus.start(settings.invalidation_channel)
+        with SessionLocal() as db:
+            auth.seed_accounts(db, settings)
+        token_filter.start(
+            SessionLocal,
+            settings.token_filter_refresh_seconds,
+            settings.token_filter_rebuild_seconds,
+            error_rate=settings.token_filter_error_rate,
+        )
+        stats_reconciler.start(SessionLocal, settings.reseller_stats_reconcile_seconds)
+        wallet_checkpointer.start(SessionLocal, settings.wallet_checkpoint_seconds)
+        outbox_dispatcher.start(SessionLocal, settings.notification_poll_seconds)
+        try:
+            yield
+        finally:
+            # Drain buffered audit entries before the worker exits.
+            audit_writer.stop()
+            token_filter.stop()
+            invalidation_bus.stop()
+            stats_reconciler.stop()
+            wallet_checkpointer.stop()
+            outbox_dispatcher.stop()
+
+    return lifespan
+
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    from . import api, auth, subscription, xray
+    from .load_shedding import ConcurrencyLimiter, LoadSheddingMiddleware
+    from .query_stats import QueryStatsMiddleware
 
+    settings = settings or get_settings()
+    configure_logging()
+    app = FastAPI(title=settings.app_name, lifespan=_lifespan(settings))
 
-@app.on_event("startup")
-async def startup_event() -> None:
-    logger.info("Starting application", extra={"environment": settings.environment})
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Query-Count", "X-Query-Time-Ms"] if settings.debug else [],
+    )
+    app.add_middleware(QueryStatsMiddleware, expose_header=settings.debug, warn_threshold=settings.query_count_warn)
+    if settings.load_shedding_enabled:
+        # Outermost, so shed requests cost no more than the 503 itself.
+        app.state.concurrency_limiter = ConcurrencyLimiter.from_settings(settings)
+        app.add_middleware(LoadSheddingMiddleware, limiter=app.state.concurrency_limiter)
 
+    app.include_router(auth.router)
+    app.include_router(api.router)
+    app.include_router(subscription.router)
+    app.include_router(xray.router)
 
-@app.get("/health")
-async def health() -> dict[str, str]:
-    return {"status": "ok"}
+    @app.get("/health")
+    async def health() -> dict[str, str]:
+        return {"status": "ok"}
 
+    @app.get("/ready")
+    async def ready() -> dict[str, str]:
+        # Placeholder for real dependency checks (database, redis, etc.)
+        return {"status": "ready"}
 
-@app.get("/ready")
-async def ready() -> dict[str, str]:
-    # Placeholder for real dependency checks (database, redis, etc.)
-    return {"status": "ready"}
+    return app
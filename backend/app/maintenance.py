@@ -0,0 +1,46 @@
+"""One-off maintenance jobs, run with ``python -m app.maintenance <job>``."""
+
+from __future__ import annotations
+
+import argparse
+import logging
+
+from sqlalchemy.orm import Session
+
+from . import crud
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def backfill_subscription_tokens(db: Session, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Give every service that predates token-at-creation a subscription token.
+
+    Each batch is its own short transaction, so a large backlog neither holds
+    locks for long nor loses finished batches if interrupted; rerunning resumes
+    where it stopped. Returns the number of tokens created.
+    """
+    total = 0
+    while True:
+        created = crud.create_missing_subscription_tokens(db, limit=batch_size)
+        total += created
+        if created:
+            logger.info("Backfilled subscription tokens", extra={"batch": created, "total": total})
+        if created < batch_size:
+            return total
+
+
+JOBS = {"backfill-tokens": backfill_subscription_tokens}
+
+
+if __name__ == "__main__":
+    from .db import SessionLocal
+    from .logging_config import configure_logging
+
+    parser = argparse.ArgumentParser(prog="python -m app.maintenance")
+    parser.add_argument("job", choices=sorted(JOBS))
+    args = parser.parse_args()
+    configure_logging()
+    with SessionLocal() as session:
+        logger.info("Maintenance job finished", extra={"job": args.job, "result": JOBS[args.job](session)})
@@ -47,7 +47,7 @@ def run_json_import(db: Session, file_bytes: bytes) -> dict[str, Any]:
         if token_val and crud.get_subscription_by_token(db, token_val):
             skipped_tokens += 1
             continue
-        service = crud.create_service(
+        crud.create_service(
             db,
             name=svc.get("name") or "Imported",
             user_id=user_id,
@@ -59,15 +59,9 @@ def run_json_import(db: Session, file_bytes: bytes) -> dict[str, Any]:
             ip_limit=svc.get("ip_limit"),
             concurrent_limit=svc.get("concurrent_limit"),
             is_active=svc.get("is_active", True),
+            token=token_val,
         )
         created_services += 1
-        if token_val:
-            try:
-                crud.ensure_subscription_token(db, service)
-                service.subscription_token.token = token_val  # type: ignore
-                db.commit()
-            except Exception:
-                skipped_tokens += 1
     return {"created_users": created_users, "created_services": created_services, "skipped_tokens": skipped_tokens}
 
 
@@ -1,11 +1,31 @@
 from __future__ import annotations
 
 import enum
+import hashlib
 import uuid
 from datetime import datetime
 
-from sqlalchemy import DateTime, Enum, ForeignKey, Integer, String, UniqueConstraint
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    DateTime,
+    DDL,
+    Enum,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+    cast,
+    event,
+    func,
+    inspect,
+    literal_column,
+    text,
+)
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column, relationship
 
 
 class Base(DeclarativeBase):
@@ -21,6 +41,16 @@ class ServiceProtocol(str, enum.Enum):
     XRAY_VLESS = "XRAY_VLESS"
 
 
+class SupportTicketStatus(str, enum.Enum):
+    OPEN = "OPEN"
+    CLOSED = "CLOSED"
+
+
+class WalletTransactionType(str, enum.Enum):
+    CREDIT = "CREDIT"
+    DEBIT = "DEBIT"
+
+
 class Reseller(Base):
     __tablename__ = "resellers"
 
@@ -34,8 +64,21 @@ class Reseller(Base):
     services: Mapped[list["Service"]] = relationship("Service", back_populates="reseller")
 
 
+def _trigram_index(name: str, column: str) -> Index:
+    """GIN trigram index for ``ILIKE '%term%'`` search; Postgres only (needs ``pg_trgm``)."""
+    return Index(name, column, postgresql_using="gin", postgresql_ops={column: "gin_trgm_ops"}).ddl_if(
+        dialect="postgresql"
+    )
+
+
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_reseller_id_id", "reseller_id", "id"),
+        Index("ix_users_full_name", "full_name"),
+        _trigram_index("ix_users_email_trgm", "email"),
+        _trigram_index("ix_users_full_name_trgm", "full_name"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     email: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)
@@ -49,7 +92,20 @@ class User(Base):
 
 class Service(Base):
     __tablename__ = "services"
-    __table_args__ = (UniqueConstraint("user_id", "protocol", name="uq_user_protocol"),)
+    __table_args__ = (
+        UniqueConstraint("user_id", "protocol", name="uq_user_protocol"),
+        Index("ix_services_reseller_id_id", "reseller_id", "id"),
+        Index("ix_services_name", "name"),
+        Index("ix_services_expires_at", "expires_at"),
+        Index(
+            "ix_services_active_expires_at",
+            "expires_at",
+            postgresql_where=text("is_active IS NOT false"),
+            sqlite_where=text("is_active IS NOT 0"),
+        ),
+        _trigram_index("ix_services_name_trgm", "name"),
+        _trigram_index("ix_services_endpoint_trgm", "endpoint"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     name: Mapped[str] = mapped_column(String(100), nullable=False)
@@ -57,6 +113,14 @@ class Service(Base):
     reseller_id: Mapped[int | None] = mapped_column(ForeignKey("resellers.id"), nullable=True)
     protocol: Mapped[ServiceProtocol] = mapped_column(Enum(ServiceProtocol), nullable=False, default=ServiceProtocol.XRAY_VLESS)
     endpoint: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    traffic_limit_bytes: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    traffic_used_bytes: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    expires_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    ip_limit: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    concurrent_limit: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    is_active: Mapped[bool | None] = mapped_column(Boolean, nullable=True, default=True)
+    revision: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
+    revised_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True, default=datetime.utcnow)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
 
     user: Mapped["User"] = relationship("User", back_populates="services")
@@ -64,14 +128,332 @@ class Service(Base):
     subscription_token: Mapped["SubscriptionToken | None"] = relationship(
         "SubscriptionToken", back_populates="service", uselist=False, cascade="all, delete-orphan"
     )
+    service_nodes: Mapped[list["ServiceNode"]] = relationship(
+        "ServiceNode", back_populates="service", cascade="all, delete-orphan", order_by="ServiceNode.id"
+    )
+
+
+# Share of the traffic quota used; NULL for unlimited services. Filters and sorts
+# must use this exact expression to hit ``ix_services_usage_ratio``, and sorts
+# put NULLs last, as the index does.
+SERVICE_USAGE_RATIO = cast(Service.traffic_used_bytes, Float).op("/", return_type=Float)(
+    func.nullif(Service.traffic_limit_bytes, 0)
+)
+# SQLite already sorts NULLs last when descending and rejects NULLS LAST in indexes.
+Index("ix_services_usage_ratio", SERVICE_USAGE_RATIO.desc().nulls_last(), Service.id.desc()).ddl_if(
+    dialect="postgresql"
+)
+Index("ix_services_usage_ratio", SERVICE_USAGE_RATIO.desc(), Service.id.desc()).ddl_if(dialect="sqlite")
+
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+
+class ResellerStats(Base):
+    """Per-reseller aggregates maintained incrementally by ``app.reseller_stats``.
+
+    ``active_services_count`` counts services whose ``is_active`` flag is set;
+    expiry is evaluated at read time elsewhere and is not reflected here.
+    """
+
+    __tablename__ = "reseller_stats"
+
+    reseller_id: Mapped[int] = mapped_column(ForeignKey("resellers.id", ondelete="CASCADE"), primary_key=True)
+    users_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    services_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    active_services_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    traffic_used_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, server_default="0")
+    updated_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True, default=datetime.utcnow)
+
+
+class ResellerPlan(Base):
+    __tablename__ = "reseller_plans"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    price: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    duration_days: Mapped[int] = mapped_column(Integer, nullable=False, default=30)
+    max_users: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    max_services: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    max_traffic_bytes: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    max_concurrent_total: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    is_active: Mapped[bool | None] = mapped_column(Boolean, nullable=True, default=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+
+
+class ResellerSubscription(Base):
+    __tablename__ = "reseller_subscriptions"
+    __table_args__ = (Index("ix_reseller_subscriptions_reseller_ends_at", "reseller_id", "ends_at"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    reseller_id: Mapped[int] = mapped_column(ForeignKey("resellers.id"), nullable=False)
+    plan_id: Mapped[int] = mapped_column(ForeignKey("reseller_plans.id"), nullable=False)
+    starts_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True, default=datetime.utcnow)
+    ends_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    is_active: Mapped[bool | None] = mapped_column(Boolean, nullable=True, default=True)
+
+    plan: Mapped["ResellerPlan"] = relationship("ResellerPlan")
+
+
+class WalletTransaction(Base):
+    """Append-only wallet ledger; ``amount`` is always positive and ``type`` gives the sign."""
+
+    __tablename__ = "wallet_transactions"
+    __table_args__ = (Index("ix_wallet_transactions_reseller_created_at", "reseller_id", "created_at"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    reseller_id: Mapped[int] = mapped_column(ForeignKey("resellers.id"), nullable=False)
+    amount: Mapped[int] = mapped_column(Integer, nullable=False)
+    type: Mapped[WalletTransactionType] = mapped_column(Enum(WalletTransactionType), nullable=False)
+    reason: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+
+
+class ResellerWallet(Base):
+    """Materialized wallet balance, kept equal to the ledger sum by ``app.wallet``."""
+
+    __tablename__ = "reseller_wallets"
+
+    reseller_id: Mapped[int] = mapped_column(ForeignKey("resellers.id", ondelete="CASCADE"), primary_key=True)
+    balance: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, server_default="0")
+    updated_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True, default=datetime.utcnow)
+
+
+class WalletCheckpoint(Base):
+    """Balance of a wallet after every transaction with ``id <= transaction_id``."""
+
+    __tablename__ = "wallet_checkpoints"
+    __table_args__ = (Index("ix_wallet_checkpoints_reseller_created_at", "reseller_id", "created_at"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    reseller_id: Mapped[int] = mapped_column(ForeignKey("resellers.id", ondelete="CASCADE"), nullable=False)
+    transaction_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    balance: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+
+
+class NotificationEvent(Base):
+    """Transactional outbox row, delivered by ``app.notifications.OutboxDispatcher``."""
+
+    __tablename__ = "notification_events"
+    __table_args__ = (
+        Index(
+            "ix_notification_events_pending",
+            "id",
+            postgresql_where=text("processed_at IS NULL"),
+            sqlite_where=text("processed_at IS NULL"),
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    reseller_id: Mapped[int | None] = mapped_column(ForeignKey("resellers.id"), nullable=True)
+    type: Mapped[str] = mapped_column(String(100), nullable=False)
+    payload_json: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    processed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    next_attempt_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+
+class SupportTicket(Base):
+    """Support ticket with a denormalized summary of its thread for the inbox view.
+
+    ``last_message_*``, ``message_count`` and the ``unread_*`` counters are
+    maintained by ``app.tickets`` in the same transaction as each message.
+    """
+
+    __tablename__ = "support_tickets"
+    __table_args__ = (
+        Index("ix_support_tickets_last_message", "last_message_at", "id"),
+        Index("ix_support_tickets_created_by_last_message", "created_by", "last_message_at", "id"),
+        Index(
+            "ix_support_tickets_subject_fts",
+            func.to_tsvector(literal_column("'simple'::regconfig"), text("subject")),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    created_by: Mapped[str] = mapped_column(String(50), nullable=False)
+    subject: Mapped[str] = mapped_column(String(200), nullable=False)
+    status: Mapped[SupportTicketStatus] = mapped_column(
+        Enum(SupportTicketStatus), nullable=True, default=SupportTicketStatus.OPEN
+    )
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    # Starts out as the opening time, so tickets without messages still have a place in the inbox order.
+    last_message_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, default=datetime.utcnow, server_default=func.now()
+    )
+    last_message_preview: Mapped[str | None] = mapped_column(String(200), nullable=True)
+    last_sender_role: Mapped[str | None] = mapped_column(String(20), nullable=True)
+    message_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    unread_by_admin: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    unread_by_reseller: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+
+
+class SupportTicketMessage(Base):
+    __tablename__ = "support_ticket_messages"
+    __table_args__ = (
+        Index("ix_support_ticket_messages_ticket_id_id", "ticket_id", "id"),
+        Index(
+            "ix_support_ticket_messages_message_fts",
+            func.to_tsvector(literal_column("'simple'::regconfig"), text("message")),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    ticket_id: Mapped[int] = mapped_column(ForeignKey("support_tickets.id"), nullable=False)
+    sender_role: Mapped[str] = mapped_column(String(20), nullable=False)
+    message: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+
+
+def client_uuid_for(token: str) -> str:
+    """The VLESS client id Xray is configured with for ``token``."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, token))
+
+
+def stats_key_for(token: str) -> str:
+    """Compact per-client label rendered as the Xray ``email``; Xray keys its traffic counters by it."""
+    return hashlib.blake2b(token.encode(), digest_size=8).hexdigest()
+
+
+def _from_token(derive):
+    # Column default computed from the row's token, so every insert path (ORM or core) fills it.
+    return lambda context: derive(context.get_current_parameters()["token"])
 
 
 class SubscriptionToken(Base):
     __tablename__ = "subscription_tokens"
+    __table_args__ = (
+        UniqueConstraint("client_uuid", name="uq_subscription_tokens_client_uuid"),
+        UniqueConstraint("stats_key", name="uq_subscription_tokens_stats_key"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     token: Mapped[str] = mapped_column(String(64), unique=True, nullable=False, default=lambda: uuid.uuid4().hex)
     service_id: Mapped[int] = mapped_column(ForeignKey("services.id"), unique=True, nullable=False)
+    client_uuid: Mapped[str] = mapped_column(String(36), nullable=False, default=_from_token(client_uuid_for))
+    stats_key: Mapped[str] = mapped_column(String(16), nullable=False, default=_from_token(stats_key_for))
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
 
     service: Mapped["Service"] = relationship("Service", back_populates="subscription_token")
+
+
+class XrayConfigSnapshot(Base):
+    __tablename__ = "xray_config_snapshots"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    config_json: Mapped[str] = mapped_column(Text, nullable=False)
+    applied: Mapped[bool | None] = mapped_column(Boolean, nullable=True, default=False)
+    apply_status: Mapped[str | None] = mapped_column(String(50), nullable=True)
+    apply_error: Mapped[str | None] = mapped_column(String(255), nullable=True)
+
+
+class AuditLog(Base):
+    """Audit trail row; the table is range-partitioned by month on ``created_at``.
+
+    The database primary key is ``(id, created_at)`` because Postgres requires
+    the partition key in unique constraints; ``id`` alone is unique in practice
+    (single sequence) and is what the ORM uses as identity.
+    """
+
+    __tablename__ = "audit_logs"
+    __table_args__ = (
+        Index("ix_audit_logs_created_at", "created_at"),
+        Index("ix_audit_logs_actor_created_at", "actor", "created_at"),
+        Index("ix_audit_logs_action_created_at", "action", "created_at"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    actor: Mapped[str] = mapped_column(String(100), nullable=False)
+    action: Mapped[str] = mapped_column(String(100), nullable=False)
+    detail: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
+
+
+class PanelAccount(Base):
+    """Login credentials for admin and reseller panel users."""
+
+    __tablename__ = "panel_accounts"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    username: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
+    password_hash: Mapped[str] = mapped_column(String(255), nullable=False)
+    role: Mapped[Role] = mapped_column(Enum(Role), nullable=False)
+    is_active: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Node(Base):
+    __tablename__ = "nodes"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    location: Mapped[str] = mapped_column(String(100), nullable=False)
+    ip_address: Mapped[str] = mapped_column(String(100), nullable=False)
+    api_base_url: Mapped[str] = mapped_column(String(255), nullable=False)
+    auth_token_hash: Mapped[str] = mapped_column(String(255), nullable=False)
+    is_active: Mapped[bool | None] = mapped_column(Boolean, nullable=True, default=True)
+    last_seen_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    revised_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True, default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+
+    service_nodes: Mapped[list["ServiceNode"]] = relationship("ServiceNode", back_populates="node")
+
+
+class ServiceNode(Base):
+    __tablename__ = "service_nodes"
+    __table_args__ = (
+        UniqueConstraint("service_id", "node_id", name="uq_service_node"),
+        Index("ix_service_nodes_node_id", "node_id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    service_id: Mapped[int] = mapped_column(ForeignKey("services.id"), nullable=False)
+    node_id: Mapped[int] = mapped_column(ForeignKey("nodes.id"), nullable=False)
+    weight: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+    service: Mapped["Service"] = relationship("Service", back_populates="service_nodes")
+    node: Mapped["Node"] = relationship("Node", back_populates="service_nodes")
+
+
+# Columns that end up in a rendered subscription. Changing one of them (or a
+# service's node assignments) bumps the revision that ``/sub`` derives its
+# ETag and Last-Modified from; usage counters and heartbeats do not.
+_SERVICE_RENDERED_FIELDS = ("name", "endpoint", "protocol")
+_NODE_RENDERED_FIELDS = ("name", "location", "ip_address", "is_active")
+
+
+def _changed(obj: Base, fields: tuple[str, ...]) -> bool:
+    attrs = inspect(obj).attrs
+    return any(attrs[field].history.has_changes() for field in fields)
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_revisions(session: Session, flush_context, instances) -> None:
+    now = datetime.utcnow()
+    dirty, deleted = session.dirty, session.deleted
+    services: set[Service] = set()
+    with session.no_autoflush:
+        for obj in dirty:
+            if isinstance(obj, Service) and _changed(obj, _SERVICE_RENDERED_FIELDS):
+                services.add(obj)
+            elif isinstance(obj, Node) and _changed(obj, _NODE_RENDERED_FIELDS):
+                obj.revised_at = now
+        for obj in list(session.new) + list(dirty) + list(deleted):
+            if isinstance(obj, ServiceNode):
+                service = obj.service or (session.get(Service, obj.service_id) if obj.service_id else None)
+                if service is not None and service not in deleted:
+                    services.add(service)
+    for service in services:
+        if inspect(service).persistent:
+            service.revision = (service.revision or 0) + 1
+        service.revised_at = now
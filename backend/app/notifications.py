@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import urllib.request
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Optional, Protocol
+
+from sqlalchemy import case, select, update
+from sqlalchemy.orm import Session
+
+from .config import Settings
+from .models import NotificationEvent
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(db: Session, event_type: str, payload: dict[str, Any], reseller_id: Optional[int] = None) -> None:
+    """Add an outbox row in the caller's transaction; it is delivered only if that transaction commits."""
+    db.add(NotificationEvent(reseller_id=reseller_id, type=event_type, payload_json=json.dumps(payload, default=str)))
+
+
+def _serialize(event: NotificationEvent) -> dict[str, Any]:
+    return {
+        "id": event.id,
+        "type": event.type,
+        "reseller_id": event.reseller_id,
+        "payload": json.loads(event.payload_json),
+        "created_at": event.created_at.isoformat() if event.created_at else None,
+    }
+
+
+class Sink(Protocol):
+    name: str
+
+    def deliver(self, events: list[dict[str, Any]]) -> None:
+        """Deliver the whole batch or raise; a raise retries every event in it."""
+
+
+class FileSink:
+    """Append events as JSON lines to a local file (also handy in tests)."""
+
+    def __init__(self, path: str) -> None:
+        self.name = f"file:{path}"
+        self.path = Path(path)
+
+    def deliver(self, events: list[dict[str, Any]]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as fh:
+            fh.writelines(json.dumps(event) + "\n" for event in events)
+
+
+class WebhookSink:
+    """POST each batch as ``{"events": [...]}``; any non-2xx response fails the batch."""
+
+    def __init__(self, url: str, timeout: float = 10.0) -> None:
+        self.name = f"webhook:{url}"
+        self.url = url
+        self.timeout = timeout
+
+    def deliver(self, events: list[dict[str, Any]]) -> None:
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({"events": events}).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if not 200 <= response.status < 300:
+                raise RuntimeError(f"Webhook returned {response.status}")
+
+
+def sinks_from_settings(settings: Settings) -> list[Sink]:
+    """Parse ``NOTIFICATION_SINKS``, e.g. ``file:/var/log/notify.jsonl,webhook:https://hooks.example/x``."""
+    sinks: list[Sink] = []
+    for spec in filter(None, (part.strip() for part in settings.notification_sinks.split(","))):
+        kind, _, target = spec.partition(":")
+        if kind == "file" and target:
+            sinks.append(FileSink(target))
+        elif kind == "webhook" and target:
+            sinks.append(WebhookSink(target))
+        else:
+            raise ValueError(f"Unknown notification sink: {spec}")
+    return sinks
+
+
+class OutboxDispatcher:
+    """Deliver ``notification_events`` rows to sinks with at-least-once semantics.
+
+    Each round claims up to ``batch_size`` due rows with ``FOR UPDATE SKIP
+    LOCKED`` and keeps them locked while delivering, so any number of
+    dispatchers (threads, workers or hosts) can poll the same table without
+    handing out a row twice. A delivered batch is closed with one UPDATE of
+    ``processed_at``. When a batch fails its events are retried one at a time,
+    so a single poison event cannot hold back the rest; each failed row gets
+    ``attempts``/``next_attempt_at`` with exponential backoff from its own
+    attempt count. After ``max_attempts`` failures a row is closed with
+    ``processed_at`` set and ``last_error`` kept as a dead letter.
+    """
+
+    def __init__(
+        self,
+        sinks: list[Sink],
+        *,
+        batch_size: int = 100,
+        max_attempts: int = 8,
+        base_backoff: float = 2.0,
+        max_backoff: float = 3600.0,
+    ) -> None:
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def _claim(self, db: Session, now: datetime) -> list[NotificationEvent]:
+        stmt = (
+            select(NotificationEvent)
+            .where(
+                NotificationEvent.processed_at.is_(None),
+                (NotificationEvent.next_attempt_at.is_(None)) | (NotificationEvent.next_attempt_at <= now),
+            )
+            .order_by(NotificationEvent.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        return db.scalars(stmt).all()
+
+    def dispatch_once(self, db: Session) -> int:
+        """Claim and deliver one batch; returns how many events were claimed."""
+        now = datetime.utcnow()
+        batch = self._claim(db, now)
+        if not batch:
+            db.commit()
+            return 0
+        payload = [_serialize(event) for event in batch]
+        error = self._deliver(payload)
+        if error is None:
+            self._succeed(db, [event.id for event in batch], now)
+        elif len(batch) == 1:
+            self._fail(db, batch, error, now)
+        else:
+            logger.warning("Notification batch delivery failed", extra={"events": len(batch), "error": error})
+            delivered = []
+            for event, item in zip(batch, payload):
+                error = self._deliver([item])
+                if error is None:
+                    delivered.append(event.id)
+                else:
+                    self._fail(db, [event], error, now)
+            self._succeed(db, delivered, now)
+        db.commit()
+        return len(batch)
+
+    def _deliver(self, payload: list[dict[str, Any]]) -> Optional[str]:
+        try:
+            for sink in self.sinks:
+                sink.deliver(payload)
+        except Exception as exc:
+            return f"{type(exc).__name__}: {exc}"[:1000]
+        return None
+
+    def _succeed(self, db: Session, ids: list[int], now: datetime) -> None:
+        if ids:
+            db.execute(
+                update(NotificationEvent)
+                .where(NotificationEvent.id.in_(ids))
+                .values(processed_at=now, last_error=None)
+                .execution_options(synchronize_session=False)
+            )
+
+    def _fail(self, db: Session, events: list[NotificationEvent], error: str, now: datetime) -> None:
+        # Backoff and dead-lettering follow each row's own attempt count.
+        backoff = {
+            attempts: now + timedelta(seconds=min(self.base_backoff * 2**attempts, self.max_backoff))
+            for attempts in range(self.max_attempts)
+        }
+        db.execute(
+            update(NotificationEvent)
+            .where(NotificationEvent.id.in_([event.id for event in events]))
+            .values(
+                attempts=NotificationEvent.attempts + 1,
+                last_error=error,
+                next_attempt_at=case(
+                    backoff, value=NotificationEvent.attempts, else_=now + timedelta(seconds=self.max_backoff)
+                ),
+                processed_at=case((NotificationEvent.attempts + 1 >= self.max_attempts, now), else_=None),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        dead = [event.id for event in events if (event.attempts or 0) + 1 >= self.max_attempts]
+        if dead:
+            logger.error("Notification events dead-lettered", extra={"ids": dead, "error": error})
+        else:
+            logger.warning("Notification delivery failed", extra={"ids": [event.id for event in events], "error": error})
+
+    def start(self, session_factory: Callable[[], Session], poll_seconds: float) -> None:
+        if not self.sinks or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(session_factory, poll_seconds), name="outbox-dispatcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self, session_factory: Callable[[], Session], poll_seconds: float) -> None:
+        while not self._stop.is_set():
+            claimed = 0
+            try:
+                with session_factory() as db:
+                    claimed = self.dispatch_once(db)
+            except Exception:
+                logger.exception("Outbox dispatch round failed")
+            # A full batch means there is probably more waiting; poll again right away.
+            if claimed < self.batch_size:
+                self._stop.wait(poll_seconds)
+
+
+def dispatcher_from_settings(settings: Settings) -> OutboxDispatcher:
+    return OutboxDispatcher(
+        sinks_from_settings(settings),
+        batch_size=settings.notification_batch_size,
+        max_attempts=settings.notification_max_attempts,
+    )
+
+
+if __name__ == "__main__":
+    # Standalone dispatcher: ``python -m app.notifications``; run as many as needed.
+    from .config import get_settings
+    from .db import SessionLocal
+    from .logging_config import configure_logging
+
+    configure_logging()
+    _settings = get_settings()
+    _dispatcher = dispatcher_from_settings(_settings)
+    if not _dispatcher.sinks:
+        raise SystemExit("NOTIFICATION_SINKS is empty")
+    _dispatcher._run(SessionLocal, _settings.notification_poll_seconds)
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Statements kept per request for diagnostics; counts and timings are always exact.
+MAX_RECORDED = 200
+# The same SQL issued this many times in one request is reported as a likely N+1.
+REPEAT_THRESHOLD = 5
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    total_ms: float = 0.0
+    statements: list[tuple[str, float]] = field(default_factory=list)
+
+    def record(self, statement: str, elapsed_ms: float) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if len(self.statements) < MAX_RECORDED:
+            self.statements.append((statement, elapsed_ms))
+
+    def repeated(self, threshold: int = REPEAT_THRESHOLD) -> dict[str, int]:
+        """Statements issued at least ``threshold`` times, the usual signature of a lazy load in a loop."""
+        counts = Counter(statement for statement, _ in self.statements)
+        return {statement: n for statement, n in counts.items() if n >= threshold}
+
+    def describe(self) -> str:
+        lines = [f"{self.count} queries in {self.total_ms:.1f} ms"]
+        lines += [f"  {elapsed:7.2f} ms  {' '.join(statement.split())}" for statement, elapsed in self.statements]
+        return "\n".join(lines)
+
+
+# Stats for the request being handled. Starlette copies the context into the
+# threadpool that runs sync endpoints and dependencies, so they record here too.
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+# Process-wide trackers from ``query_budget``; they see statements from every thread.
+_trackers: list[QueryStats] = []
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if _current.get() is not None or _trackers:
+        conn.info.setdefault("query_stats_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info.get("query_stats_started")
+    if not started:
+        return
+    elapsed_ms = (time.perf_counter() - started.pop()) * 1000
+    current = _current.get()
+    if current is not None:
+        current.record(statement, elapsed_ms)
+    for tracker in list(_trackers):
+        tracker.record(statement, elapsed_ms)
+
+
+@contextmanager
+def track() -> Iterator[QueryStats]:
+    """Collect the statements issued in the current context (request, task or thread)."""
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def query_budget(max_queries: int) -> Iterator[QueryStats]:
+    """Fail with the offending statements if the block issues more than ``max_queries``.
+
+    Counts statements from every thread, so it also sees requests that a test
+    client hands to the app on another thread.
+    """
+    stats = QueryStats()
+    _trackers.append(stats)
+    try:
+        yield stats
+    finally:
+        _trackers.remove(stats)
+    if stats.count > max_queries:
+        raise AssertionError(f"Query budget of {max_queries} exceeded: {stats.describe()}")
+
+
+class QueryStatsMiddleware:
+    """Count SQL statements and time per HTTP request.
+
+    With ``expose_header`` (debug mode) responses carry ``X-Query-Count`` and
+    ``X-Query-Time-Ms``. Requests over ``warn_threshold`` statements, or that
+    repeat one statement ``REPEAT_THRESHOLD`` times, are logged as warnings.
+    """
+
+    def __init__(self, app, *, expose_header: bool = False, warn_threshold: int = 50) -> None:
+        self.app = app
+        self.expose_header = expose_header
+        self.warn_threshold = warn_threshold
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_stats(message) -> None:
+            if message["type"] == "http.response.start" and self.expose_header:
+                headers = list(message.get("headers", []))
+                headers.append((b"x-query-count", str(stats.count).encode()))
+                headers.append((b"x-query-time-ms", f"{stats.total_ms:.2f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        with track() as stats:
+            await self.app(scope, receive, send_with_stats)
+        repeated = stats.repeated()
+        if stats.count > self.warn_threshold or repeated:
+            logger.warning(
+                "Request issued many SQL statements",
+                extra={
+                    "path": scope.get("path"),
+                    "queries": stats.count,
+                    "query_ms": round(stats.total_ms, 2),
+                    "repeated": [f"{n}x {' '.join(statement.split())[:200]}" for statement, n in repeated.items()],
+                },
+            )
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from .db import upsert_insert
+from .jobs import PeriodicJob
+from .models import Reseller, ResellerStats, Service, User
+
+logger = logging.getLogger(__name__)
+
+_COUNTERS = ("users_count", "services_count", "active_services_count", "traffic_used_bytes")
+
+
+def apply_delta(
+    db: Session,
+    reseller_id: Optional[int],
+    *,
+    users: int = 0,
+    services: int = 0,
+    active_services: int = 0,
+    traffic_bytes: int = 0,
+) -> None:
+    """Add deltas to a reseller's aggregate row inside the caller's transaction.
+
+    A single ``INSERT ... ON CONFLICT DO UPDATE SET col = col + delta`` keeps
+    concurrent writers from losing each other's increments without a prior
+    read. Nothing is written for unowned (admin) rows or zero deltas.
+    """
+    if reseller_id is None or not (users or services or active_services or traffic_bytes):
+        return
+    values = dict(
+        users_count=users,
+        services_count=services,
+        active_services_count=active_services,
+        traffic_used_bytes=traffic_bytes,
+    )
+    stmt = upsert_insert(db, ResellerStats).values(reseller_id=reseller_id, updated_at=datetime.utcnow(), **values)
+    table = ResellerStats.__table__
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.reseller_id],
+        set_={
+            **{name: table.c[name] + stmt.excluded[name] for name in _COUNTERS},
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    db.execute(stmt)
+
+
+def service_delta(service: Service, sign: int = 1) -> dict[str, int]:
+    """Counter deltas for adding (``sign=1``) or removing (``sign=-1``) ``service``."""
+    return {
+        "services": sign,
+        "active_services": sign if service.is_active is not False else 0,
+        "traffic_bytes": sign * (service.traffic_used_bytes or 0),
+    }
+
+
+def get_stats(db: Session, reseller_id: int) -> ResellerStats:
+    stats = db.get(ResellerStats, reseller_id, populate_existing=True)
+    return stats or ResellerStats(reseller_id=reseller_id, **{name: 0 for name in _COUNTERS})
+
+
+def list_stats(db: Session) -> list[ResellerStats]:
+    return db.scalars(select(ResellerStats).order_by(ResellerStats.reseller_id)).all()
+
+
+def reconcile_reseller(db: Session, reseller_id: int) -> bool:
+    """Recompute one reseller's row from ``users``/``services``; returns True if it had drifted.
+
+    The aggregate row is locked first, so in-flight mutations either committed
+    before the recount (and are included) or apply their delta after it.
+    """
+    db.execute(
+        upsert_insert(db, ResellerStats).values(reseller_id=reseller_id).on_conflict_do_nothing(index_elements=["reseller_id"])
+    )
+    stats = db.scalar(
+        select(ResellerStats)
+        .where(ResellerStats.reseller_id == reseller_id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    users = db.scalar(select(func.count(User.id)).where(User.reseller_id == reseller_id)) or 0
+    services, active, traffic = db.execute(
+        select(
+            func.count(Service.id),
+            func.coalesce(func.sum(case((Service.is_active.is_(False), 0), else_=1)), 0),
+            func.coalesce(func.sum(Service.traffic_used_bytes), 0),
+        ).where(Service.reseller_id == reseller_id)
+    ).one()
+    actual = {
+        "users_count": users,
+        "services_count": services,
+        "active_services_count": active,
+        "traffic_used_bytes": traffic,
+    }
+    drifted = any(getattr(stats, name) != value for name, value in actual.items())
+    if drifted:
+        logger.warning(
+            "Corrected reseller stats drift",
+            extra={"reseller_id": reseller_id, **{f"expected_{k}": v for k, v in actual.items()}},
+        )
+        for name, value in actual.items():
+            setattr(stats, name, value)
+        stats.updated_at = datetime.utcnow()
+    db.commit()
+    return drifted
+
+
+def reconcile_all(db: Session) -> int:
+    """Reconcile every reseller, one short transaction each; returns the number corrected."""
+    corrected = 0
+    for reseller_id in db.scalars(select(Reseller.id).order_by(Reseller.id)).all():
+        corrected += reconcile_reseller(db, reseller_id)
+    return corrected
+
+
+stats_reconciler = PeriodicJob("reseller-stats-reconcile", reconcile_all)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from datetime import datetime
 from enum import Enum
 from typing import Optional
 
@@ -30,3 +31,284 @@ class TokenResponse(BaseModel):
 
 class Message(BaseModel):
     detail: str
+
+
+class UserCreate(BaseModel):
+    email: str = Field(..., min_length=3, max_length=255)
+    full_name: str = Field(..., min_length=1, max_length=255)
+    reseller_id: Optional[int] = None
+
+
+class UserUpdate(BaseModel):
+    email: str = Field(..., min_length=3, max_length=255)
+    full_name: str = Field(..., min_length=1, max_length=255)
+
+
+class UserOut(BaseModel):
+    id: int
+    email: str
+    full_name: str
+    reseller_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class PaginatedUsers(BaseModel):
+    items: list[UserOut]
+    limit: int
+    offset: int
+
+
+class ServiceCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    user_id: int
+    reseller_id: Optional[int] = None
+    protocol: str
+    endpoint: Optional[str] = Field(None, max_length=255)
+
+
+class ServiceUpdate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    protocol: str
+    endpoint: Optional[str] = Field(None, max_length=255)
+
+
+class ServiceOut(BaseModel):
+    id: int
+    name: str
+    user_id: int
+    reseller_id: Optional[int] = None
+    protocol: str
+    endpoint: Optional[str] = None
+    traffic_limit_bytes: Optional[int] = None
+    traffic_used_bytes: int = 0
+    expires_at: Optional[datetime] = None
+    ip_limit: Optional[int] = None
+    concurrent_limit: Optional[int] = None
+    is_active: Optional[bool] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class PaginatedServices(BaseModel):
+    items: list[ServiceOut]
+    limit: int
+    offset: int
+
+
+class SubscriptionTokenOut(BaseModel):
+    token: str
+    service_id: int
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class ServiceFilter(BaseModel):
+    """The ``/api/services`` list filters, for selecting services in bulk operations."""
+
+    q: Optional[str] = Field(None, min_length=1, max_length=255)
+    reseller_id: Optional[int] = None
+    is_active: Optional[bool] = None
+    expires_after: Optional[datetime] = None
+    expires_before: Optional[datetime] = None
+    min_usage: Optional[float] = Field(None, ge=0)
+    max_usage: Optional[float] = Field(None, ge=0)
+
+
+class BulkServiceTarget(BaseModel):
+    """Services to act on: an explicit ID list, a filter, or both (their intersection).
+
+    An empty ``filter`` object selects every service in the caller's scope.
+    """
+
+    service_ids: Optional[list[int]] = Field(None, min_length=1, max_length=10000)
+    filter: Optional[ServiceFilter] = None
+
+
+class BulkExtendExpiry(BulkServiceTarget):
+    days: int = Field(..., ge=1, le=3650)
+
+
+class BulkSetActive(BulkServiceTarget):
+    is_active: bool
+
+
+class BulkAssignNode(BulkServiceTarget):
+    node_id: int
+
+
+class XrayRenderResponse(BaseModel):
+    generated_at: str
+    config: dict
+
+
+class XrayApplyResponse(BaseModel):
+    snapshot_id: int
+    applied_at: str
+    status: str
+    healthy: bool
+    error: Optional[str] = None
+
+
+class XrayStatus(BaseModel):
+    healthy: bool
+    last_apply_status: Optional[str] = None
+    last_apply_error: Optional[str] = None
+    last_applied_at: Optional[str] = None
+
+
+class BulkResult(BaseModel):
+    matched: int
+    updated: int
+    config_apply: Optional[XrayApplyResponse] = None
+
+
+class BackupUploadCreate(BaseModel):
+    total_size: int = Field(..., gt=0)
+    sha256: str = Field(..., min_length=64, max_length=64)
+
+
+class BackupUploadStatus(BaseModel):
+    id: str
+    offset: int
+    total_size: int
+    complete: bool
+
+
+class AuditLogOut(BaseModel):
+    id: int
+    actor: str
+    action: str
+    detail: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class PaginatedAuditLogs(BaseModel):
+    items: list[AuditLogOut]
+    next_cursor: Optional[str] = None
+
+
+class ResellerStatsOut(BaseModel):
+    reseller_id: int
+    users_count: int
+    services_count: int
+    active_services_count: int
+    traffic_used_bytes: int
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class PlanCreate(BaseModel):
+    name: str
+    price: int = Field(0, ge=0)
+    duration_days: int = Field(30, ge=1)
+    max_users: Optional[int] = None
+    max_services: Optional[int] = None
+    max_traffic_bytes: Optional[int] = None
+    max_concurrent_total: Optional[int] = None
+
+
+class PlanOut(PlanCreate):
+    id: int
+    is_active: Optional[bool] = None
+
+    class Config:
+        from_attributes = True
+
+
+class WalletOut(BaseModel):
+    reseller_id: int
+    balance: int
+
+
+class WalletCredit(BaseModel):
+    reseller_id: int
+    amount: int = Field(..., gt=0)
+    reason: Optional[str] = None
+
+
+class WalletTransactionOut(BaseModel):
+    id: int
+    amount: int
+    type: str
+    reason: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class WalletStatement(BaseModel):
+    reseller_id: int
+    opening_balance: int
+    closing_balance: int
+    transactions: list[WalletTransactionOut]
+
+
+class PlanPurchaseOut(BaseModel):
+    subscription_id: int
+    plan_id: int
+    starts_at: datetime
+    ends_at: datetime
+    balance: int
+
+
+class TicketCreate(BaseModel):
+    subject: str = Field(..., min_length=1, max_length=200)
+    message: str = Field(..., min_length=1)
+
+
+class TicketReply(BaseModel):
+    message: str = Field(..., min_length=1)
+
+
+class TicketStatusUpdate(BaseModel):
+    status: str = Field(..., pattern="^(OPEN|CLOSED)$")
+
+
+class TicketOut(BaseModel):
+    id: int
+    created_by: str
+    subject: str
+    status: Optional[str] = None
+    created_at: Optional[datetime] = None
+    last_message_at: Optional[datetime] = None
+    last_message_preview: Optional[str] = None
+    last_sender_role: Optional[str] = None
+    message_count: int = 0
+    unread_by_admin: int = 0
+    unread_by_reseller: int = 0
+
+    class Config:
+        from_attributes = True
+
+
+class PaginatedTickets(BaseModel):
+    items: list[TicketOut]
+    next_cursor: Optional[str] = None
+
+
+class TicketSearchHit(TicketOut):
+    rank: float
+
+
+class TicketMessageOut(BaseModel):
+    id: int
+    ticket_id: int
+    sender_role: str
+    message: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
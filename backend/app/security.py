@@ -1,15 +1,76 @@
 from __future__ import annotations
 
+import asyncio
 import datetime as dt
-from typing import Any, Dict, Optional
-
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+import redis
+from fastapi import HTTPException, status
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
 from .config import get_settings
 
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_revocation_redis = None
+# While Redis is down every authenticated request hits it; warn once a minute.
+_REDIS_WARNING_INTERVAL = 60.0
+_redis_warned_at: dict[str, float] = {}
+
+
+@lru_cache(maxsize=1)
+def get_pwd_context() -> CryptContext:
+    # Pinning min/max rounds to the configured cost makes verify_and_update()
+    # report any hash created under a different cost as needing a rehash.
+    rounds = get_settings().bcrypt_rounds
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+class PasswordHashPool:
+    """Bounded executor for bcrypt work.
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    Hashing runs on a small dedicated thread pool instead of the shared request
+    threadpool, so a login storm can occupy at most ``workers`` CPUs. Once
+    ``max_pending`` hash jobs are queued or running, further logins are refused
+    with 503 instead of piling up.
+    """
+
+    def __init__(self, workers: int, max_pending: int) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pwhash")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        if not self._slots.acquire(blocking=False):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent logins",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            return await asyncio.wrap_future(self._executor.submit(fn, *args))
+        finally:
+            self._slots.release()
+
+
+@lru_cache(maxsize=1)
+def get_hash_pool() -> PasswordHashPool:
+    settings = get_settings()
+    return PasswordHashPool(settings.password_hash_workers, settings.password_hash_max_pending)
 
 
 def get_secret_key() -> str:
@@ -36,11 +97,16 @@ def create_access_token(subject: str, role: str) -> str:
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """Verify a password and return a replacement hash if the stored one uses outdated parameters."""
+    return get_pwd_context().verify_and_update(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 
 def decode_token(token: str) -> Optional[dict[str, Any]]:
@@ -49,3 +115,45 @@ def decode_token(token: str) -> Optional[dict[str, Any]]:
         return payload
     except JWTError:
         return None
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _get_redis():
+    global _revocation_redis
+    if _revocation_redis is None:
+        _revocation_redis = redis.from_url(get_settings().redis_url)
+    return _revocation_redis
+
+
+def _warn_redis_unavailable(message: str, exc: redis.RedisError) -> None:
+    now = time.monotonic()
+    if now - _redis_warned_at.get(message, float("-inf")) >= _REDIS_WARNING_INTERVAL:
+        _redis_warned_at[message] = now
+        logger.warning(message, extra={"error": repr(exc)})
+
+
+def revoke_token(digest: str, expires_at: float) -> None:
+    """Add a token digest to the Redis revocation list until the token would expire anyway.
+
+    Without Redis the revocation is only logged; the caller's own caches still
+    drop the token, but other workers accept it until it expires.
+    """
+    ttl = int(expires_at - time.time()) + 1
+    if ttl <= 0:
+        return
+    try:
+        _get_redis().set(f"jwt:revoked:{digest}", 1, ex=ttl)
+    except redis.RedisError as exc:
+        _warn_redis_unavailable("Token revocation not persisted", exc)
+
+
+def is_token_revoked(digest: str) -> bool:
+    try:
+        return bool(_get_redis().exists(f"jwt:revoked:{digest}"))
+    except redis.RedisError as exc:
+        # Fail open: an unreachable Redis should not log every admin out.
+        _warn_redis_unavailable("Revocation check unavailable", exc)
+        return False
@@ -1,54 +1,189 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from functools import partial
 from io import BytesIO
-from urllib.parse import quote, urlencode
+from typing import Optional
+from urllib.parse import quote
 
-import qrcode
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
 from . import crud
+from .coalescing import SingleFlight
 from .config import get_settings, Settings
+from .connection_limits import enforce_connection_limits
 from .db import get_db
-from .models import ServiceProtocol, SubscriptionToken
+from .models import ServiceProtocol
+from .subscription_formats import (
+    GZIP_MIN_BYTES,
+    MEDIA_TYPES,
+    negotiate_format,
+    render_cache_stats,
+    render_subscription,
+    subscription_last_modified,
+    subscription_version,
+)
+from .token_filter import token_filter
 
 
 router = APIRouter(tags=["subscription"])
 
+# Clients must revalidate on every poll; tokens are per-user so shared caches must not store bodies.
+_CACHE_CONTROL = "private, no-cache"
+# The body depends on the negotiated encoding and, without ?format=, on the User-Agent.
+_VARY = "Accept-Encoding, User-Agent"
+
+
+@dataclass(frozen=True)
+class _ServiceLimits:
+    id: int
+    ip_limit: Optional[int]
+    concurrent_limit: Optional[int]
+
+
+@dataclass(frozen=True)
+class _Validators:
+    """The request's conditional headers; a match means the client's copy is current."""
+
+    if_none_match: Optional[str]
+    if_modified_since: Optional[str]
+
+    def not_modified(self, etag: str, last_modified: datetime) -> bool:
+        if self.if_none_match is not None:
+            return _etag_matches(self.if_none_match, etag)
+        return bool(self.if_modified_since) and _not_modified_since(self.if_modified_since, last_modified)
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    """Everything a ``/sub`` response needs from the database, detached from the loading session.
+
+    ``body`` is None when the request's validators matched, which is decided
+    before anything is rendered.
+    """
+
+    limits: Optional[_ServiceLimits]
+    etag: str
+    last_modified: datetime
+    body: Optional[bytes]
+    content_encoding: Optional[str]
+
+
+# Concurrent fetches of the same (token, format, gzip, validators) in this worker share one lookup and render.
+subscription_flights: SingleFlight[tuple[str, str, bool, _Validators], _Snapshot] = SingleFlight()
+
 
 def _subscription_base_url(settings: Settings, token: str) -> str:
     encoded_token = quote(token, safe="")
     return f"{settings.subscription_scheme}://{settings.subscription_domain}:{settings.subscription_port}/sub/{encoded_token}"
 
 
-def _build_vless_payload(sub_token: SubscriptionToken, settings: Settings) -> str:
-    service = sub_token.service
-    if not service:
-        raise HTTPException(status_code=404, detail="Service not found for token")
-    endpoint = service.endpoint or f"{settings.subscription_domain}:{settings.subscription_port}"
-    if ":" not in endpoint:
-        endpoint = f"{endpoint}:{settings.subscription_port}"
-    friendly_name = quote(service.name or f"service-{service.id}")
-    query = urlencode({"encryption": "none", "type": "tcp", "security": "tls", "sni": settings.subscription_domain})
-    return f"vless://{sub_token.token}@{endpoint}?{query}#{friendly_name}"
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison (RFC 9110 8.8.3.2): the W/ prefix is ignored on both sides.
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
 
 
-@router.get("/sub/{token}", response_class=PlainTextResponse)
-def get_subscription_payload(token: str, db: Session = Depends(get_db), settings: Settings = Depends(get_settings)) -> str:
+def _not_modified_since(if_modified_since: str, last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return last_modified.replace(microsecond=0) <= since
+
+
+def _accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    for part in (accept_encoding or "").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip() in ("gzip", "*"):
+            q = params.strip().removeprefix("q=")
+            return not params or q.replace(".", "", 1).isdigit() and float(q) > 0
+    return False
+
+
+def _load_snapshot(
+    db: Session, token: str, fmt: str, gzip_ok: bool, validators: _Validators, settings: Settings
+) -> _Snapshot:
     sub_token = crud.get_subscription_by_token(db, token)
     if not sub_token:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Subscription token not found")
     if not sub_token.service or sub_token.service.protocol != ServiceProtocol.XRAY_VLESS:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported service protocol")
-    return _build_vless_payload(sub_token, settings)
+    service = sub_token.service
+    limits = None
+    if service.ip_limit or service.concurrent_limit:
+        limits = _ServiceLimits(service.id, service.ip_limit, service.concurrent_limit)
+    # The version comes from revisions alone, so a revalidation costs the lookup but never a render.
+    etag = f'W/"{subscription_version(sub_token, fmt, settings)}"'
+    last_modified = subscription_last_modified(sub_token)
+    if validators.not_modified(etag, last_modified):
+        return _Snapshot(limits=limits, etag=etag, last_modified=last_modified, body=None, content_encoding=None)
+    body = render_subscription(sub_token, fmt, settings)
+    content_encoding = None
+    if len(body) >= GZIP_MIN_BYTES and gzip_ok:
+        body = render_subscription(sub_token, fmt, settings, encoding="gzip")
+        content_encoding = "gzip"
+    return _Snapshot(
+        limits=limits, etag=etag, last_modified=last_modified, body=body, content_encoding=content_encoding
+    )
+
+
+@router.get("/sub/{token}", response_class=PlainTextResponse)
+def get_subscription_payload(
+    token: str,
+    request: Request,
+    format: Optional[str] = Query(None, description="links, base64, clash or sing-box; defaults by User-Agent"),
+    db: Session = Depends(get_db),
+    settings: Settings = Depends(get_settings),
+) -> Response:
+    if not token_filter.might_exist(token):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Subscription token not found")
+    fmt = negotiate_format(format, request.headers.get("user-agent"))
+    gzip_ok = _accepts_gzip(request.headers.get("accept-encoding"))
+    validators = _Validators(request.headers.get("if-none-match"), request.headers.get("if-modified-since"))
+    # Followers never touch their own session, so they hold no DB connection while waiting.
+    load = partial(_load_snapshot, db, token, fmt, gzip_ok, validators, settings)
+    key = (token, fmt, gzip_ok, validators)
+    snapshot = subscription_flights.do(key, load) if settings.subscription_coalescing_enabled else load()
+    if snapshot.limits:
+        client_ip = request.client.host if request.client else "unknown"
+        enforce_connection_limits(snapshot.limits, client_ip, request.headers.get("user-agent"))
+
+    headers = {
+        "ETag": snapshot.etag,
+        "Last-Modified": format_datetime(snapshot.last_modified.astimezone(timezone.utc), usegmt=True),
+        "Cache-Control": _CACHE_CONTROL,
+        "Vary": _VARY,
+    }
+    if snapshot.body is None:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if snapshot.content_encoding:
+        headers["Content-Encoding"] = snapshot.content_encoding
+    return Response(content=snapshot.body, media_type=MEDIA_TYPES[fmt], headers=headers)
+
+
+def subscription_cache_stats() -> dict:
+    return {"coalescing": subscription_flights.stats(), "render_cache": render_cache_stats()}
 
 
 @router.get("/sub/{token}/qr")
 def get_subscription_qr(token: str, db: Session = Depends(get_db), settings: Settings = Depends(get_settings)):
+    if not token_filter.might_exist(token):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Subscription token not found")
     sub_token = crud.get_subscription_by_token(db, token)
     if not sub_token:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Subscription token not found")
+    # qrcode pulls in PIL; only QR requests should pay for importing it.
+    import qrcode
+
     link = _subscription_base_url(settings, token)
     img = qrcode.make(link)
     buffer = BytesIO()
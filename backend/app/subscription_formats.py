@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import base64
+import gzip
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import cached_property, lru_cache
+from string import Template
+from typing import Optional
+from urllib.parse import quote, urlencode
+
+from fastapi import HTTPException, status
+
+from .cache import TTLCache
+from .coalescing import FillLock
+from .config import Settings, get_settings
+from .events import EventKind, invalidation_bus
+from .models import SubscriptionToken
+
+LINKS = "links"
+BASE64 = "base64"
+CLASH = "clash"
+SING_BOX = "sing-box"
+FORMATS = (LINKS, BASE64, CLASH, SING_BOX)
+
+MEDIA_TYPES = {
+    LINKS: "text/plain; charset=utf-8",
+    BASE64: "text/plain; charset=utf-8",
+    CLASH: "text/yaml; charset=utf-8",
+    SING_BOX: "application/json",
+}
+
+# Lower-cased User-Agent substrings, checked in order.
+_USER_AGENT_FORMATS = (
+    ("sing-box", SING_BOX),
+    ("sfa/", SING_BOX),
+    ("sfi/", SING_BOX),
+    ("sfm/", SING_BOX),
+    ("clash", CLASH),
+    ("mihomo", CLASH),
+    ("stash", CLASH),
+    ("v2rayn", BASE64),
+    ("v2rayng", BASE64),
+    ("shadowrocket", BASE64),
+    ("streisand", BASE64),
+)
+
+# Templates are parsed once at import. Values substituted into the Clash and
+# sing-box templates are JSON-encoded, which is also valid YAML flow syntax.
+_VLESS_LINK = Template("vless://$id@$host:$port?$query#$label")
+_CLASH_PROXY = Template(
+    "  - {name: $name, type: vless, server: $host, port: $port, uuid: $id, network: tcp, tls: true, udp: true, "
+    "servername: $sni}"
+)
+_CLASH_DOCUMENT = Template(
+    "proxies:\n$proxies\nproxy-groups:\n  - {name: $group, type: select, proxies: [$names]}\nrules:\n  - MATCH,$group_raw\n"
+)
+_SING_BOX_OUTBOUND = Template(
+    '{"type":"vless","tag":$name,"server":$host,"server_port":$port,"uuid":$id,'
+    '"tls":{"enabled":true,"server_name":$sni}}'
+)
+_SING_BOX_DOCUMENT = Template(
+    '{"outbounds":[{"type":"selector","tag":"proxy","outbounds":[$names]},$outbounds,{"type":"direct","tag":"direct"}]}'
+)
+
+
+@dataclass(frozen=True)
+class LinkFragment:
+    """One node entry of a subscription; escaped forms are computed once and shared by all formats.
+
+    ``client_uuid`` is the persisted VLESS id Xray is configured with for the token.
+    """
+
+    client_uuid: str
+    label: str
+    host: str
+    port: int
+    sni: str
+
+    @cached_property
+    def vless_link(self) -> str:
+        query = urlencode({"encryption": "none", "type": "tcp", "security": "tls", "sni": self.sni})
+        return _VLESS_LINK.substitute(id=self.client_uuid, host=self.host, port=self.port, query=query, label=quote(self.label))
+
+    @cached_property
+    def json_values(self) -> dict[str, str]:
+        return {
+            "name": json.dumps(self.label),
+            "host": json.dumps(self.host),
+            "port": str(self.port),
+            "id": json.dumps(self.client_uuid),
+            "sni": json.dumps(self.sni),
+        }
+
+
+def negotiate_format(requested: Optional[str], user_agent: Optional[str]) -> str:
+    if requested:
+        if requested not in FORMATS:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported subscription format")
+        return requested
+    agent = (user_agent or "").lower()
+    for needle, fmt in _USER_AGENT_FORMATS:
+        if needle in agent:
+            return fmt
+    return LINKS
+
+
+def _split_endpoint(endpoint: str, default_port: int) -> tuple[str, int]:
+    host, sep, port = endpoint.rpartition(":")
+    if not sep or not port.isdigit():
+        return endpoint, default_port
+    return host, int(port)
+
+
+def build_fragments(sub_token: SubscriptionToken, settings: Settings) -> list[LinkFragment]:
+    service = sub_token.service
+    if not service:
+        raise HTTPException(status_code=404, detail="Service not found for token")
+    base_label = service.name or f"service-{service.id}"
+    nodes = _active_nodes(sub_token)
+    if not nodes:
+        endpoint = service.endpoint or f"{settings.subscription_domain}:{settings.subscription_port}"
+        host, port = _split_endpoint(endpoint, settings.subscription_port)
+        return [LinkFragment(sub_token.client_uuid, base_label, host, port, settings.subscription_domain)]
+    port = settings.xray_inbound_port or settings.subscription_port
+    return [
+        LinkFragment(
+            sub_token.client_uuid, f"{base_label} - {node.location or node.name}", node.ip_address, port,
+            settings.subscription_domain,
+        )
+        for node in nodes
+    ]
+
+
+def _render_links(fragments: list[LinkFragment]) -> str:
+    return "\n".join(f.vless_link for f in fragments)
+
+
+def _render_base64(fragments: list[LinkFragment]) -> str:
+    return base64.b64encode(_render_links(fragments).encode()).decode()
+
+
+def _render_clash(fragments: list[LinkFragment]) -> str:
+    group = "Nightking"
+    proxies = "\n".join(_CLASH_PROXY.substitute(f.json_values) for f in fragments)
+    names = ", ".join(f.json_values["name"] for f in fragments)
+    return _CLASH_DOCUMENT.substitute(proxies=proxies, group=json.dumps(group), names=names, group_raw=group)
+
+
+def _render_sing_box(fragments: list[LinkFragment]) -> str:
+    outbounds = ",".join(_SING_BOX_OUTBOUND.substitute(f.json_values) for f in fragments)
+    names = ",".join(f.json_values["name"] for f in fragments)
+    return _SING_BOX_DOCUMENT.substitute(names=names, outbounds=outbounds)
+
+
+_RENDERERS = {LINKS: _render_links, BASE64: _render_base64, CLASH: _render_clash, SING_BOX: _render_sing_box}
+
+# Below this size gzip framing costs more than it saves.
+GZIP_MIN_BYTES = 512
+
+# Bodies keyed by (token, format, encoding) and stored with the version they
+# were rendered from, so an entry for an outdated revision is never served even
+# if an invalidation was missed. Entries also expire after a short TTL. Both
+# caches are built on first use, so importing this module reads no settings.
+@lru_cache(maxsize=1)
+def _render_cache() -> TTLCache[tuple[str, str, str], tuple[str, bytes]]:
+    return TTLCache(maxsize=50_000, ttl=get_settings().subscription_cache_ttl_seconds)
+
+
+# Fragments keyed by token, stored with the content version they were built from.
+@lru_cache(maxsize=1)
+def _fragment_cache() -> TTLCache[str, tuple[str, list[LinkFragment]]]:
+    return TTLCache(maxsize=50_000, ttl=get_settings().subscription_cache_ttl_seconds)
+
+
+_render_counts = {"hits": 0, "misses": 0}
+_render_counts_lock = threading.Lock()
+# Shares fills between workers when SUBSCRIPTION_FILL_LOCK_ENABLED is set.
+fill_lock = FillLock("subfill")
+
+
+def _active_nodes(sub_token: SubscriptionToken) -> list:
+    return [sn.node for sn in sub_token.service.service_nodes if sn.node and sn.node.is_active is not False]
+
+
+def _content_version(sub_token: SubscriptionToken, settings: Settings) -> str:
+    """Fingerprint of what the fragments are built from; the same for every format."""
+    service = sub_token.service
+    node_stamps = ",".join(
+        f"{sn.node_id}:{sn.node.revised_at.timestamp() if sn.node and sn.node.revised_at else 0}"
+        for sn in service.service_nodes
+    )
+    raw = (
+        f"{sub_token.token}|{sub_token.client_uuid}|{service.id}|{service.revision}|{node_stamps}|"
+        f"{settings.subscription_domain}|{settings.subscription_port}|{settings.xray_inbound_port}"
+    )
+    return hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()
+
+
+def subscription_version(sub_token: SubscriptionToken, fmt: str, settings: Settings) -> str:
+    """Opaque fingerprint of everything a rendered body depends on.
+
+    Built from the service revision, the revision times of its nodes and the
+    settings that appear in links, so it changes exactly when the body would.
+    """
+    return _format_version(_content_version(sub_token, settings), fmt)
+
+
+def _format_version(content_version: str, fmt: str) -> str:
+    return hashlib.blake2b(f"{content_version}|{fmt}".encode(), digest_size=12).hexdigest()
+
+
+def _cached_fragments(sub_token: SubscriptionToken, settings: Settings, content_version: str) -> list[LinkFragment]:
+    # Every format of one subscription renders from the same fragments, so they
+    # are built once per content version and shared with their escaped forms.
+    cached = _fragment_cache().get(sub_token.token)
+    if cached is not None and cached[0] == content_version:
+        return cached[1]
+    fragments = build_fragments(sub_token, settings)
+    _fragment_cache().set(sub_token.token, (content_version, fragments))
+    return fragments
+
+
+def subscription_last_modified(sub_token: SubscriptionToken) -> datetime:
+    service = sub_token.service
+    stamps = [service.revised_at or service.created_at]
+    stamps += [node.revised_at or node.created_at for node in _active_nodes(sub_token)]
+    latest = max((stamp for stamp in stamps if stamp is not None), default=datetime(1970, 1, 1))
+    return latest if latest.tzinfo else latest.replace(tzinfo=timezone.utc)
+
+
+def render_subscription(sub_token: SubscriptionToken, fmt: str, settings: Settings, *, encoding: str = "identity") -> bytes:
+    """Rendered body for ``fmt``, gzip-compressed when ``encoding`` is ``"gzip"``."""
+    content_version = _content_version(sub_token, settings)
+    version = _format_version(content_version, fmt)
+    key = (sub_token.token, fmt, encoding)
+    cached = _render_cache().get(key)
+    hit = cached is not None and cached[0] == version
+    with _render_counts_lock:
+        _render_counts["hits" if hit else "misses"] += 1
+    if hit:
+        return cached[1]
+
+    def _render() -> bytes:
+        if encoding == "gzip":
+            return gzip.compress(render_subscription(sub_token, fmt, settings), compresslevel=6, mtime=0)
+        return _RENDERERS[fmt](_cached_fragments(sub_token, settings, content_version)).encode()
+
+    # The version already covers token and format, and keeps the raw token out of Redis.
+    body = fill_lock.fill(f"{version}:{encoding}", _render) if get_settings().subscription_fill_lock_enabled else _render()
+    _render_cache().set(key, (version, body))
+    return body
+
+
+def render_cache_stats() -> dict:
+    with _render_counts_lock:
+        counts = dict(_render_counts)
+    return {
+        "entries": len(_render_cache()),
+        "fragment_entries": len(_fragment_cache()),
+        **counts,
+        "fill_lock": fill_lock.stats(),
+    }
+
+
+def invalidate_subscription(token: Optional[str] = None) -> None:
+    if token is None:
+        _render_cache().clear()
+        _fragment_cache().clear()
+    else:
+        _fragment_cache().pop(token)
+        for fmt in FORMATS:
+            for encoding in ("identity", "gzip"):
+                _render_cache().pop((token, fmt, encoding))
+
+
+invalidation_bus.on(EventKind.SUBSCRIPTION_CHANGED, invalidate_subscription)
+invalidation_bus.on(EventKind.SUBSCRIPTION_DELETED, invalidate_subscription)
+invalidation_bus.on_flush(invalidate_subscription)
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import base64
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import and_, func, literal, literal_column, or_, select, union_all, update
+from sqlalchemy.orm import Session
+
+from .models import Role, SupportTicket, SupportTicketMessage, SupportTicketStatus
+
+# Must match the expression indexes in migration 0012 for Postgres to use them.
+# ``simple`` skips stemming, which suits the mixed-language tickets we get.
+TS_CONFIG = "simple"
+PREVIEW_LENGTH = 200
+
+
+def _ts_vector(column):
+    # An inlined constant rather than a bind parameter, so the planner can match the index expression.
+    return func.to_tsvector(literal_column(f"'{TS_CONFIG}'::regconfig"), column)
+
+
+def _scope(stmt, current_user):
+    """Resellers only ever see tickets they opened; admins see all of them."""
+    if current_user.role != Role.ADMIN:
+        stmt = stmt.where(SupportTicket.created_by == current_user.username)
+    return stmt
+
+
+def get_ticket(db: Session, ticket_id: int, current_user) -> SupportTicket:
+    ticket = db.scalar(_scope(select(SupportTicket).where(SupportTicket.id == ticket_id), current_user))
+    if ticket is None:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    return ticket
+
+
+def _record_message(db: Session, ticket_id: int, sender_role: str, message: str) -> SupportTicketMessage:
+    """Insert a message and fold it into the ticket summary within the caller's transaction.
+
+    The summary is updated with one relative UPDATE so replies racing on the
+    same ticket cannot lose each other's counts.
+    """
+    entry = SupportTicketMessage(ticket_id=ticket_id, sender_role=sender_role, message=message, created_at=datetime.utcnow())
+    db.add(entry)
+    db.flush()
+    unread = SupportTicket.unread_by_reseller if sender_role == Role.ADMIN.value else SupportTicket.unread_by_admin
+    db.execute(
+        update(SupportTicket)
+        .where(SupportTicket.id == ticket_id)
+        .values(
+            {
+                SupportTicket.last_message_at: entry.created_at,
+                SupportTicket.last_message_preview: message[:PREVIEW_LENGTH],
+                SupportTicket.last_sender_role: sender_role,
+                SupportTicket.message_count: SupportTicket.message_count + 1,
+                unread: unread + 1,
+            }
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return entry
+
+
+def create_ticket(db: Session, current_user, subject: str, message: str) -> SupportTicket:
+    ticket = SupportTicket(created_by=current_user.username, subject=subject, status=SupportTicketStatus.OPEN)
+    db.add(ticket)
+    db.flush()
+    _record_message(db, ticket.id, current_user.role.value, message)
+    db.commit()
+    db.refresh(ticket)
+    return ticket
+
+
+def add_message(db: Session, ticket_id: int, current_user, message: str) -> SupportTicketMessage:
+    ticket = get_ticket(db, ticket_id, current_user)
+    if ticket.status == SupportTicketStatus.CLOSED:
+        raise HTTPException(status_code=409, detail="Ticket is closed")
+    entry = _record_message(db, ticket.id, current_user.role.value, message)
+    db.commit()
+    db.refresh(entry)
+    return entry
+
+
+def mark_read(db: Session, ticket_id: int, current_user) -> SupportTicket:
+    ticket = get_ticket(db, ticket_id, current_user)
+    if current_user.role == Role.ADMIN:
+        ticket.unread_by_admin = 0
+    else:
+        ticket.unread_by_reseller = 0
+    db.commit()
+    db.refresh(ticket)
+    return ticket
+
+
+def set_status(db: Session, ticket_id: int, current_user, ticket_status: SupportTicketStatus) -> SupportTicket:
+    ticket = get_ticket(db, ticket_id, current_user)
+    ticket.status = ticket_status
+    db.commit()
+    db.refresh(ticket)
+    return ticket
+
+
+def encode_cursor(ticket: SupportTicket) -> str:
+    raw = f"{ticket.last_message_at.isoformat()}|{ticket.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        last_message_at, ticket_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(last_message_at), int(ticket_id)
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+
+
+def list_tickets(
+    db: Session,
+    current_user,
+    *,
+    ticket_status: Optional[SupportTicketStatus] = None,
+    unread_only: bool = False,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+) -> list[SupportTicket]:
+    """Inbox view, most recently active first, keyset-paginated on ``(last_message_at, id)``.
+
+    Reads only the ticket rows and their summary columns; messages are not touched.
+    """
+    stmt = _scope(select(SupportTicket), current_user)
+    if ticket_status is not None:
+        stmt = stmt.where(SupportTicket.status == ticket_status)
+    if unread_only:
+        unread = SupportTicket.unread_by_admin if current_user.role == Role.ADMIN else SupportTicket.unread_by_reseller
+        stmt = stmt.where(unread > 0)
+    if cursor:
+        last_message_at, ticket_id = _decode_cursor(cursor)
+        stmt = stmt.where(
+            or_(
+                SupportTicket.last_message_at < last_message_at,
+                and_(SupportTicket.last_message_at == last_message_at, SupportTicket.id < ticket_id),
+            )
+        )
+    stmt = stmt.order_by(SupportTicket.last_message_at.desc(), SupportTicket.id.desc()).limit(limit)
+    return db.scalars(stmt).all()
+
+
+def list_messages(
+    db: Session,
+    ticket_id: int,
+    current_user,
+    *,
+    after_id: Optional[int] = None,
+    before_id: Optional[int] = None,
+    limit: int = 50,
+) -> list[SupportTicketMessage]:
+    """A page of a thread, oldest first, walking the ``(ticket_id, id)`` index.
+
+    ``after_id`` pages forward; ``before_id`` fetches the page just before it,
+    which is how a client opens a long thread at its newest messages and
+    scrolls back.
+    """
+    get_ticket(db, ticket_id, current_user)
+    stmt = select(SupportTicketMessage).where(SupportTicketMessage.ticket_id == ticket_id)
+    if after_id is not None:
+        stmt = stmt.where(SupportTicketMessage.id > after_id)
+    if before_id is not None:
+        stmt = stmt.where(SupportTicketMessage.id < before_id)
+        rows = db.scalars(stmt.order_by(SupportTicketMessage.id.desc()).limit(limit)).all()
+        return list(reversed(rows))
+    return db.scalars(stmt.order_by(SupportTicketMessage.id).limit(limit)).all()
+
+
+def search_tickets(db: Session, current_user, query: str, limit: int = 20) -> list[tuple[SupportTicket, float]]:
+    """Tickets whose subject or messages match ``query``, best match first.
+
+    On Postgres this is ``websearch_to_tsquery`` against the GIN expression
+    indexes on ``support_tickets.subject`` and ``support_ticket_messages.message``;
+    subject hits weigh double and a ticket's score is the sum over its hits.
+    Other databases fall back to a case-insensitive substring match.
+    """
+    query = query.strip()
+    if not query:
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        tsquery = func.websearch_to_tsquery(literal_column(f"'{TS_CONFIG}'::regconfig"), query)
+        subject_vector = _ts_vector(SupportTicket.subject)
+        message_vector = _ts_vector(SupportTicketMessage.message)
+        hits = union_all(
+            select(SupportTicket.id.label("ticket_id"), (func.ts_rank(subject_vector, tsquery) * 2).label("rank")).where(
+                subject_vector.op("@@")(tsquery)
+            ),
+            select(SupportTicketMessage.ticket_id, func.ts_rank(message_vector, tsquery)).where(
+                message_vector.op("@@")(tsquery)
+            ),
+        ).subquery()
+    else:
+        pattern = f"%{query}%"
+        hits = union_all(
+            select(SupportTicket.id.label("ticket_id"), literal(2.0).label("rank")).where(
+                SupportTicket.subject.ilike(pattern)
+            ),
+            select(SupportTicketMessage.ticket_id, literal(1.0)).where(SupportTicketMessage.message.ilike(pattern)),
+        ).subquery()
+    ranked = (
+        select(hits.c.ticket_id, func.sum(hits.c.rank).label("rank")).group_by(hits.c.ticket_id).subquery()
+    )
+    stmt = _scope(
+        select(SupportTicket, ranked.c.rank).join(ranked, ranked.c.ticket_id == SupportTicket.id), current_user
+    )
+    stmt = stmt.order_by(ranked.c.rank.desc(), SupportTicket.id.desc()).limit(limit)
+    return [(ticket, float(rank)) for ticket, rank in db.execute(stmt).all()]
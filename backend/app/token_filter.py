@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from typing import Callable, Iterator, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .events import EventKind, invalidation_bus
+from .models import SubscriptionToken
+
+logger = logging.getLogger(__name__)
+
+MAX_TOKEN_LENGTH = 64
+# Ids are assigned at INSERT but become visible at COMMIT, so a refresh re-reads
+# a window below the highest id seen to catch rows that committed out of order.
+_REFRESH_LOOKBACK_IDS = 1000
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings using double hashing of one BLAKE2b digest."""
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.num_bits = max(64, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item: str) -> Iterator[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str) -> None:
+        new = False
+        for pos in self._positions(item):
+            mask = 1 << (pos & 7)
+            if not self._bits[pos >> 3] & mask:
+                self._bits[pos >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._bits)
+
+    def estimated_false_positive_rate(self) -> float:
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class SubscriptionTokenFilter:
+    """In-memory negative-lookup filter for ``/sub/{token}``.
+
+    A token the filter has never seen cannot exist, so scanners probing random
+    tokens get a 404 without touching Postgres or Redis. Bloom filters cannot
+    delete, so removed tokens stay as harmless false positives (they fall
+    through to the normal DB lookup) until the next rebuild.
+
+    Each worker builds its own copy at startup and then keeps it current:
+    tokens created in-process are added immediately, tokens created by other
+    workers arrive over the invalidation bus (with an incremental refresh on
+    ``SubscriptionToken.id`` as a backstop), and the filter is rebuilt periodically or when deletions/growth degrade it.
+    Until the first build completes every token is let through.
+    """
+
+    def __init__(self, error_rate: float = 0.001, headroom: float = 2.0) -> None:
+        self.error_rate = error_rate
+        self.headroom = headroom
+        self._bloom: BloomFilter | None = None
+        self._max_id = 0
+        self._removed = 0
+        self._rejected = 0
+        self._built_at: float | None = None
+        self._pending: list[str] | None = None
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self._bloom is not None
+
+    def might_exist(self, token: str) -> bool:
+        bloom = self._bloom
+        if len(token) <= MAX_TOKEN_LENGTH and (bloom is None or token in bloom):
+            return True
+        self._rejected += 1
+        return False
+
+    def add(self, token: str) -> None:
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(token)
+            if self._bloom is not None:
+                self._bloom.add(token)
+
+    def discard(self, token: str) -> None:
+        with self._lock:
+            self._removed += 1
+
+    def request_rebuild(self) -> None:
+        """Have the background thread rebuild from the database on its next tick."""
+        self._built_at = None
+
+    def rebuild(self, db: Session) -> None:
+        with self._lock:
+            self._pending = []
+        total = db.scalar(select(func.count(SubscriptionToken.id))) or 0
+        bloom = BloomFilter(max(int(total * self.headroom), 1024), self.error_rate)
+        max_id = 0
+        stmt = select(SubscriptionToken.id, SubscriptionToken.token).execution_options(yield_per=10_000)
+        for token_id, token in db.execute(stmt):
+            bloom.add(token)
+            max_id = max(max_id, token_id)
+        with self._lock:
+            for token in self._pending or ():
+                bloom.add(token)
+            self._bloom, self._max_id, self._removed, self._pending = bloom, max_id, 0, None
+            self._built_at = time.time()
+        logger.info("Built subscription token filter", extra=self.stats())
+
+    def refresh(self, db: Session) -> None:
+        bloom = self._bloom
+        if bloom is None:
+            self.rebuild(db)
+            return
+        stmt = (
+            select(SubscriptionToken.id, SubscriptionToken.token)
+            .where(SubscriptionToken.id > self._max_id - _REFRESH_LOOKBACK_IDS)
+            .order_by(SubscriptionToken.id)
+        )
+        rows = db.execute(stmt).all()
+        with self._lock:
+            for token_id, token in rows:
+                bloom.add(token)
+                self._max_id = max(self._max_id, token_id)
+        if bloom.count > bloom.capacity or self._removed > bloom.count * 0.1:
+            self.rebuild(db)
+
+    def stats(self) -> dict:
+        bloom = self._bloom
+        if bloom is None:
+            return {"ready": False}
+        return {
+            "ready": True,
+            "tokens": bloom.count,
+            "capacity": bloom.capacity,
+            "bits": bloom.num_bits,
+            "hashes": bloom.num_hashes,
+            "memory_bytes": bloom.memory_bytes,
+            "target_false_positive_rate": bloom.error_rate,
+            "estimated_false_positive_rate": bloom.estimated_false_positive_rate(),
+            "removed_since_build": self._removed,
+            "rejected": self._rejected,
+            "built_at": self._built_at,
+        }
+
+    def start(
+        self,
+        session_factory: Callable[[], Session],
+        refresh_seconds: float,
+        rebuild_seconds: float,
+        *,
+        error_rate: Optional[float] = None,
+    ) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        if error_rate is not None:
+            self.error_rate = error_rate
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(session_factory, refresh_seconds, rebuild_seconds), name="token-filter", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self, session_factory: Callable[[], Session], refresh_seconds: float, rebuild_seconds: float) -> None:
+        while not self._stop.is_set():
+            try:
+                with session_factory() as db:
+                    if self._built_at is None or time.time() - self._built_at >= rebuild_seconds:
+                        self.rebuild(db)
+                    else:
+                        self.refresh(db)
+            except Exception:
+                logger.exception("Subscription token filter refresh failed")
+            self._stop.wait(refresh_seconds)
+
+
+# Sized from settings by ``start``, so importing this module reads none.
+token_filter = SubscriptionTokenFilter()
+invalidation_bus.on(EventKind.TOKEN_CREATED, token_filter.add)
+invalidation_bus.on(EventKind.SUBSCRIPTION_DELETED, token_filter.discard)
+invalidation_bus.on_flush(token_filter.request_rebuild)
@@ -1,9 +1,26 @@
 from __future__ import annotations
 
+from typing import Iterable, Mapping
+
 from sqlalchemy.orm import Session
 
 from .models import Service
-from .crud import update_usage
+from .crud import add_usage, add_usage_by_stats_key, update_usage
+
+
+def usage_from_xray_stats(stats: Iterable[Mapping]) -> dict[str, int]:
+    """Total bytes per client from Xray ``QueryStats`` entries.
+
+    Per-user counters are named ``user>>>{email}>>>traffic>>>{uplink|downlink}``
+    and the rendered ``email`` is the client's stats key, so no parsing of
+    addresses or service ids is needed. Other counters are skipped.
+    """
+    usage: dict[str, int] = {}
+    for stat in stats:
+        parts = stat.get("name", "").split(">>>")
+        if len(parts) == 4 and parts[0] == "user" and parts[2] == "traffic":
+            usage[parts[1]] = usage.get(parts[1], 0) + int(stat.get("value") or 0)
+    return usage
 
 
 class TrafficCollector:
@@ -16,8 +33,11 @@ class TrafficCollector:
         self.db = db
 
     def record_usage(self, service: Service, *, bytes_used: int) -> Service:
-        service.traffic_used_bytes = (service.traffic_used_bytes or 0) + max(bytes_used, 0)
-        return update_usage(self.db, service, traffic_used_bytes=service.traffic_used_bytes)
+        return add_usage(self.db, service, bytes_used)
+
+    def record_xray_stats(self, stats: Iterable[Mapping]) -> int:
+        """Attribute a node's Xray stats snapshot (deltas, i.e. queried with reset) to services."""
+        return add_usage_by_stats_key(self.db, usage_from_xray_stats(stats))
 
     def reset_usage(self, service: Service) -> Service:
         return update_usage(self.db, service, traffic_used_bytes=0)
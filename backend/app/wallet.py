@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import case, func, select, update
+from sqlalchemy.orm import Session
+
+from .db import upsert_insert
+from .jobs import PeriodicJob
+from .models import (
+    ResellerPlan,
+    ResellerSubscription,
+    ResellerWallet,
+    WalletCheckpoint,
+    WalletTransaction,
+    WalletTransactionType,
+)
+from .notifications import enqueue
+
+_SIGNED_AMOUNT = case(
+    (WalletTransaction.type == WalletTransactionType.DEBIT, -WalletTransaction.amount), else_=WalletTransaction.amount
+)
+
+
+def get_balance(db: Session, reseller_id: int) -> int:
+    """Current balance: one primary-key read of the materialized row, no ledger scan."""
+    return db.scalar(select(ResellerWallet.balance).where(ResellerWallet.reseller_id == reseller_id)) or 0
+
+
+def credit(db: Session, reseller_id: int, amount: int, reason: Optional[str] = None) -> int:
+    """Add ``amount`` to the wallet and the ledger in one transaction; returns the new balance."""
+    if amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
+    stmt = upsert_insert(db, ResellerWallet).values(reseller_id=reseller_id, balance=amount, updated_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ResellerWallet.reseller_id],
+        set_={"balance": ResellerWallet.balance + stmt.excluded.balance, "updated_at": stmt.excluded.updated_at},
+    ).returning(ResellerWallet.balance)
+    balance = db.execute(stmt).scalar_one()
+    db.add(WalletTransaction(reseller_id=reseller_id, amount=amount, type=WalletTransactionType.CREDIT, reason=reason))
+    enqueue(db, "wallet.credited", {"amount": amount, "balance": balance, "reason": reason}, reseller_id)
+    db.commit()
+    return balance
+
+
+def _debit(db: Session, reseller_id: int, amount: int, reason: str) -> int:
+    """Conditionally debit inside the caller's transaction.
+
+    ``UPDATE ... WHERE balance >= amount RETURNING balance`` checks and spends
+    in one statement under the row lock, so parallel purchases serialize on the
+    wallet row and can never overdraw it. The ledger row is written while the
+    lock is held, keeping it in step with the balance.
+    """
+    balance = db.execute(
+        update(ResellerWallet)
+        .where(ResellerWallet.reseller_id == reseller_id, ResellerWallet.balance >= amount)
+        .values(balance=ResellerWallet.balance - amount, updated_at=datetime.utcnow())
+        .returning(ResellerWallet.balance)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+    if balance is None:
+        raise HTTPException(status_code=status.HTTP_402_PAYMENT_REQUIRED, detail="Insufficient wallet balance")
+    db.add(WalletTransaction(reseller_id=reseller_id, amount=amount, type=WalletTransactionType.DEBIT, reason=reason))
+    return balance
+
+
+def purchase_plan(db: Session, reseller_id: int, plan_id: int) -> tuple[ResellerSubscription, int]:
+    """Debit the plan price and start (or extend) the reseller's subscription atomically."""
+    plan = db.get(ResellerPlan, plan_id)
+    if plan is None or plan.is_active is False:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    try:
+        balance = _debit(db, reseller_id, plan.price, f"plan:{plan.id}") if plan.price > 0 else get_balance(db, reseller_id)
+        now = datetime.utcnow()
+        current_end = db.scalar(
+            select(func.max(ResellerSubscription.ends_at)).where(
+                ResellerSubscription.reseller_id == reseller_id,
+                ResellerSubscription.is_active.isnot(False),
+            )
+        )
+        if current_end is not None and current_end.tzinfo is not None:
+            current_end = current_end.replace(tzinfo=None)
+        starts_at = max(now, current_end) if current_end else now
+        subscription = ResellerSubscription(
+            reseller_id=reseller_id, plan_id=plan.id, starts_at=starts_at, ends_at=starts_at + timedelta(days=plan.duration_days)
+        )
+        db.add(subscription)
+        enqueue(
+            db,
+            "plan.purchased",
+            {"plan_id": plan.id, "price": plan.price, "balance": balance, "ends_at": subscription.ends_at},
+            reseller_id,
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    db.refresh(subscription)
+    return subscription, balance
+
+
+def list_plans(db: Session, include_inactive: bool = False) -> list[ResellerPlan]:
+    stmt = select(ResellerPlan).order_by(ResellerPlan.price, ResellerPlan.id)
+    if not include_inactive:
+        stmt = stmt.where(ResellerPlan.is_active.isnot(False))
+    return db.scalars(stmt).all()
+
+
+def create_plan(db: Session, **fields) -> ResellerPlan:
+    plan = ResellerPlan(**fields)
+    db.add(plan)
+    db.commit()
+    db.refresh(plan)
+    return plan
+
+
+def checkpoint_wallet(db: Session, reseller_id: int) -> Optional[WalletCheckpoint]:
+    """Record the balance as of the newest ledger row, if anything changed since the last checkpoint.
+
+    Locking the wallet row waits out in-flight debits/credits, so every ledger
+    row with ``id <= transaction_id`` is committed and reflected in ``balance``.
+    """
+    balance = db.scalar(
+        select(ResellerWallet.balance).where(ResellerWallet.reseller_id == reseller_id).with_for_update()
+    )
+    last_id = db.scalar(select(func.max(WalletTransaction.id)).where(WalletTransaction.reseller_id == reseller_id))
+    previous = db.scalar(
+        select(WalletCheckpoint.transaction_id)
+        .where(WalletCheckpoint.reseller_id == reseller_id)
+        .order_by(WalletCheckpoint.created_at.desc(), WalletCheckpoint.id.desc())
+        .limit(1)
+    )
+    if balance is None or last_id is None or last_id == previous:
+        db.commit()
+        return None
+    checkpoint = WalletCheckpoint(reseller_id=reseller_id, transaction_id=last_id, balance=balance)
+    db.add(checkpoint)
+    db.commit()
+    return checkpoint
+
+
+def checkpoint_all(db: Session) -> int:
+    created = 0
+    for reseller_id in db.scalars(select(ResellerWallet.reseller_id).order_by(ResellerWallet.reseller_id)).all():
+        created += checkpoint_wallet(db, reseller_id) is not None
+    return created
+
+
+def _balance_before(db: Session, reseller_id: int, moment: datetime) -> int:
+    """Balance just before ``moment``: nearest earlier checkpoint plus the ledger rows after it."""
+    checkpoint = db.execute(
+        select(WalletCheckpoint.transaction_id, WalletCheckpoint.balance)
+        .where(WalletCheckpoint.reseller_id == reseller_id, WalletCheckpoint.created_at <= moment)
+        .order_by(WalletCheckpoint.created_at.desc(), WalletCheckpoint.id.desc())
+        .limit(1)
+    ).first()
+    after_id, balance = checkpoint if checkpoint else (0, 0)
+    delta = db.scalar(
+        select(func.coalesce(func.sum(_SIGNED_AMOUNT), 0)).where(
+            WalletTransaction.reseller_id == reseller_id,
+            WalletTransaction.id > after_id,
+            WalletTransaction.created_at < moment,
+        )
+    )
+    return balance + delta
+
+
+def statement(db: Session, reseller_id: int, since: datetime, until: datetime) -> dict:
+    """Ledger rows in ``[since, until)`` with opening and closing balances."""
+    opening = _balance_before(db, reseller_id, since)
+    rows = db.scalars(
+        select(WalletTransaction)
+        .where(
+            WalletTransaction.reseller_id == reseller_id,
+            WalletTransaction.created_at >= since,
+            WalletTransaction.created_at < until,
+        )
+        .order_by(WalletTransaction.id)
+    ).all()
+    closing = opening + sum(row.amount if row.type == WalletTransactionType.CREDIT else -row.amount for row in rows)
+    return {"reseller_id": reseller_id, "opening_balance": opening, "closing_balance": closing, "transactions": rows}
+
+
+wallet_checkpointer = PeriodicJob("wallet-checkpoint", checkpoint_all)
@@ -4,19 +4,17 @@ import json
 import logging
 import socket
 import subprocess
-import uuid
 from datetime import datetime, timezone
 from pathlib import Path
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy import select
-from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm import Session
 
 from .auth import get_current_user
 from .config import Settings, get_settings
-from .crud import ensure_subscription_token
 from .db import get_db
-from .models import Service, ServiceProtocol, XrayConfigSnapshot
+from .models import Service, ServiceProtocol, SubscriptionToken, XrayConfigSnapshot
 from .schemas import Role, UserPublic, XrayApplyResponse, XrayRenderResponse, XrayStatus
 
 logger = logging.getLogger(__name__)
@@ -24,27 +22,33 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/xray", tags=["xray"])
 
 
+# Rows fetched per round trip while reading the client list.
+RENDER_BATCH_SIZE = 5000
+
+
 def _collect_vless_clients(db: Session) -> list[dict]:
+    """Active VLESS clients from one read-only query, fetched ``RENDER_BATCH_SIZE`` rows at a time.
+
+    Tokens are created together with their service, and migration 0016 gave
+    older services theirs, so the render never writes. A service without a
+    token cannot be listed; ``_render_xray_config`` warns when one exists.
+    """
+    # Table columns rather than ORM attributes: the rows skip ORM result
+    # processing, which roughly halves the time at 100k clients.
+    tokens, services = SubscriptionToken.__table__, Service.__table__
     stmt = (
-        select(Service)
-        .where(Service.protocol == ServiceProtocol.XRAY_VLESS)
-        .options(selectinload(Service.subscription_token), selectinload(Service.user))
+        select(tokens.c.client_uuid, tokens.c.stats_key)
+        .join(services, services.c.id == tokens.c.service_id)
+        .where(services.c.protocol == ServiceProtocol.XRAY_VLESS, services.c.is_active.isnot(False))
+        .order_by(services.c.id)
+        .execution_options(yield_per=RENDER_BATCH_SIZE)
     )
-    services = db.scalars(stmt).all()
-    clients: list[dict] = []
-    for service in services:
-        token = service.subscription_token or ensure_subscription_token(db, service)
-        user = service.user
-        if not user:
-            continue
-        client_uuid = str(uuid.uuid5(uuid.NAMESPACE_URL, token.token))
-        clients.append(
-            {
-                "id": client_uuid,
-                "email": f"{user.email}:{service.id}",
-            }
-        )
-    return clients
+    # ``email`` is what Xray keys per-user traffic stats by; see usage.usage_from_xray_stats.
+    return [
+        {"id": client_uuid, "email": stats_key}
+        for batch in db.execute(stmt).partitions()
+        for client_uuid, stats_key in batch
+    ]
 
 
 def _render_xray_config(db: Session, settings: Settings) -> dict:
@@ -113,14 +117,8 @@ def render_config(
     return XrayRenderResponse(generated_at=datetime.now(timezone.utc).isoformat(), config=config)
 
 
-@router.post("/apply", response_model=XrayApplyResponse)
-def apply_config(
-    db: Session = Depends(get_db),
-    settings: Settings = Depends(get_settings),
-    current_user: UserPublic = Depends(get_current_user),
-) -> XrayApplyResponse:
-    if current_user.role != Role.ADMIN:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+def apply_xray_config(db: Session, settings: Settings) -> XrayApplyResponse:
+    """Render, write and reload the Xray config once, recording a snapshot of the result."""
     config = _render_xray_config(db, settings)
     serialized = json.dumps(config, indent=2)
 
@@ -162,6 +160,17 @@ def apply_config(
     )
 
 
+@router.post("/apply", response_model=XrayApplyResponse)
+def apply_config(
+    db: Session = Depends(get_db),
+    settings: Settings = Depends(get_settings),
+    current_user: UserPublic = Depends(get_current_user),
+) -> XrayApplyResponse:
+    if current_user.role != Role.ADMIN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+    return apply_xray_config(db, settings)
+
+
 @router.get("/status", response_model=XrayStatus)
 def xray_status(
     db: Session = Depends(get_db),
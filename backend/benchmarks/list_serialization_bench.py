@@ -0,0 +1,99 @@
+"""Cost of serving one ``/api/services`` page: ORM + pydantic + FastAPI encoder vs column rows + orjson.
+
+Times only the database read and JSON encoding of a page, the work a list
+request does per call, so the numbers are per-request CPU rather than HTTP
+throughput. Creates its tables in the target database, so point it at a
+scratch database.
+
+Run from ``backend/``:
+``BENCH_DATABASE_URL=postgresql+psycopg2://... python -m benchmarks.list_serialization_bench [rows] [page] [rounds]``
+(defaults to a temporary SQLite file).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.models import Base, Service, ServiceProtocol, User
+
+
+def _seed(engine, rows: int) -> None:
+    with Session(engine) as db:
+        if db.query(Service.id).count() >= rows:
+            return
+        now = datetime.utcnow()
+        db.execute(insert(User), [{"email": f"bench{i}@example.com", "full_name": f"Bench {i}"} for i in range(rows)])
+        user_ids = [user_id for (user_id,) in db.query(User.id).order_by(User.id).limit(rows)]
+        db.execute(
+            insert(Service),
+            [
+                {
+                    "name": f"Service {i}",
+                    "user_id": user_id,
+                    "protocol": ServiceProtocol.XRAY_VLESS,
+                    "endpoint": f"edge{i % 50}.example.com:443",
+                    "traffic_limit_bytes": 10**9,
+                    "traffic_used_bytes": i * 1000,
+                    "expires_at": now + timedelta(days=i % 365),
+                    "is_active": True,
+                    "created_at": now,
+                }
+                for i, user_id in enumerate(user_ids)
+            ],
+        )
+        db.commit()
+
+
+def orm_page(db: Session, page: int) -> bytes:
+    # What FastAPI does for a response_model return: validate each item, encode, json.dumps.
+    services = crud.list_services(db, limit=page, offset=0)
+    body = schemas.PaginatedServices(items=[schemas.ServiceOut.from_orm(s) for s in services], limit=page, offset=0)
+    return json.dumps(jsonable_encoder(body), separators=(",", ":")).encode()
+
+
+def rows_page(db: Session, page: int) -> bytes:
+    rows = crud.list_service_rows(db, limit=page, offset=0)
+    return orjson.dumps({"items": [dict(row) for row in rows], "limit": page, "offset": 0})
+
+
+def _time(engine, func, page: int, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        with Session(engine) as db:
+            func(db, page)
+    return (time.perf_counter() - started) / rounds * 1000
+
+
+def main(rows: int = 5000, page: int = 100, rounds: int = 300) -> None:
+    url = os.environ.get("BENCH_DATABASE_URL")
+    if not url:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        url = f"sqlite:///{path}"
+    engine = create_engine(url, future=True)
+    Base.metadata.create_all(engine)
+    _seed(engine, rows)
+    with Session(engine) as db:
+        assert json.loads(orm_page(db, page)) == json.loads(rows_page(db, page))
+
+    print(f"database={engine.dialect.name} page={page} rounds={rounds}")
+    baseline = _time(engine, orm_page, page, rounds)
+    fast = _time(engine, rows_page, page, rounds)
+    print(f"orm+pydantic+encoder {baseline:7.2f} ms/page")
+    print(f"rows+orjson          {fast:7.2f} ms/page  ({baseline / fast:.1f}x)")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]]
+    main(*args)
@@ -0,0 +1,33 @@
+"""Size and accuracy of the /sub negative-lookup filter at 1M tokens.
+
+Run from ``backend/``: ``python -m benchmarks.token_filter_bench [tokens]``.
+"""
+
+from __future__ import annotations
+
+import secrets
+import sys
+import time
+
+from app.token_filter import BloomFilter
+
+
+def main(n: int = 1_000_000, probes: int = 1_000_000, error_rate: float = 0.001, headroom: float = 2.0) -> None:
+    tokens = [secrets.token_urlsafe(32) for _ in range(n)]
+    bloom = BloomFilter(int(n * headroom), error_rate)
+    started = time.perf_counter()
+    for token in tokens:
+        bloom.add(token)
+    build_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    false_positives = sum(secrets.token_urlsafe(32) in bloom for _ in range(probes))
+    probe_us = (time.perf_counter() - started) / probes * 1e6
+
+    print(f"tokens={n} capacity={bloom.capacity} bits={bloom.num_bits} hashes={bloom.num_hashes}")
+    print(f"memory={bloom.memory_bytes / 1024 / 1024:.2f} MiB build={build_s:.1f}s probe={probe_us:.1f}us")
+    print(f"false_positive_rate measured={false_positives / probes:.6f} estimated={bloom.estimated_false_positive_rate():.6f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,101 @@
+"""Parallel plan purchases against one wallet: throughput and overdraft check.
+
+Compares the conditional ``UPDATE ... WHERE balance >= price`` debit in
+``app.wallet`` with the old approach of summing the ledger and then inserting a
+debit. Creates its tables in the target database, so point it at a scratch
+database.
+
+Run from ``backend/``:
+``BENCH_DATABASE_URL=postgresql://... python -m benchmarks.wallet_bench [threads] [purchases]``
+(defaults to a temporary SQLite file, which serializes writers).
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from app import wallet
+from app.models import Base, Reseller, WalletTransaction, WalletTransactionType
+
+PRICE = 10
+
+
+def _ledger_balance(db: Session, reseller_id: int) -> int:
+    stmt = select(func.coalesce(func.sum(wallet._SIGNED_AMOUNT), 0)).where(WalletTransaction.reseller_id == reseller_id)
+    return db.scalar(stmt)
+
+
+def _naive_purchase(db: Session, reseller_id: int) -> bool:
+    if _ledger_balance(db, reseller_id) < PRICE:
+        return False
+    db.add(WalletTransaction(reseller_id=reseller_id, amount=PRICE, type=WalletTransactionType.DEBIT, reason="bench"))
+    db.commit()
+    return True
+
+
+def _run(factory: sessionmaker, mode: str, threads: int, purchases: int) -> None:
+    with factory() as db:
+        reseller = Reseller(name=f"bench-{mode}", auth_username=f"bench-{mode}-{time.time_ns()}")
+        db.add(reseller)
+        db.commit()
+        plan = wallet.create_plan(db, name="bench", price=PRICE, duration_days=1)
+        wallet.credit(db, reseller.id, PRICE * purchases, "bench")
+        reseller_id, plan_id = reseller.id, plan.id
+
+    succeeded = [0] * threads
+
+    def worker(index: int) -> None:
+        with factory() as db:
+            while True:
+                try:
+                    if mode == "conditional":
+                        wallet.purchase_plan(db, reseller_id, plan_id)
+                    elif not _naive_purchase(db, reseller_id):
+                        return
+                except HTTPException:
+                    return
+                succeeded[index] += 1
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with factory() as db:
+        ledger = _ledger_balance(db, reseller_id)
+    total = sum(succeeded)
+    print(
+        f"{mode:<12} threads={threads} purchases={total} ({purchases} affordable) "
+        f"{total / elapsed:8.1f}/s ledger_balance={ledger} overdraft={max(-ledger, 0)}"
+    )
+
+
+def main(threads: int = 16, purchases: int = 2000) -> None:
+    url = os.environ.get("BENCH_DATABASE_URL")
+    if not url:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        url = f"sqlite:///{path}"
+    connect_args = {"timeout": 60} if url.startswith("sqlite") else {}
+    engine = create_engine(url, pool_size=threads + 2, connect_args=connect_args)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine, future=True)
+    print(f"database={engine.dialect.name}")
+    for mode in ("conditional", "naive"):
+        _run(factory, mode, threads, purchases)
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
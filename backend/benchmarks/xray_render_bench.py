@@ -0,0 +1,81 @@
+"""Query count and wall time of rendering the Xray config for a large fleet.
+
+Seeds ``rows`` active VLESS services with tokens, then renders the config the
+way ``POST /xray/render`` does and reports the statements issued and the time
+per render. Creates its tables in the target database, so point it at a
+scratch database.
+
+Run from ``backend/``:
+``BENCH_DATABASE_URL=postgresql+psycopg2://... python -m benchmarks.xray_render_bench [rows] [rounds]``
+(defaults to a temporary SQLite file).
+"""
+
+from __future__ import annotations
+
+import os
+import secrets
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from app import query_stats, xray
+from app.config import get_settings
+from app.models import Base, Service, ServiceProtocol, SubscriptionToken, User
+
+SEED_BATCH = 10_000
+
+
+def _seed(engine, rows: int) -> None:
+    with Session(engine) as db:
+        existing = db.query(Service.id).count()
+        for start in range(existing, rows, SEED_BATCH):
+            stop = min(start + SEED_BATCH, rows)
+            db.execute(insert(User), [{"email": f"render{i}@example.com", "full_name": f"Render {i}"} for i in range(start, stop)])
+            user_ids = [user_id for (user_id,) in db.query(User.id).order_by(User.id).offset(start).limit(stop - start)]
+            db.execute(
+                insert(Service),
+                [
+                    {"name": f"Service {i}", "user_id": user_id, "protocol": ServiceProtocol.XRAY_VLESS, "is_active": True}
+                    for i, user_id in enumerate(user_ids, start)
+                ],
+            )
+            service_ids = [service_id for (service_id,) in db.query(Service.id).order_by(Service.id).offset(start).limit(stop - start)]
+            db.execute(
+                insert(SubscriptionToken),
+                [{"token": secrets.token_urlsafe(32), "service_id": service_id} for service_id in service_ids],
+            )
+            db.commit()
+
+
+def main(rows: int = 100_000, rounds: int = 5) -> None:
+    url = os.environ.get("BENCH_DATABASE_URL")
+    if not url:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        url = f"sqlite:///{path}"
+    engine = create_engine(url, future=True)
+    Base.metadata.create_all(engine)
+    _seed(engine, rows)
+    settings = get_settings()
+
+    timings = []
+    for _ in range(rounds):
+        with Session(engine) as db, query_stats.track() as stats:
+            started = time.perf_counter()
+            config = xray._render_xray_config(db, settings)
+            timings.append((time.perf_counter() - started) * 1000)
+            assert not db.new and not db.dirty
+    # The render is one read-only query over the token and service tables.
+    assert stats.count == 1, stats.count
+    clients = len(config["inbounds"][0]["settings"]["clients"])
+    print(f"database={engine.dialect.name} services={rows} clients={clients} rounds={rounds}")
+    print(f"queries per render   {stats.count}")
+    print(f"render               {min(timings):8.1f} ms best, {sum(timings) / len(timings):8.1f} ms mean")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
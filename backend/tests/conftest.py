@@ -3,11 +3,14 @@ import tempfile
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, select
 from sqlalchemy.orm import Session, sessionmaker
 
-from app.main import app
+from app.audit import audit_writer
+from app.auth import seed_accounts
+from app.config import get_settings
 from app.db import get_db
+from app.main import create_app
 from app.models import Base, Reseller
 
 
@@ -22,15 +25,28 @@ def db_engine():
     os.remove(path)
 
 
+@pytest.fixture(scope="session")
+def app():
+    return create_app()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def audit_to_test_db(db_engine):
+    # Audit rows go to the test database, written as they are recorded.
+    audit_writer.start(sessionmaker(bind=db_engine, future=True), background=False)
+    yield
+    audit_writer.stop()
+
+
 @pytest.fixture(autouse=True)
-def db_session(db_engine):
+def db_session(db_engine, app):
     TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=db_engine, future=True)
     db = TestingSessionLocal()
     Base.metadata.create_all(bind=db_engine)
-    reseller = Reseller(name="Test Reseller", auth_username="reseller")
-    db.add(reseller)
-    db.commit()
-    db.refresh(reseller)
+    if db.scalar(select(Reseller.id).where(Reseller.auth_username == "reseller")) is None:
+        db.add(Reseller(name="Test Reseller", auth_username="reseller"))
+        db.commit()
+    seed_accounts(db, get_settings())
 
     def override_get_db():
         try:
@@ -44,5 +60,47 @@ def db_session(db_engine):
 
 
 @pytest.fixture()
-def client(db_session):
+def make_reseller(db_session):
+    """Create and commit a reseller whose name and login are both ``name``."""
+
+    def make(name: str) -> Reseller:
+        reseller = Reseller(name=name, auth_username=name)
+        db_session.add(reseller)
+        db_session.commit()
+        return reseller
+
+    return make
+
+
+@pytest.fixture()
+def settings_env(monkeypatch):
+    """Set environment variables for ``Settings``; the cached settings are rebuilt before and after the test."""
+
+    def apply(**env: str) -> None:
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        get_settings.cache_clear()
+
+    yield apply
+    get_settings.cache_clear()
+
+
+@pytest.fixture()
+def client(app, db_session):
     return TestClient(app)
+
+
+def _login(client, username: str, role_tab: str) -> dict[str, str]:
+    res = client.post("/auth/login", json={"username": username, "password": "changeme", "role_tab": role_tab})
+    assert res.status_code == 200
+    return {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+
+@pytest.fixture()
+def admin_headers(client):
+    return _login(client, "admin", "ADMIN")
+
+
+@pytest.fixture()
+def reseller_headers(client):
+    return _login(client, "reseller", "RESELLER")
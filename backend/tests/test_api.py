@@ -1,22 +1,25 @@
-from app.models import ServiceProtocol
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
 
+from sqlalchemy import delete
 
-def test_user_and_service_crud(client):
-    # Login as admin
-    login_payload = {"username": "admin", "password": "changeme", "role_tab": "ADMIN"}
-    login_res = client.post("/auth/login", json=login_payload)
-    assert login_res.status_code == 200
-    token = login_res.json()["access_token"]
-    headers = {"Authorization": f"Bearer {token}"}
+from app import crud, exports, reseller_stats, schemas, xray
+from app.audit import query_audit_logs
+from app.models import Node, Service, ServiceNode, ServiceProtocol, SubscriptionToken
+from app.query_stats import query_budget
 
+
+def test_user_and_service_crud(client, admin_headers):
     # Create user
     user_payload = {"email": "user@example.com", "full_name": "Alice Admin", "reseller_id": None}
-    user_res = client.post("/api/users", json=user_payload, headers=headers)
+    user_res = client.post("/api/users", json=user_payload, headers=admin_headers)
     assert user_res.status_code == 201
     user_id = user_res.json()["id"]
 
     # List users
-    list_res = client.get("/api/users", headers=headers)
+    list_res = client.get("/api/users", headers=admin_headers)
     assert list_res.status_code == 200
     assert any(u["id"] == user_id for u in list_res.json()["items"])
 
@@ -24,7 +27,7 @@ def test_user_and_service_crud(client):
     update_res = client.put(
         f"/api/users/{user_id}",
         json={"email": "user2@example.com", "full_name": "Alice Updated"},
-        headers=headers,
+        headers=admin_headers,
     )
     assert update_res.status_code == 200
     assert update_res.json()["email"] == "user2@example.com"
@@ -37,12 +40,12 @@ def test_user_and_service_crud(client):
         "protocol": ServiceProtocol.XRAY_VLESS.value,
         "endpoint": "vpn.example.com:443",
     }
-    service_res = client.post("/api/services", json=service_payload, headers=headers)
+    service_res = client.post("/api/services", json=service_payload, headers=admin_headers)
     assert service_res.status_code == 201
     service_id = service_res.json()["id"]
 
     # Token generation
-    token_res = client.post(f"/api/services/{service_id}/token", headers=headers)
+    token_res = client.post(f"/api/services/{service_id}/token", headers=admin_headers)
     assert token_res.status_code == 200
     assert token_res.json()["service_id"] == service_id
 
@@ -50,20 +53,258 @@ def test_user_and_service_crud(client):
     update_service_res = client.put(
         f"/api/services/{service_id}",
         json={"name": "Core VPN Updated", "protocol": ServiceProtocol.XRAY_VLESS.value, "endpoint": "vpn.example.com:8443"},
-        headers=headers,
+        headers=admin_headers,
     )
     assert update_service_res.status_code == 200
     assert update_service_res.json()["name"] == "Core VPN Updated"
 
     # List services
-    services_list = client.get("/api/services", headers=headers)
+    services_list = client.get("/api/services", headers=admin_headers)
     assert services_list.status_code == 200
     assert any(s["id"] == service_id for s in services_list.json()["items"])
 
     # Delete service
-    del_res = client.delete(f"/api/services/{service_id}", headers=headers)
+    del_res = client.delete(f"/api/services/{service_id}", headers=admin_headers)
     assert del_res.status_code == 204
 
     # Delete user
-    del_user = client.delete(f"/api/users/{user_id}", headers=headers)
+    del_user = client.delete(f"/api/users/{user_id}", headers=admin_headers)
     assert del_user.status_code == 204
+
+
+def test_user_and_service_search_filter_and_sort(client, db_session, admin_headers):
+    alice = crud.create_user(db_session, email="alice@search.test", full_name="Alice Zephyr", reseller_id=None)
+    bob = crud.create_user(db_session, email="bob@search.test", full_name="Bob 100%", reseller_id=None)
+    now = datetime.utcnow()
+    heavy = crud.create_service(
+        db_session,
+        name="Heavy",
+        user_id=alice.id,
+        reseller_id=None,
+        protocol=ServiceProtocol.XRAY_VLESS,
+        endpoint="fra.search.test:443",
+        traffic_limit_bytes=1000,
+        expires_at=now + timedelta(days=2),
+    )
+    crud.update_usage(db_session, heavy, traffic_used_bytes=900)
+    light = crud.create_service(
+        db_session,
+        name="Light",
+        user_id=bob.id,
+        reseller_id=None,
+        protocol=ServiceProtocol.XRAY_VLESS,
+        endpoint="ams.search.test:443",
+        traffic_limit_bytes=1000,
+        expires_at=now + timedelta(days=40),
+        is_active=False,
+    )
+    carol = crud.create_user(db_session, email="carol@unlimited.test", full_name="Carol", reseller_id=None)
+    unlimited = crud.create_service(
+        db_session,
+        name="Unlimited",
+        user_id=carol.id,
+        reseller_id=None,
+        protocol=ServiceProtocol.XRAY_VLESS,
+        endpoint="unl.search.test:443",
+        traffic_limit_bytes=None,
+    )
+
+    res = client.get("/api/users", params={"q": "zephyr"}, headers=admin_headers)
+    assert [u["id"] for u in res.json()["items"]] == [alice.id]
+    # LIKE wildcards in the search term are matched literally.
+    res = client.get("/api/users", params={"q": "100%"}, headers=admin_headers)
+    assert [u["id"] for u in res.json()["items"]] == [bob.id]
+    res = client.get("/api/users", params={"q": "search.test", "sort": "-email"}, headers=admin_headers)
+    assert [u["id"] for u in res.json()["items"]] == [bob.id, alice.id]
+
+    res = client.get("/api/services", params={"q": "FRA.search"}, headers=admin_headers)
+    assert [s["id"] for s in res.json()["items"]] == [heavy.id]
+    res = client.get("/api/services", params={"q": "search.test", "min_usage": 0.8}, headers=admin_headers)
+    assert [s["id"] for s in res.json()["items"]] == [heavy.id]
+    res = client.get("/api/services", params={"q": "search.test", "is_active": False}, headers=admin_headers)
+    assert [s["id"] for s in res.json()["items"]] == [light.id]
+    window = {"expires_after": now.isoformat(), "expires_before": (now + timedelta(days=7)).isoformat()}
+    res = client.get("/api/services", params={"q": "search.test", **window}, headers=admin_headers)
+    assert [s["id"] for s in res.json()["items"]] == [heavy.id]
+    # Unlimited services have no ratio and sort last in both directions.
+    res = client.get("/api/services", params={"q": "search.test", "sort": "-usage_ratio"}, headers=admin_headers)
+    assert [s["id"] for s in res.json()["items"]] == [heavy.id, light.id, unlimited.id]
+    res = client.get("/api/services", params={"q": "search.test", "sort": "usage_ratio"}, headers=admin_headers)
+    assert [s["id"] for s in res.json()["items"]] == [light.id, heavy.id, unlimited.id]
+
+    assert client.get("/api/services", params={"sort": "password"}, headers=admin_headers).status_code == 422
+
+
+def test_list_endpoints_stay_within_query_budget(client, db_session, admin_headers):
+    for index in range(20):
+        user = crud.create_user(db_session, email=f"budget{index}@example.com", full_name="Budget", reseller_id=None)
+        crud.create_service(
+            db_session,
+            name=f"Budget {index}",
+            user_id=user.id,
+            reseller_id=None,
+            protocol=ServiceProtocol.XRAY_VLESS,
+            endpoint=None,
+        )
+    client.get("/api/users", headers=admin_headers)  # warm the account cache
+
+    # Independent of the page size: one SELECT for the page, nothing per row.
+    with query_budget(2):
+        assert client.get("/api/users", params={"limit": 100}, headers=admin_headers).status_code == 200
+    with query_budget(2):
+        assert client.get("/api/services", params={"limit": 100}, headers=admin_headers).status_code == 200
+
+
+def test_missing_subscription_tokens_are_created_in_one_pass(db_session):
+    services = []
+    for index in range(3):
+        user = crud.create_user(db_session, email=f"legacy{index}@example.com", full_name="Legacy", reseller_id=None)
+        services.append(
+            crud.create_service(
+                db_session,
+                name="Legacy",
+                user_id=user.id,
+                reseller_id=None,
+                protocol=ServiceProtocol.XRAY_VLESS,
+                endpoint=None,
+            )
+        )
+    db_session.execute(delete(SubscriptionToken).where(SubscriptionToken.service_id.in_([s.id for s in services])))
+    db_session.commit()
+
+    # One SELECT and one INSERT batch, however many services lack a token.
+    with query_budget(5):
+        assert crud.create_missing_subscription_tokens(db_session, ServiceProtocol.XRAY_VLESS) == 3
+    assert crud.create_missing_subscription_tokens(db_session) == 0
+
+
+def test_list_fast_path_matches_response_schemas(client, db_session, monkeypatch, admin_headers):
+    assert [column.key for column in crud.USER_LIST_COLUMNS] == list(schemas.UserOut.model_fields)
+    assert [column.key for column in crud.SERVICE_LIST_COLUMNS] == list(schemas.ServiceOut.model_fields)
+
+    user = crud.create_user(db_session, email="fastpath@example.com", full_name="Fast Path", reseller_id=None)
+    service = crud.create_service(
+        db_session,
+        name="Fast Path",
+        user_id=user.id,
+        reseller_id=None,
+        protocol=ServiceProtocol.XRAY_VLESS,
+        endpoint="fast.example.com:443",
+        traffic_limit_bytes=10,
+    )
+
+    users = client.get("/api/users", params={"q": "fastpath@"}, headers=admin_headers).json()["items"]
+    assert users == [schemas.UserOut.from_orm(user).model_dump(mode="json")]
+    services = client.get("/api/services", params={"q": "fast.example"}, headers=admin_headers).json()["items"]
+    assert services == [schemas.ServiceOut.from_orm(service).model_dump(mode="json")]
+
+    # Postgres returns aware datetimes; they must keep pydantic's "Z" rather than orjson's "+00:00".
+    aware = dict(crud.list_user_rows(db_session, 1, 0, search="fastpath@")[0])
+    aware["created_at"] = datetime(2024, 5, 1, 12, tzinfo=timezone.utc)
+    monkeypatch.setattr(crud, "list_user_rows", lambda *args, **kwargs: [aware])
+    users = client.get("/api/users", headers=admin_headers).json()["items"]
+    assert users == [schemas.UserOut(**aware).model_dump(mode="json")]
+    assert users[0]["created_at"] == "2024-05-01T12:00:00Z"
+
+
+def test_streaming_exports_respect_reseller_scope(client, db_session, admin_headers, reseller_headers):
+    reseller_id = crud.get_reseller_by_username(db_session, "reseller").id
+    for index in range(5):
+        owner = reseller_id if index % 2 else None
+        user = crud.create_user(db_session, email=f"export{index}@example.com", full_name=f"Export {index}", reseller_id=owner)
+        crud.create_service(
+            db_session, name=f"Export {index}", user_id=user.id, reseller_id=owner,
+            protocol=ServiceProtocol.XRAY_VLESS, endpoint=None,
+        )
+
+    batches = list(exports.stream_rows(db_session, crud.user_export_stmt(search="export"), batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+
+    res = client.get("/api/users/export", params={"q": "export"}, headers=admin_headers)
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line)["email"] for line in res.text.splitlines()] == [f"export{i}@example.com" for i in range(5)]
+
+    res = client.get("/api/users/export", params={"q": "export", "reseller_id": 999}, headers=reseller_headers)
+    assert {json.loads(line)["reseller_id"] for line in res.text.splitlines()} == {reseller_id}
+
+    res = client.get("/api/services/export", params={"q": "Export", "format": "csv"}, headers=reseller_headers)
+    assert res.headers["content-disposition"] == 'attachment; filename="services.csv"'
+    rows = list(csv.DictReader(io.StringIO(res.text)))
+    assert [row["name"] for row in rows] == ["Export 1", "Export 3"]
+    assert rows[0]["protocol"] == "XRAY_VLESS"
+
+    empty = client.get("/api/services/export", params={"q": "nothing-matches", "format": "csv"}, headers=admin_headers)
+    assert empty.text.splitlines() == [",".join(column.key for column in crud.SERVICE_LIST_COLUMNS)]
+
+
+def test_bulk_service_operations(
+    client, db_session, monkeypatch, settings_env, tmp_path, admin_headers, reseller_headers
+):
+    settings_env(XRAY_CONFIG_PATH=str(tmp_path / "config.json"), XRAY_RELOAD_COMMAND="")
+    applies = []
+    apply_xray_config = xray.apply_xray_config
+    monkeypatch.setattr(xray, "apply_xray_config", lambda *args: applies.append(1) or apply_xray_config(*args))
+
+    reseller_id = crud.get_reseller_by_username(db_session, "reseller").id
+    services = []
+    for index in range(6):
+        owner = reseller_id if index % 2 else None
+        user = crud.create_user(db_session, email=f"bulk{index}@example.com", full_name="Bulk", reseller_id=owner)
+        service = crud.create_service(
+            db_session, name=f"Bulk {index}", user_id=user.id, reseller_id=owner,
+            protocol=ServiceProtocol.XRAY_VLESS, endpoint=None,
+        )
+        crud.add_usage(db_session, service, 100)
+        services.append(service)
+    ids = [service.id for service in services]
+    stats_before = reseller_stats.get_stats(db_session, reseller_id)
+    traffic_before, active_before = stats_before.traffic_used_bytes, stats_before.active_services_count
+
+    assert client.post("/api/services/bulk/reset-usage", json={}, headers=admin_headers).status_code == 400
+
+    # A reseller's filter is pinned to their own services, whatever reseller_id it names.
+    with query_budget(12):
+        res = client.post(
+            "/api/services/bulk/reset-usage", json={"filter": {"q": "Bulk", "reseller_id": 999}}, headers=reseller_headers
+        )
+    assert res.json() == {"matched": 3, "updated": 3, "config_apply": None}
+    db_session.expire_all()
+    assert [s.traffic_used_bytes for s in services] == [100, 0, 100, 0, 100, 0]
+    assert reseller_stats.get_stats(db_session, reseller_id).traffic_used_bytes == traffic_before - 300
+
+    res = client.post("/api/services/bulk/extend-expiry", json={"service_ids": ids[:2], "days": 30}, headers=admin_headers)
+    assert res.json()["updated"] == 2
+    db_session.expire_all()
+    expected = datetime.utcnow() + timedelta(days=30)
+    assert all(abs(s.expires_at.replace(tzinfo=None) - expected) < timedelta(minutes=1) for s in services[:2])
+    assert services[2].expires_at is None
+
+    # Disabling a batch applies the Xray config once and drops the services from it.
+    res = client.post(
+        "/api/services/bulk/set-active", json={"service_ids": ids[:4], "is_active": False}, headers=admin_headers
+    )
+    assert res.json()["updated"] == 4 and res.json()["config_apply"]["status"] == "written"
+    assert len(applies) == 1
+    clients = {entry["email"] for entry in xray._collect_vless_clients(db_session)}
+    assert clients.isdisjoint(s.subscription_token.stats_key for s in services[:4])
+    assert services[4].subscription_token.stats_key in clients
+    assert reseller_stats.get_stats(db_session, reseller_id).active_services_count == active_before - 2
+    res = client.post(
+        "/api/services/bulk/set-active", json={"service_ids": ids[:4], "is_active": False}, headers=admin_headers
+    )
+    assert res.json() == {"matched": 4, "updated": 0, "config_apply": None}
+    assert len(applies) == 1
+    entries = query_audit_logs(db_session, actor="admin", action="services.bulk_set_active", limit=10)
+    assert [entry.detail for entry in entries] == ["is_active=False updated=0", "is_active=False updated=4"]
+
+    node = Node(name="edge", location="eu", ip_address="10.0.0.1", api_base_url="http://edge", auth_token_hash="x")
+    db_session.add(node)
+    db_session.commit()
+    payload = {"service_ids": ids, "node_id": node.id}
+    assert client.post("/api/services/bulk/assign-node", json=payload, headers=reseller_headers).status_code == 403
+    res = client.post("/api/services/bulk/assign-node", json=payload, headers=admin_headers)
+    assert res.json()["updated"] == 6
+    db_session.expire_all()
+    assert db_session.query(ServiceNode).filter(ServiceNode.service_id.in_(ids)).count() == 6
+    assert {s.revision for s in db_session.query(Service).filter(Service.id.in_(ids))} == {2}
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete
+from sqlalchemy.orm import sessionmaker
+
+from app.audit import AuditWriter, encode_cursor, query_audit_logs
+from app.models import AuditLog
+
+
+def test_audit_writer_batches_and_drains_on_stop(db_engine, db_session):
+    db_session.execute(delete(AuditLog))
+    db_session.commit()
+    writer = AuditWriter(sessionmaker(bind=db_engine, future=True), batch_size=2, flush_interval=0.05)
+    writer.start()
+    for i in range(5):
+        writer.record("admin", "backup_create", f"archive-{i}")
+    writer.record("reseller", "backup_upload", "upload")
+    writer.stop()
+
+    assert len(query_audit_logs(db_session, limit=100)) == 6
+    by_actor = query_audit_logs(db_session, actor="admin", action="backup_create", limit=100)
+    assert {e.detail for e in by_actor} == {f"archive-{i}" for i in range(5)}
+    future = datetime.now(timezone.utc) + timedelta(hours=1)
+    assert query_audit_logs(db_session, since=future, limit=100) == []
+
+
+def test_audit_query_cursor_pagination(db_session):
+    db_session.execute(delete(AuditLog))
+    base = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    db_session.add_all(
+        [AuditLog(actor="admin", action="login", detail=str(i), created_at=base + timedelta(minutes=i)) for i in range(5)]
+    )
+    db_session.commit()
+
+    first = query_audit_logs(db_session, limit=3)
+    assert [e.detail for e in first] == ["4", "3", "2"]
+    rest = query_audit_logs(db_session, limit=3, cursor=encode_cursor(first[-1]))
+    assert [e.detail for e in rest] == ["1", "0"]
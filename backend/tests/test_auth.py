@@ -1,12 +1,4 @@
-from fastapi.testclient import TestClient
-
-from app.main import app
-
-
-client = TestClient(app)
-
-
-def test_login_and_me_round_trip() -> None:
+def test_login_and_me_round_trip(client) -> None:
     login_payload = {"username": "admin", "password": "changeme", "role_tab": "ADMIN"}
     response = client.post("/auth/login", json=login_payload)
     assert response.status_code == 200
@@ -22,6 +14,98 @@ def test_login_and_me_round_trip() -> None:
     assert me["role"] == "ADMIN"
 
 
-def test_login_rejects_wrong_role() -> None:
+def test_login_rejects_wrong_role(client) -> None:
     response = client.post("/auth/login", json={"username": "admin", "password": "changeme", "role_tab": "RESELLER"})
     assert response.status_code == 401
+
+
+def test_login_rehashes_password_created_with_old_cost(db_session) -> None:
+    import asyncio
+
+    from passlib.context import CryptContext
+    from sqlalchemy import select
+
+    from app.auth import user_store
+    from app.models import PanelAccount, Role
+    from app.schemas import Role as SchemaRole
+
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("s3cret")
+    db_session.add(PanelAccount(username="legacy-admin", password_hash=old_hash, role=Role.ADMIN))
+    db_session.commit()
+
+    user = asyncio.run(user_store.authenticate(db_session, "legacy-admin", "s3cret", SchemaRole.ADMIN))
+    assert user is not None and user.username == "legacy-admin"
+    stored = db_session.scalar(select(PanelAccount.password_hash).where(PanelAccount.username == "legacy-admin"))
+    assert stored != old_hash
+    assert not stored.startswith("$2b$04$")
+
+
+def test_password_hash_pool_sheds_when_saturated() -> None:
+    import asyncio
+
+    import pytest
+    from fastapi import HTTPException
+
+    from app.security import PasswordHashPool
+
+    pool = PasswordHashPool(workers=1, max_pending=1)
+
+    async def _saturate():
+        pool._slots.acquire()
+        try:
+            await pool.run(lambda: None)
+        finally:
+            pool._slots.release()
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(_saturate())
+    assert exc.value.status_code == 503
+
+
+def test_verified_token_cache_skips_repeat_signature_checks(db_session, monkeypatch) -> None:
+    from starlette.requests import Request
+
+    import app.auth as auth
+    from app.security import create_access_token
+
+    calls = []
+    real_decode = auth.decode_token
+    monkeypatch.setattr(auth, "decode_token", lambda token: calls.append(token) or real_decode(token))
+    monkeypatch.setattr(auth, "is_token_revoked", lambda digest: False)
+    # A login earlier in the same second mints an identical JWT that is already cached.
+    auth._token_cache().clear()
+    token = create_access_token(subject="admin", role="ADMIN")
+    request = Request({"type": "http", "headers": [(b"authorization", f"Bearer {token}".encode())]})
+
+    assert auth.get_current_user(request, db_session).username == "admin"
+    assert auth.get_current_user(request, db_session).username == "admin"
+    assert len(calls) == 1
+
+    auth.user_store.invalidate("admin")
+    assert auth.get_current_user(request, db_session).username == "admin"
+    assert len(calls) == 2
+
+
+def test_logout_without_redis_still_clears_the_session(client, admin_headers, monkeypatch, caplog) -> None:
+    import redis
+
+    import app.security as security
+
+    class _Down:
+        def set(self, *args, **kwargs):
+            raise redis.ConnectionError("down")
+
+        exists = set
+
+    monkeypatch.setattr(security, "_get_redis", lambda: _Down())
+    monkeypatch.setattr(security, "_redis_warned_at", {})
+
+    response = client.post("/auth/logout", headers=admin_headers)
+    assert response.status_code == 204
+    assert 'access_token=""' in response.headers["set-cookie"]
+
+    for _ in range(3):
+        assert security.is_token_revoked("digest") is False
+    warnings = [record.getMessage() for record in caplog.records if record.name == "app.security"]
+    assert warnings.count("Revocation check unavailable") == 1
+    assert warnings.count("Token revocation not persisted") == 1
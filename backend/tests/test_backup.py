@@ -0,0 +1,197 @@
+import os
+import sys
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app import backup
+from app.backup import _parse_progress_line, _run_with_progress
+from app.config import Settings
+
+# Verbose output of a parallel restore (pg_restore -v -j 2), in pg_restore's own message formats.
+PG_RESTORE_OUTPUT = """\
+pg_restore: connecting to database for restore
+pg_restore: processing item 3421 ENCODING ENCODING
+pg_restore: creating TABLE "public.audit_logs"
+pg_restore: creating TABLE "public.users"
+pg_restore: creating TABLE "archive.users"
+pg_restore: entering main parallel loop
+pg_restore: launching item 3344 TABLE DATA audit_logs
+pg_restore: launching item 3346 TABLE DATA users
+pg_restore: launching item 3348 TABLE DATA users
+pg_restore: processing data for table "public.users"
+pg_restore: processing data for table "archive.users"
+pg_restore: finished item 3346 TABLE DATA users
+pg_restore: finished item 3348 TABLE DATA users
+pg_restore: finished item 3344 TABLE DATA audit_logs
+pg_restore: launching item 3360 INDEX ix_users_full_name
+pg_restore: finished item 3360 INDEX ix_users_full_name
+pg_restore: finished main parallel loop
+"""
+
+
+def test_parse_progress_line_handles_dump_and_restore_output():
+    assert _parse_progress_line('pg_dump: dumping contents of table "public.users"\n') == "public.users"
+    assert _parse_progress_line('pg_restore: processing data for table "public.services"') == "public.services"
+    assert _parse_progress_line("pg_restore: finished item 3344 TABLE DATA audit_logs") == "audit_logs"
+    assert _parse_progress_line("pg_restore: launching item 3344 TABLE DATA audit_logs") is None
+    assert _parse_progress_line("pg_restore: finished item 3360 INDEX ix_users_full_name") is None
+    assert _parse_progress_line("pg_restore: creating TABLE \"public.users\"") is None
+
+
+def test_restore_progress_counts_each_table_once():
+    cmd = [sys.executable, "-c", f"import sys; sys.stderr.write({PG_RESTORE_OUTPUT!r})"]
+    reported = []
+    seen = _run_with_progress(cmd, "restore", lambda *args: reported.append(args), total=3)
+    assert seen == ["public.users", "archive.users", "audit_logs"]
+    assert reported == [
+        ("restore", "public.users", 1, 3),
+        ("restore", "archive.users", 2, 3),
+        ("restore", "audit_logs", 3, 3),
+    ]
+
+
+def _build_archive(members: dict[str, bytes]) -> bytes:
+    import io
+    import tarfile
+
+    raw = io.BytesIO()
+    with tarfile.open(fileobj=raw, mode="w:gz") as tar:
+        for name, payload in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(payload)
+            tar.addfile(info, io.BytesIO(payload))
+    return raw.getvalue()
+
+
+def test_stream_validator_accepts_archive_fed_in_small_chunks():
+    from app.backup import _ArchiveStreamValidator
+
+    archive = _build_archive(
+        {"db/toc.dat": b"x" * 5000, "settings.json": b"{}", "version.json": b'{"alembic_revision": "head"}'}
+    )
+    validator = _ArchiveStreamValidator()
+    for start in range(0, len(archive), 37):
+        validator.feed(archive[start : start + 37])
+    assert validator.finish() == {"alembic_revision": "head"}
+    assert "db/toc.dat" in validator.members
+
+
+def test_stream_validator_rejects_unsafe_and_truncated_archives():
+    import pytest
+    from fastapi import HTTPException
+
+    from app.backup import _ArchiveStreamValidator
+
+    validator = _ArchiveStreamValidator()
+    with pytest.raises(HTTPException):
+        validator.feed(_build_archive({"../escape": b"boom"}))
+
+    archive = _build_archive({"db.dump": b"x" * 4096, "version.json": b"{}"})
+    validator = _ArchiveStreamValidator()
+    validator.feed(archive[: len(archive) // 2])
+    with pytest.raises(HTTPException):
+        validator.finish()
+
+
+def test_stale_uploads_are_swept_with_their_files_and_state(tmp_path):
+    settings = Settings(backup_dir=str(tmp_path), backup_upload_ttl_seconds=3600)
+    stale = backup.start_upload(settings, total_size=10, sha256="0" * 64)["id"]
+    fresh = backup.start_upload(settings, total_size=10, sha256="0" * 64)["id"]
+    uploads = tmp_path / "uploads"
+    backup._upload_lock(stale)
+    an_hour_ago = time.time() - 2 * 3600
+    for suffix in (".part", ".json"):
+        os.utime(uploads / f"{stale}{suffix}", (an_hour_ago, an_hour_ago))
+
+    assert backup.sweep_stale_uploads(settings) == 1
+    assert sorted(path.name for path in uploads.iterdir()) == [f"{fresh}.json", f"{fresh}.part"]
+    assert stale not in backup._upload_locks
+    with pytest.raises(HTTPException) as excinfo:
+        backup.append_upload_chunk(settings, stale, offset=0, data=b"x", chunk_sha256=None)
+    assert excinfo.value.status_code == 404
+    backup.abort_upload(settings, fresh)
+    assert list(uploads.iterdir()) == []
+
+
+
+def test_concurrent_chunks_at_one_offset_append_once(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    archive = _build_archive({"db/toc.dat": os.urandom(4000), "version.json": b'{"alembic_revision": "head"}'})
+    settings = Settings(backup_dir=str(tmp_path))
+    upload_id = backup.start_upload(settings, total_size=len(archive), sha256="0" * 64)["id"]
+
+    def append():
+        try:
+            return backup.append_upload_chunk(settings, upload_id, offset=0, data=archive[:1000], chunk_sha256=None)
+        except HTTPException as exc:
+            return exc.status_code
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: append(), range(4)))
+    assert results.count(409) == 3
+    assert backup.get_upload_status(settings, upload_id)["offset"] == 1000
+    backup.abort_upload(settings, upload_id)
+
+
+class _AdminConnection:
+    """Records admin statements and fails the first one containing ``fail_on``."""
+
+    def __init__(self, statements: list[str], fail_on: str) -> None:
+        self.statements = statements
+        self.fail_on = fail_on
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, clause, params=None):
+        self.statements.append(str(clause))
+        if self.fail_on in self.statements[-1]:
+            raise RuntimeError("rename failed")
+
+
+def test_failed_swap_renames_the_live_database_back_and_reopens_it(monkeypatch):
+    from types import SimpleNamespace
+
+    from sqlalchemy.dialects import postgresql
+
+    statements: list[str] = []
+    admin_engine = SimpleNamespace(
+        dialect=postgresql.dialect(),
+        connect=lambda: _AdminConnection(statements, "panel_restore_staging RENAME"),
+        dispose=lambda: None,
+    )
+    monkeypatch.setattr(backup, "create_engine", lambda *args, **kwargs: admin_engine)
+    monkeypatch.setattr(backup, "_pg_restore", lambda *args: None)
+    monkeypatch.setattr(backup, "get_engine", lambda: SimpleNamespace(dispose=lambda: None))
+    settings = Settings(database_url="postgresql+psycopg2://app@db/panel")
+
+    with pytest.raises(RuntimeError):
+        backup._restore_via_staging(settings, "dump", SimpleNamespace(invalidate=lambda: None), None)
+
+    swap = statements[statements.index("ALTER DATABASE panel ALLOW_CONNECTIONS false") :]
+    previous = swap[2].rsplit(" ", 1)[1]
+    assert swap[2:] == [
+        f"ALTER DATABASE panel RENAME TO {previous}",
+        "ALTER DATABASE panel_restore_staging RENAME TO panel",
+        f"ALTER DATABASE {previous} RENAME TO panel",
+        "ALTER DATABASE panel ALLOW_CONNECTIONS true",
+    ]
+
+
+def test_unsized_chunk_over_the_limit_is_rejected(client, admin_headers, settings_env, tmp_path):
+    settings_env(BACKUP_DIR=str(tmp_path), BACKUP_UPLOAD_CHUNK_MAX_BYTES="1024")
+    payload = {"total_size": 4096, "sha256": "0" * 64}
+    upload_id = client.post("/api/backups/uploads", json=payload, headers=admin_headers).json()["id"]
+
+    # A generator body is sent chunked, without a Content-Length to check up front.
+    res = client.put(
+        f"/api/backups/uploads/{upload_id}?offset=0", content=(b"x" * 512 for _ in range(4)), headers=admin_headers
+    )
+    assert res.status_code == 413
+    assert client.get(f"/api/backups/uploads/{upload_id}", headers=admin_headers).json()["offset"] == 0
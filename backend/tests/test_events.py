@@ -0,0 +1,73 @@
+import json
+
+from app import crud, events
+from app.events import EventKind, InvalidationBus, InvalidationEvent, emit
+from app.models import ServiceProtocol
+
+
+def _recording_bus(monkeypatch):
+    bus = InvalidationBus("test:invalidations")
+    seen = []
+    for kind in EventKind:
+        bus.on(kind, lambda key, kind=kind: seen.append((kind, key)))
+    monkeypatch.setattr(events, "invalidation_bus", bus)
+    return bus, seen
+
+
+def test_events_dispatch_on_commit_only(db_session, monkeypatch):
+    _, seen = _recording_bus(monkeypatch)
+
+    emit(db_session, EventKind.ACCOUNT_CHANGED, "dropped")
+    db_session.rollback()
+    assert seen == []
+
+    emit(db_session, EventKind.ACCOUNT_CHANGED, "kept")
+    assert seen == []
+    db_session.commit()
+    assert seen == [(EventKind.ACCOUNT_CHANGED, "kept")]
+
+    db_session.commit()
+    assert seen == [(EventKind.ACCOUNT_CHANGED, "kept")]
+
+
+def test_crud_mutations_emit_precise_events(db_session, monkeypatch):
+    _, seen = _recording_bus(monkeypatch)
+    user = crud.create_user(db_session, email="bus@example.com", full_name="Bus", reseller_id=None)
+    service = crud.create_service(
+        db_session, name="Bus", user_id=user.id, reseller_id=None, protocol=ServiceProtocol.XRAY_VLESS, endpoint=None
+    )
+    token = service.subscription_token.token
+    assert seen == [(EventKind.TOKEN_CREATED, token)]
+
+    crud.update_service(db_session, service, name="Bus 2", protocol=ServiceProtocol.XRAY_VLESS, endpoint=None)
+    crud.delete_service(db_session, service)
+    assert seen[1:] == [(EventKind.SUBSCRIPTION_CHANGED, token), (EventKind.SUBSCRIPTION_DELETED, token)]
+
+
+def test_bus_messages_from_other_workers_are_applied():
+    bus = InvalidationBus("test:invalidations")
+    seen, flushed = [], []
+    bus.on(EventKind.SUBSCRIPTION_CHANGED, seen.append)
+    bus.on_flush(lambda: flushed.append(True))
+
+    bus._handle_message(json.dumps({"origin": "other", "events": [["subscription.changed", "abc"]]}).encode())
+    bus._handle_message(json.dumps({"origin": bus.origin, "events": [["subscription.changed", "own"]]}).encode())
+    bus._handle_message(b"not json")
+    bus._handle_message(json.dumps({"origin": "other", "events": [["unknown.kind", "x"]]}).encode())
+    assert seen == ["abc"]
+
+    bus.flush_all()
+    assert flushed == [True]
+
+
+def test_failing_handler_does_not_block_others():
+    bus = InvalidationBus("test:invalidations")
+    seen = []
+
+    def broken(_):
+        raise RuntimeError("boom")
+
+    bus.on(EventKind.JWT_REVOKED, broken)
+    bus.on(EventKind.JWT_REVOKED, seen.append)
+    bus.publish([InvalidationEvent(EventKind.JWT_REVOKED, "digest")])
+    assert seen == ["digest"]
@@ -0,0 +1,96 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from pydantic import ValidationError
+
+from app.config import Settings
+from app.load_shedding import PROTECTED, SUBSCRIPTION, ConcurrencyLimiter, GradientLimit, LoadSheddingMiddleware, route_class
+from app.main import create_app
+
+
+def test_gradient_limit_grows_when_fast_and_backs_off_when_latency_climbs():
+    limit = GradientLimit(20, 5, 100)
+    for _ in range(200):
+        limit.update(0.010, inflight=int(limit.value))
+    assert limit.value == 100
+
+    for _ in range(200):
+        limit.update(0.200, inflight=int(limit.value))
+    assert limit.value < 30
+
+    # An idle period must not inflate the limit.
+    idle = GradientLimit(20, 5, 100)
+    for _ in range(200):
+        idle.update(0.010, inflight=1)
+    assert idle.value == 20
+
+
+def test_route_classes():
+    assert route_class("/sub/abc") == SUBSCRIPTION
+    assert route_class("/sub/abc/qr") == SUBSCRIPTION
+    assert route_class("/api/users") == PROTECTED
+    assert route_class("/auth/login") == PROTECTED
+    assert route_class("/health") is None
+
+
+def test_excess_subscription_requests_are_shed_while_admin_keeps_capacity():
+    # Limit pinned at 5 with a 20% protected share: 4 subscription slots.
+    limiter = ConcurrencyLimiter(GradientLimit(5, 5, 5), protected_share=0.2, retry_after_seconds=3)
+    release = asyncio.Event()
+    app = FastAPI()
+
+    @app.get("/sub/{token}")
+    async def subscription(token: str) -> dict:
+        await release.wait()
+        return {"token": token}
+
+    @app.get("/api/ping")
+    async def ping() -> dict:
+        return {"ok": True}
+
+    app.add_middleware(LoadSheddingMiddleware, limiter=limiter)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            pending = [asyncio.create_task(client.get(f"/sub/t{i}")) for i in range(4)]
+            while limiter.stats()["classes"][SUBSCRIPTION]["inflight"] < 4:
+                await asyncio.sleep(0.01)
+            shed = await asyncio.gather(*(client.get(f"/sub/x{i}") for i in range(3)))
+            admin = await client.get("/api/ping")
+            release.set()
+            return await asyncio.gather(*pending), shed, admin
+
+    served, shed, admin = asyncio.run(scenario())
+    assert [res.status_code for res in served] == [200] * 4
+    assert [res.status_code for res in shed] == [503] * 3
+    assert all(3 <= int(res.headers["retry-after"]) <= 6 for res in shed)
+    assert admin.status_code == 200
+
+    stats = limiter.stats()["classes"]
+    assert stats[SUBSCRIPTION] | {"latency_ms": 0} == {
+        "inflight": 0, "peak_inflight": 4, "served": 4, "shed": 3, "latency_ms": 0
+    }
+    assert stats[PROTECTED]["served"] == 1
+
+
+def test_subscription_capacity_is_capped_by_threadpool_and_db_pool():
+    settings = Settings(
+        concurrency_limit_initial=400, concurrency_limit_min=400, concurrency_limit_max=400,
+        threadpool_size=40, db_pool_size=5, db_max_overflow=15, concurrency_protected_share=0.25,
+    )
+    limiter = ConcurrencyLimiter.from_settings(settings)
+    # 400 * 0.75 would allow 300 /sub requests; only 20 connections exist, 5 of them kept for the panel.
+    assert limiter.subscription_capacity() == 15
+
+    with pytest.raises(ValidationError):
+        Settings(concurrency_protected_share=1.0)
+    with pytest.raises(ValueError):
+        ConcurrencyLimiter(GradientLimit(5, 5, 5), protected_share=-0.1, retry_after_seconds=1)
+
+
+def test_create_app_builds_its_limiter_from_the_given_settings():
+    app = create_app(Settings(concurrency_limit_initial=12, concurrency_limit_min=8, concurrency_limit_max=16))
+    assert app.state.concurrency_limiter.limit.value == 12
+    assert not hasattr(create_app(Settings(load_shedding_enabled=False)).state, "concurrency_limiter")
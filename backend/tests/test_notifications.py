@@ -0,0 +1,117 @@
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app.models import NotificationEvent
+from app.notifications import FileSink, OutboxDispatcher, enqueue
+
+
+class FlakySink:
+    name = "flaky"
+
+    def __init__(self, failures: int) -> None:
+        self.failures = failures
+        self.batches = []
+
+    def deliver(self, events):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("sink down")
+        self.batches.append([event["id"] for event in events])
+
+
+def _pending(db_session):
+    return db_session.scalars(select(NotificationEvent).where(NotificationEvent.processed_at.is_(None))).all()
+
+
+def _drain(db_session):
+    for event in _pending(db_session):
+        db_session.delete(event)
+    db_session.commit()
+
+
+def test_dispatcher_delivers_batches_to_file(db_session, tmp_path):
+    _drain(db_session)
+    for index in range(5):
+        enqueue(db_session, "test.event", {"n": index})
+    db_session.commit()
+
+    path = tmp_path / "outbox.jsonl"
+    dispatcher = OutboxDispatcher([FileSink(str(path))], batch_size=3)
+    assert dispatcher.dispatch_once(db_session) == 3
+    assert dispatcher.dispatch_once(db_session) == 2
+    assert dispatcher.dispatch_once(db_session) == 0
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["payload"]["n"] for line in lines] == [0, 1, 2, 3, 4]
+    assert _pending(db_session) == []
+
+
+def test_failed_batches_back_off_then_dead_letter(db_session):
+    _drain(db_session)
+    enqueue(db_session, "test.retry", {"n": 1})
+    db_session.commit()
+
+    sink = FlakySink(failures=1)
+    dispatcher = OutboxDispatcher([sink], base_backoff=60, max_attempts=2)
+    assert dispatcher.dispatch_once(db_session) == 1
+    event = _pending(db_session)[0]
+    db_session.refresh(event)
+    assert event.attempts == 1 and "sink down" in event.last_error
+    assert event.next_attempt_at.replace(tzinfo=None) > datetime.utcnow() + timedelta(seconds=30)
+    # Not due yet.
+    assert dispatcher.dispatch_once(db_session) == 0
+
+    event.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db_session.commit()
+    assert dispatcher.dispatch_once(db_session) == 1
+    assert sink.batches == [[event.id]]
+    assert _pending(db_session) == []
+
+    enqueue(db_session, "test.dead", {"n": 2})
+    db_session.commit()
+    dead_sink = FlakySink(failures=10)
+    dispatcher = OutboxDispatcher([dead_sink], base_backoff=0, max_attempts=2)
+    dispatcher.dispatch_once(db_session)
+    dispatcher.dispatch_once(db_session)
+    dead = db_session.scalar(select(NotificationEvent).where(NotificationEvent.type == "test.dead"))
+    db_session.refresh(dead)
+    assert dead.attempts == 2 and dead.processed_at is not None and dead.last_error
+
+
+class PoisonSink:
+    name = "poison"
+
+    def __init__(self, poison: set[int]) -> None:
+        self.poison = poison
+        self.delivered = []
+
+    def deliver(self, events):
+        if any(event["id"] in self.poison for event in events):
+            raise ValueError("cannot encode")
+        self.delivered.extend(event["id"] for event in events)
+
+
+def test_poison_event_is_isolated_and_dead_lettered_on_its_own_attempts(db_session):
+    _drain(db_session)
+    for index in range(3):
+        enqueue(db_session, "test.poison", {"n": index})
+    db_session.commit()
+    events = _pending(db_session)
+    # The first event has failed before; the others are fresh.
+    events[0].attempts = 1
+    db_session.commit()
+    ids = [event.id for event in events]
+
+    sink = PoisonSink({ids[0], ids[1]})
+    dispatcher = OutboxDispatcher([sink], base_backoff=60, max_attempts=2)
+    assert dispatcher.dispatch_once(db_session) == 3
+    assert sink.delivered == [ids[2]]
+
+    for event in events:
+        db_session.refresh(event)
+    assert events[0].attempts == 2 and events[0].processed_at is not None
+    assert events[1].attempts == 1 and events[1].processed_at is None
+    assert events[1].next_attempt_at.replace(tzinfo=None) > datetime.utcnow() + timedelta(seconds=30)
+    assert events[2].attempts == 0 and events[2].processed_at is not None
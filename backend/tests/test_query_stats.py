@@ -0,0 +1,47 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app.models import User
+from app.query_stats import QueryStatsMiddleware, query_budget, track
+
+
+def test_track_counts_statements_and_flags_repeats(db_session):
+    with track() as stats:
+        for _ in range(5):
+            db_session.execute(select(User).where(User.id == 1)).all()
+    assert stats.count == 5
+    assert stats.total_ms > 0
+    assert list(stats.repeated().values()) == [5]
+
+
+def test_query_budget_fails_with_statements(db_session):
+    with query_budget(2) as stats:
+        db_session.execute(select(User)).all()
+    assert stats.count == 1
+
+    with pytest.raises(AssertionError, match="Query budget of 1 exceeded"):
+        with query_budget(1):
+            db_session.execute(select(User)).all()
+            db_session.execute(select(User.id)).all()
+
+
+def test_middleware_exposes_counts_in_debug_mode(db_session):
+    app = FastAPI()
+
+    @app.get("/probe")
+    def probe() -> dict:
+        db_session.execute(select(User)).all()
+        db_session.execute(select(User.id)).all()
+        return {}
+
+    app.add_middleware(QueryStatsMiddleware, expose_header=True)
+    response = TestClient(app).get("/probe")
+    assert response.headers["x-query-count"] == "2"
+    assert float(response.headers["x-query-time-ms"]) >= 0
+
+    quiet = FastAPI()
+    quiet.add_api_route("/probe", probe)
+    quiet.add_middleware(QueryStatsMiddleware)
+    assert "x-query-count" not in TestClient(quiet).get("/probe").headers
@@ -0,0 +1,61 @@
+from sqlalchemy import update
+
+from app import crud, reseller_stats
+from app.models import ResellerStats, Service, ServiceProtocol
+from app.usage import TrafficCollector
+
+
+def _counters(db_session, reseller_id):
+    stats = reseller_stats.get_stats(db_session, reseller_id)
+    return stats.users_count, stats.services_count, stats.active_services_count, stats.traffic_used_bytes
+
+
+def test_crud_mutations_maintain_reseller_stats(db_session, make_reseller):
+    reseller = make_reseller("stats-a")
+    user = crud.create_user(db_session, email="stats-a@example.com", full_name="A", reseller_id=reseller.id)
+    active = crud.create_service(
+        db_session, name="A1", user_id=user.id, reseller_id=reseller.id, protocol=ServiceProtocol.XRAY_VLESS, endpoint=None
+    )
+    other = crud.create_user(db_session, email="stats-a2@example.com", full_name="A2", reseller_id=reseller.id)
+    crud.create_service(
+        db_session,
+        name="A2",
+        user_id=other.id,
+        reseller_id=reseller.id,
+        protocol=ServiceProtocol.XRAY_VLESS,
+        endpoint=None,
+        is_active=False,
+    )
+    assert _counters(db_session, reseller.id) == (2, 2, 1, 0)
+
+    collector = TrafficCollector(db_session)
+    collector.record_usage(active, bytes_used=1500)
+    collector.record_usage(active, bytes_used=500)
+    assert active.traffic_used_bytes == 2000
+    assert _counters(db_session, reseller.id) == (2, 2, 1, 2000)
+
+    collector.reset_usage(active)
+    assert _counters(db_session, reseller.id) == (2, 2, 1, 0)
+
+    crud.delete_service(db_session, active)
+    assert _counters(db_session, reseller.id) == (2, 1, 0, 0)
+
+
+def test_reconcile_corrects_drift(db_session, make_reseller):
+    reseller = make_reseller("stats-b")
+    user = crud.create_user(db_session, email="stats-b@example.com", full_name="B", reseller_id=reseller.id)
+    service = crud.create_service(
+        db_session, name="B1", user_id=user.id, reseller_id=reseller.id, protocol=ServiceProtocol.XRAY_VLESS, endpoint=None
+    )
+    # A write that bypassed the CRUD layer.
+    db_session.execute(update(Service).where(Service.id == service.id).values(traffic_used_bytes=42))
+    db_session.execute(update(ResellerStats).where(ResellerStats.reseller_id == reseller.id).values(users_count=7))
+    db_session.commit()
+
+    assert reseller_stats.reconcile_reseller(db_session, reseller.id) is True
+    assert _counters(db_session, reseller.id) == (1, 1, 1, 42)
+    assert reseller_stats.reconcile_reseller(db_session, reseller.id) is False
+
+    empty = make_reseller("stats-c")
+    reseller_stats.reconcile_all(db_session)
+    assert _counters(db_session, empty.id) == (0, 0, 0, 0)
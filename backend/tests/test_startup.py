@@ -0,0 +1,65 @@
+"""Import-time budget for ``app.main``.
+
+Every worker boot and test run imports the app, so importing it must not
+connect to anything or load modules only a few endpoints need. The import runs
+in a fresh interpreter so modules already loaded by the test session do not
+hide the cost.
+
+Measured at about 1.4 s on a development container (FastAPI, SQLAlchemy and
+pydantic account for most of it). The budget leaves headroom for slower CI
+machines and can be overridden with ``IMPORT_BUDGET_SECONDS``.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi.routing import APIRoute
+
+IMPORT_BUDGET_SECONDS = float(os.environ.get("IMPORT_BUDGET_SECONDS", "3.0"))
+# Heavy or side-effecting modules that must only load on first use.
+DEFERRED_MODULES = ("qrcode", "PIL", "app.api", "app.backup", "app.bulk", "app.wallet", "app.tickets")
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - started
+from app import config, db
+print(json.dumps({
+    "seconds": elapsed,
+    "settings_read": config.get_settings.cache_info().currsize > 0,
+    "engine_created": db.get_engine.cache_info().currsize > 0,
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def _probe_import() -> dict:
+    env = {**os.environ, "DATABASE_URL": "postgresql+psycopg2://nobody@127.0.0.1:9/unreachable"}
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE % (DEFERRED_MODULES,)],
+        cwd=Path(__file__).resolve().parents[1],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_importing_the_app_is_cheap_and_side_effect_free():
+    report = _probe_import()
+    assert not report["settings_read"]
+    assert not report["engine_created"]
+    assert report["loaded"] == []
+    assert report["seconds"] < IMPORT_BUDGET_SECONDS, f"app.main imported in {report['seconds']:.2f}s"
+
+
+def test_create_app_mounts_every_router():
+    from app.main import create_app
+
+    paths = {route.path for route in create_app().routes if isinstance(route, APIRoute)}
+    assert {"/auth/login", "/api/users", "/sub/{token}", "/xray/apply", "/health"} <= paths
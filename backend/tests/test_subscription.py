@@ -1,20 +1,22 @@
-from app.models import ServiceProtocol
+import base64
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 
+from app import crud, subscription_formats
+from app.coalescing import FillLock
+from app.config import get_settings
+from app.models import Node, Service, ServiceNode, ServiceProtocol, User, client_uuid_for
+from app.query_stats import query_budget
+from app.subscription import subscription_flights
+from app.subscription_formats import negotiate_format, render_subscription
 
-def _auth_headers(client):
-    login_payload = {"username": "admin", "password": "changeme", "role_tab": "ADMIN"}
-    login_res = client.post("/auth/login", json=login_payload)
-    assert login_res.status_code == 200
-    token = login_res.json()["access_token"]
-    return {"Authorization": f"Bearer {token}"}
-
-
-def test_subscription_payload_and_qr(client):
-    headers = _auth_headers(client)
 
+def test_subscription_payload_and_qr(client, admin_headers):
     # Create a user
     user_payload = {"email": "sub@example.com", "full_name": "Subscription User", "reseller_id": None}
-    user_res = client.post("/api/users", json=user_payload, headers=headers)
+    user_res = client.post("/api/users", json=user_payload, headers=admin_headers)
     assert user_res.status_code == 201
     user_id = user_res.json()["id"]
 
@@ -26,12 +28,12 @@ def test_subscription_payload_and_qr(client):
         "protocol": ServiceProtocol.XRAY_VLESS.value,
         "endpoint": "vpn.example.com:443",
     }
-    service_res = client.post("/api/services", json=service_payload, headers=headers)
+    service_res = client.post("/api/services", json=service_payload, headers=admin_headers)
     assert service_res.status_code == 201
     service_id = service_res.json()["id"]
 
     # Ensure token exists
-    token_res = client.post(f"/api/services/{service_id}/token", headers=headers)
+    token_res = client.post(f"/api/services/{service_id}/token", headers=admin_headers)
     assert token_res.status_code == 200
     token_value = token_res.json()["token"]
 
@@ -39,11 +41,256 @@ def test_subscription_payload_and_qr(client):
     sub_res = client.get(f"/sub/{token_value}")
     assert sub_res.status_code == 200
     payload_text = sub_res.text
-    assert payload_text.startswith("vless://")
-    assert token_value in payload_text
+    # Links carry the persisted Xray client id, never the subscription token itself.
+    assert payload_text.startswith(f"vless://{client_uuid_for(token_value)}@")
+    assert token_value not in payload_text
 
     # QR endpoint
     qr_res = client.get(f"/sub/{token_value}/qr")
     assert qr_res.status_code == 200
     assert qr_res.headers["content-type"].startswith("image/png")
     assert qr_res.content  # non-empty
+
+
+def test_subscription_formats_render_every_node():
+    settings = SimpleNamespace(subscription_domain="example.com", subscription_port=2053, xray_inbound_port=443)
+    nodes = [
+        SimpleNamespace(node=SimpleNamespace(name="de-1", location="Frankfurt", ip_address="10.0.0.1", is_active=True)),
+        SimpleNamespace(node=SimpleNamespace(name="nl-1", location=None, ip_address="10.0.0.2", is_active=True)),
+        SimpleNamespace(node=SimpleNamespace(name="off", location=None, ip_address="10.0.0.3", is_active=False)),
+    ]
+    service = SimpleNamespace(id=1, name="Core VPN", endpoint=None, revision=1, service_nodes=nodes)
+    for index, assignment in enumerate(nodes):
+        assignment.node_id, assignment.node.revised_at = index, None
+    client_uuid = "5f0c4b8e-2d7a-5c1e-9b3f-6a8d0e4c2b71"
+    sub_token = SimpleNamespace(token="fmt-token", client_uuid=client_uuid, service=service)
+
+    links = render_subscription(sub_token, "links", settings).decode().splitlines()
+    assert links == [
+        f"vless://{client_uuid}@10.0.0.1:443?encryption=none&type=tcp&security=tls&sni=example.com#Core%20VPN%20-%20Frankfurt",
+        f"vless://{client_uuid}@10.0.0.2:443?encryption=none&type=tcp&security=tls&sni=example.com#Core%20VPN%20-%20nl-1",
+    ]
+    assert base64.b64decode(render_subscription(sub_token, "base64", settings)).decode().splitlines() == links
+
+    sing_box = json.loads(render_subscription(sub_token, "sing-box", settings))
+    assert [o["server"] for o in sing_box["outbounds"] if o["type"] == "vless"] == ["10.0.0.1", "10.0.0.2"]
+    assert {o["uuid"] for o in sing_box["outbounds"] if o["type"] == "vless"} == {client_uuid}
+    assert sing_box["outbounds"][0]["outbounds"] == ["Core VPN - Frankfurt", "Core VPN - nl-1"]
+
+    clash = render_subscription(sub_token, "clash", settings).decode()
+    assert clash.count("type: vless") == 2
+    assert 'server: "10.0.0.2"' in clash
+    assert clash.count(f'uuid: "{client_uuid}"') == 2
+
+    assert negotiate_format(None, "ClashMeta/1.18") == "clash"
+    assert negotiate_format(None, "SFA/1.8 (sing-box 1.8)") == "sing-box"
+    assert negotiate_format(None, "curl/8.0") == "links"
+    assert negotiate_format("base64", "ClashMeta/1.18") == "base64"
+
+
+
+def test_formats_share_one_fragment_build(monkeypatch):
+    settings = SimpleNamespace(subscription_domain="example.com", subscription_port=2053, xray_inbound_port=443)
+    service = SimpleNamespace(id=2, name="Shared", endpoint="vpn.example.com:443", revision=1, service_nodes=[])
+    sub_token = SimpleNamespace(token="shared-fragments", client_uuid="6b1d2c3e-0000-5000-8000-000000000001", service=service)
+    builds = []
+    build_fragments = subscription_formats.build_fragments
+    monkeypatch.setattr(
+        subscription_formats, "build_fragments", lambda *args: builds.append(1) or build_fragments(*args)
+    )
+
+    for fmt in subscription_formats.FORMATS:
+        subscription_formats.render_subscription(sub_token, fmt, settings)
+        subscription_formats.render_subscription(sub_token, fmt, settings, encoding="gzip")
+    assert len(builds) == 1
+
+    service.revision = 2
+    subscription_formats.render_subscription(sub_token, "clash", settings)
+    assert len(builds) == 2
+
+def _create_service(client, headers, email):
+    user_res = client.post("/api/users", json={"email": email, "full_name": "Poller", "reseller_id": None}, headers=headers)
+    service_payload = {
+        "name": "Polled VPN",
+        "user_id": user_res.json()["id"],
+        "reseller_id": None,
+        "protocol": ServiceProtocol.XRAY_VLESS.value,
+        "endpoint": "vpn.example.com:443",
+    }
+    service_id = client.post("/api/services", json=service_payload, headers=headers).json()["id"]
+    token = client.post(f"/api/services/{service_id}/token", headers=headers).json()["token"]
+    return service_id, token
+
+
+def test_subscription_conditional_get(client, admin_headers, monkeypatch):
+    from app import subscription
+
+    service_id, token = _create_service(client, admin_headers, "poll@example.com")
+
+    first = client.get(f"/sub/{token}")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, no-cache"
+    assert "Accept-Encoding" in first.headers["vary"]
+
+    renders = []
+    real_render = subscription.render_subscription
+    monkeypatch.setattr(
+        subscription, "render_subscription", lambda *args, **kwargs: renders.append(args) or real_render(*args, **kwargs)
+    )
+    not_modified = client.get(f"/sub/{token}", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+
+    since = client.get(f"/sub/{token}", headers={"If-Modified-Since": first.headers["last-modified"]})
+    assert since.status_code == 304
+    # Revalidations are answered from the version alone.
+    assert renders == []
+
+    other_format = client.get(f"/sub/{token}?format=clash", headers={"If-None-Match": etag})
+    assert other_format.status_code == 200
+
+    update_payload = {"name": "Renamed VPN", "protocol": ServiceProtocol.XRAY_VLESS.value, "endpoint": "vpn.example.com:443"}
+    assert client.put(f"/api/services/{service_id}", json=update_payload, headers=admin_headers).status_code == 200
+    changed = client.get(f"/sub/{token}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert "Renamed%20VPN" in changed.text
+
+
+def test_subscription_gzip_for_large_payloads(client, db_session, admin_headers):
+    service_id, token = _create_service(client, admin_headers, "gzip@example.com")
+    service = db_session.get(Service, service_id)
+    for index in range(20):
+        node = Node(
+            name=f"edge-{index}", location=f"Region {index}", ip_address=f"10.1.0.{index}",
+            api_base_url=f"http://10.1.0.{index}:8080", auth_token_hash="x",
+        )
+        service.service_nodes.append(ServiceNode(node=node))
+    db_session.commit()
+
+    plain = client.get(f"/sub/{token}", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    compressed = client.get(f"/sub/{token}", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.text == plain.text
+    assert len(plain.text.splitlines()) == 20
+
+
+def test_service_revision_tracks_rendered_fields(db_session):
+    user = User(email="revision@example.com", full_name="Revision")
+    service = Service(name="Rev", user=user, protocol=ServiceProtocol.XRAY_VLESS)
+    db_session.add(service)
+    db_session.commit()
+    assert service.revision == 1
+
+    service.traffic_used_bytes = 1024
+    db_session.commit()
+    assert service.revision == 1
+
+    service.endpoint = "rev.example.com:443"
+    db_session.commit()
+    assert service.revision == 2
+
+    node = Node(name="rev-node", location="DE", ip_address="10.2.0.1", api_base_url="http://10.2.0.1", auth_token_hash="x")
+    service.service_nodes.append(ServiceNode(node=node))
+    db_session.commit()
+    assert service.revision == 3
+
+    revised_at = node.revised_at
+    node.last_seen_at = node.created_at
+    db_session.commit()
+    assert node.revised_at == revised_at
+    node.ip_address = "10.2.0.2"
+    db_session.commit()
+    assert node.revised_at != revised_at
+
+    db_session.delete(service.service_nodes[0])
+    db_session.commit()
+    assert service.revision == 4
+
+
+def test_subscription_query_count_is_independent_of_node_count(client, db_session, admin_headers):
+    service_id, token = _create_service(client, admin_headers, "budget@example.com")
+    service = db_session.get(Service, service_id)
+    for index in range(10):
+        node = Node(
+            name=f"budget-{index}", location=f"Region {index}", ip_address=f"10.2.0.{index}",
+            api_base_url=f"http://10.2.0.{index}:8080", auth_token_hash="x",
+        )
+        service.service_nodes.append(ServiceNode(node=node))
+    db_session.commit()
+
+    # Token with its service, then the node assignments with their nodes; nothing per node.
+    with query_budget(2):
+        assert client.get(f"/sub/{token}?format=clash").status_code == 200
+
+
+def test_concurrent_identical_fetches_share_one_lookup(client, monkeypatch, admin_headers):
+    _, token = _create_service(client, admin_headers, "burst@example.com")
+
+    lookups = []
+    release = threading.Event()
+    real_lookup = crud.get_subscription_by_token
+
+    def slow_lookup(db, value):
+        lookups.append(value)
+        release.wait(5)
+        return real_lookup(db, value)
+
+    monkeypatch.setattr(crud, "get_subscription_by_token", slow_lookup)
+    before = subscription_flights.stats()
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        futures = [pool.submit(client.get, f"/sub/{token}") for _ in range(5)]
+        while subscription_flights.stats()["merged"] - before["merged"] < 4:
+            threading.Event().wait(0.01)
+        release.set()
+        responses = [future.result() for future in futures]
+
+    assert [res.status_code for res in responses] == [200] * 5
+    assert len({res.text for res in responses}) == 1
+    assert lookups == [token]
+    after = client.get("/api/diagnostics/subscription-cache", headers=admin_headers).json()["coalescing"]
+    assert after["leaders"] - before["leaders"] == 1
+    assert after["inflight"] == 0
+
+
+def test_fill_lock_lets_one_worker_render_for_all(monkeypatch):
+    class _SharedRedis:
+        """Just the commands FillLock uses, backed by a dict shared by both workers."""
+
+        def __init__(self):
+            self.data = {}
+
+        def get(self, key):
+            return self.data.get(key)
+
+        def set(self, key, value, nx=False, px=None):
+            if nx and key in self.data:
+                return None
+            self.data[key] = value.encode() if isinstance(value, str) else value
+            return True
+
+        def delete(self, key):
+            self.data.pop(key, None)
+
+    shared = _SharedRedis()
+    first, second = FillLock("test", client=shared), FillLock("test", client=shared)
+    renders = []
+
+    def render():
+        renders.append(1)
+        return b"body"
+
+    assert first.fill("v1:identity", render) == b"body"
+    assert second.fill("v1:identity", render) == b"body"
+    assert len(renders) == 1
+    assert "test:lock:v1:identity" not in shared.data
+    assert first.stats()["filled"] == 1 and second.stats()["shared"] == 1
+
+    # A worker holding the lock past the timeout makes the others render locally.
+    shared.set("test:lock:v2:identity", "other", nx=True)
+    monkeypatch.setattr(get_settings(), "subscription_fill_lock_timeout_seconds", 0.05)
+    assert second.fill("v2:identity", render) == b"body"
+    assert len(renders) == 2 and second.stats()["timeouts"] == 1
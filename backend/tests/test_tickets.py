@@ -0,0 +1,102 @@
+import pytest
+from fastapi import HTTPException
+
+from app import tickets
+from app.models import Role, SupportTicket, SupportTicketStatus
+from app.schemas import UserPublic
+
+ADMIN = UserPublic(username="admin", role=Role.ADMIN)
+
+
+def _as_user(reseller):
+    return UserPublic(username=reseller.auth_username, role=Role.RESELLER)
+
+
+def test_messages_maintain_ticket_summary_and_unread(db_session, make_reseller):
+    reseller = _as_user(make_reseller("ticket-a"))
+    ticket = tickets.create_ticket(db_session, reseller, "Cannot connect", "Node in Frankfurt times out")
+    assert ticket.message_count == 1
+    assert ticket.unread_by_admin == 1
+    assert ticket.last_sender_role == "RESELLER"
+
+    tickets.add_message(db_session, ticket.id, ADMIN, "Restarted the node, try again")
+    db_session.refresh(ticket)
+    assert ticket.message_count == 2
+    assert ticket.unread_by_reseller == 1
+    assert ticket.last_message_preview == "Restarted the node, try again"
+
+    tickets.mark_read(db_session, ticket.id, ADMIN)
+    inbox = tickets.list_tickets(db_session, ADMIN, unread_only=True)
+    assert ticket.id not in [t.id for t in inbox]
+
+    tickets.set_status(db_session, ticket.id, reseller, SupportTicketStatus.CLOSED)
+    with pytest.raises(HTTPException) as exc:
+        tickets.add_message(db_session, ticket.id, reseller, "one more thing")
+    assert exc.value.status_code == 409
+
+
+def test_resellers_only_see_their_tickets(db_session, make_reseller):
+    owner, other = _as_user(make_reseller("ticket-owner")), _as_user(make_reseller("ticket-other"))
+    ticket = tickets.create_ticket(db_session, owner, "Billing question", "Invoice looks wrong")
+
+    with pytest.raises(HTTPException) as exc:
+        tickets.get_ticket(db_session, ticket.id, other)
+    assert exc.value.status_code == 404
+    assert ticket.id not in [t.id for t in tickets.list_tickets(db_session, other)]
+    assert tickets.search_tickets(db_session, other, "invoice") == []
+    assert tickets.get_ticket(db_session, ticket.id, ADMIN).id == ticket.id
+
+
+def test_message_and_inbox_cursors(db_session, make_reseller):
+    reseller = _as_user(make_reseller("ticket-pages"))
+    ticket = tickets.create_ticket(db_session, reseller, "Long thread", "message 0")
+    for index in range(1, 7):
+        tickets.add_message(db_session, ticket.id, reseller, f"message {index}")
+
+    first = tickets.list_messages(db_session, ticket.id, reseller, limit=3)
+    second = tickets.list_messages(db_session, ticket.id, reseller, after_id=first[-1].id, limit=3)
+    assert [m.message for m in first + second] == [f"message {i}" for i in range(6)]
+
+    latest = tickets.list_messages(db_session, ticket.id, reseller, before_id=10**9, limit=2)
+    assert [m.message for m in latest] == ["message 5", "message 6"]
+    older = tickets.list_messages(db_session, ticket.id, reseller, before_id=latest[0].id, limit=2)
+    assert [m.message for m in older] == ["message 3", "message 4"]
+
+    for index in range(3):
+        tickets.create_ticket(db_session, reseller, f"Inbox {index}", "hello")
+    page = tickets.list_tickets(db_session, reseller, limit=2)
+    rest = tickets.list_tickets(db_session, reseller, limit=10, cursor=tickets.encode_cursor(page[-1]))
+    ids = [t.id for t in page + rest]
+    assert len(ids) == len(set(ids)) == 4
+
+
+def test_inbox_pages_past_tickets_without_messages(db_session, make_reseller):
+    reseller = _as_user(make_reseller("ticket-silent"))
+    for index in range(2):
+        tickets.create_ticket(db_session, reseller, f"Chatty {index}", "hello")
+    silent = SupportTicket(created_by=reseller.username, subject="Opened without a message")
+    db_session.add(silent)
+    db_session.commit()
+    tickets.create_ticket(db_session, reseller, "Chatty 2", "hello")
+
+    ids, cursor = [], None
+    while True:
+        page = tickets.list_tickets(db_session, reseller, limit=1, cursor=cursor)
+        if not page:
+            break
+        ids.append(page[0].id)
+        cursor = tickets.encode_cursor(page[0])
+    assert silent.id in ids
+    assert len(ids) == len(set(ids)) == 4
+
+
+def test_search_ranks_subject_hits_above_message_hits(db_session, make_reseller):
+    reseller = _as_user(make_reseller("ticket-search"))
+    in_message = tickets.create_ticket(db_session, reseller, "General", "renewal failed yesterday")
+    in_subject = tickets.create_ticket(db_session, reseller, "Renewal problem", "see title")
+    tickets.create_ticket(db_session, reseller, "Unrelated", "nothing here")
+
+    hits = tickets.search_tickets(db_session, reseller, "renewal")
+    assert [ticket.id for ticket, _ in hits] == [in_subject.id, in_message.id]
+    assert hits[0][1] > hits[1][1]
+    assert tickets.search_tickets(db_session, reseller, "   ") == []
@@ -0,0 +1,36 @@
+import secrets
+
+from app.models import Service, SubscriptionToken, User
+from app.token_filter import BloomFilter, SubscriptionTokenFilter
+
+
+def test_bloom_filter_has_no_false_negatives_and_bounded_false_positives():
+    bloom = BloomFilter(capacity=5000, error_rate=0.01)
+    members = [secrets.token_urlsafe(32) for _ in range(5000)]
+    for token in members:
+        bloom.add(token)
+    assert all(token in bloom for token in members)
+    false_positives = sum(secrets.token_urlsafe(32) in bloom for _ in range(5000))
+    assert false_positives / 5000 < 0.03
+
+
+def test_token_filter_rejects_unknown_tokens_and_tracks_new_ones(db_session):
+    user = User(email="filter@example.com", full_name="Filter User")
+    db_session.add(user)
+    db_session.flush()
+    service = Service(name="Filtered", user_id=user.id)
+    db_session.add(service)
+    db_session.flush()
+    db_session.add(SubscriptionToken(token="known-token", service_id=service.id))
+    db_session.commit()
+
+    token_filter = SubscriptionTokenFilter()
+    assert token_filter.might_exist("anything")  # not built yet: let everything through
+    token_filter.rebuild(db_session)
+    assert token_filter.might_exist("known-token")
+    assert not token_filter.might_exist("random-scanner-token")
+    assert not token_filter.might_exist("x" * 65)
+
+    token_filter.add("fresh-token")
+    assert token_filter.might_exist("fresh-token")
+    assert token_filter.stats()["rejected"] == 2
@@ -0,0 +1,40 @@
+from app import crud, reseller_stats, xray
+from app.models import ServiceProtocol, client_uuid_for
+from app.query_stats import query_budget
+from app.usage import TrafficCollector, usage_from_xray_stats
+
+
+def test_xray_stats_are_attributed_by_stats_key(db_session):
+    reseller_id = crud.get_reseller_by_username(db_session, "reseller").id
+    services = []
+    for index in range(3):
+        user = crud.create_user(db_session, email=f"stats{index}@example.com", full_name="Stats", reseller_id=reseller_id)
+        services.append(
+            crud.create_service(
+                db_session, name=f"Stats {index}", user_id=user.id, reseller_id=reseller_id,
+                protocol=ServiceProtocol.XRAY_VLESS, endpoint=None,
+            )
+        )
+    tokens = [service.subscription_token for service in services]
+    assert all(token.client_uuid == client_uuid_for(token.token) for token in tokens)
+
+    # The rendered config carries the stored values, so Xray reports traffic under the stats key.
+    clients = {entry["email"]: entry["id"] for entry in xray._collect_vless_clients(db_session)}
+    assert all(clients[token.stats_key] == token.client_uuid for token in tokens)
+
+    stats = [
+        {"name": f"user>>>{tokens[0].stats_key}>>>traffic>>>uplink", "value": 100},
+        {"name": f"user>>>{tokens[0].stats_key}>>>traffic>>>downlink", "value": 400},
+        {"name": f"user>>>{tokens[2].stats_key}>>>traffic>>>downlink", "value": "7"},
+        {"name": "user>>>0000000000000000>>>traffic>>>downlink", "value": 9},
+        {"name": "inbound>>>vless-tls>>>traffic>>>downlink", "value": 1000},
+    ]
+    assert usage_from_xray_stats(stats) == {tokens[0].stats_key: 500, tokens[2].stats_key: 7, "0000000000000000": 9}
+
+    traffic_before = reseller_stats.get_stats(db_session, reseller_id).traffic_used_bytes
+    # One key lookup, one executemany UPDATE, one reseller delta, however many clients report.
+    with query_budget(4):
+        assert TrafficCollector(db_session).record_xray_stats(stats) == 2
+    db_session.expire_all()
+    assert [service.traffic_used_bytes for service in services] == [500, 0, 7]
+    assert reseller_stats.get_stats(db_session, reseller_id).traffic_used_bytes == traffic_before + 507
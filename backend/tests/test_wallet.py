@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import update
+
+from app import wallet
+from app.models import WalletTransaction
+
+
+def test_purchase_debits_balance_and_extends_subscription(db_session, make_reseller):
+    reseller = make_reseller("wallet-a")
+    plan = wallet.create_plan(db_session, name="Monthly", price=300, duration_days=30)
+    assert wallet.credit(db_session, reseller.id, 500, "top-up") == 500
+
+    first, balance = wallet.purchase_plan(db_session, reseller.id, plan.id)
+    assert balance == 200
+    assert wallet.get_balance(db_session, reseller.id) == 200
+
+    with pytest.raises(HTTPException) as exc:
+        wallet.purchase_plan(db_session, reseller.id, plan.id)
+    assert exc.value.status_code == 402
+    assert wallet.get_balance(db_session, reseller.id) == 200
+
+    wallet.credit(db_session, reseller.id, 100)
+    second, balance = wallet.purchase_plan(db_session, reseller.id, plan.id)
+    assert balance == 0
+    assert second.starts_at.replace(tzinfo=None) == first.ends_at.replace(tzinfo=None)
+
+    with pytest.raises(HTTPException) as exc:
+        wallet.credit(db_session, reseller.id, 0)
+    assert exc.value.status_code == 400
+
+
+def test_statement_uses_checkpoints(db_session, make_reseller):
+    reseller = make_reseller("wallet-b")
+    plan = wallet.create_plan(db_session, name="Weekly", price=40, duration_days=7)
+    wallet.credit(db_session, reseller.id, 100)
+    wallet.purchase_plan(db_session, reseller.id, plan.id)
+    # Age the first two rows so they fall before the statement window.
+    past = datetime.utcnow() - timedelta(days=10)
+    db_session.execute(update(WalletTransaction).where(WalletTransaction.reseller_id == reseller.id).values(created_at=past))
+    db_session.commit()
+    checkpoint = wallet.checkpoint_wallet(db_session, reseller.id)
+    assert checkpoint is not None and checkpoint.balance == 60
+    assert wallet.checkpoint_wallet(db_session, reseller.id) is None
+
+    since = datetime.utcnow()
+    wallet.credit(db_session, reseller.id, 15)
+    wallet.purchase_plan(db_session, reseller.id, plan.id)
+
+    result = wallet.statement(db_session, reseller.id, since, datetime.utcnow() + timedelta(seconds=1))
+    assert result["opening_balance"] == 60
+    assert [(row.type.value, row.amount) for row in result["transactions"]] == [("CREDIT", 15), ("DEBIT", 40)]
+    assert result["closing_balance"] == 35 == wallet.get_balance(db_session, reseller.id)
+
+    history = wallet.statement(db_session, reseller.id, past - timedelta(days=1), since)
+    assert history["opening_balance"] == 0
+    assert history["closing_balance"] == 60
@@ -1,7 +1,6 @@
 import os
 from pathlib import Path
 
-from app.config import get_settings
 from app.models import ServiceProtocol
 
 
@@ -13,11 +12,8 @@ def _auth_headers(client):
     return {"Authorization": f"Bearer {token}"}
 
 
-def test_xray_render_and_apply(client, monkeypatch, tmp_path):
-    get_settings.cache_clear()
-    monkeypatch.setenv("XRAY_CONFIG_PATH", str(tmp_path / "config.json"))
-    monkeypatch.setenv("XRAY_RELOAD_COMMAND", "")
-    monkeypatch.setenv("XRAY_STATUS_HOST", "localhost")
+def test_xray_render_and_apply(client, settings_env, tmp_path):
+    settings_env(XRAY_CONFIG_PATH=str(tmp_path / "config.json"), XRAY_RELOAD_COMMAND="", XRAY_STATUS_HOST="localhost")
     headers = _auth_headers(client)
 
     # Seed service
@@ -53,3 +49,37 @@ def test_xray_render_and_apply(client, monkeypatch, tmp_path):
     status_json = status_res.json()
     assert "healthy" in status_json
     assert status_json["last_apply_status"] is not None
+
+
+def test_render_is_a_single_read_and_backfill_fills_gaps(db_session):
+    from sqlalchemy import delete
+
+    from app import crud, maintenance, xray
+    from app.models import SubscriptionToken
+    from app.query_stats import query_budget
+
+    services = []
+    for index in range(5):
+        user = crud.create_user(db_session, email=f"render{index}@example.com", full_name="Render", reseller_id=None)
+        service = crud.create_service(
+            db_session, name=f"Render {index}", user_id=user.id, reseller_id=None,
+            protocol=ServiceProtocol.XRAY_VLESS, endpoint=None,
+        )
+        # Created together with its service.
+        assert service.subscription_token is not None
+        services.append(service)
+    legacy = [service.id for service in services[:3]]
+    db_session.execute(delete(SubscriptionToken).where(SubscriptionToken.service_id.in_(legacy)))
+    db_session.commit()
+
+    with query_budget(1):
+        clients = xray._collect_vless_clients(db_session)
+    keys = {client["email"] for client in clients}
+    assert {s.subscription_token.stats_key for s in services[3:]} <= keys
+    assert db_session.query(SubscriptionToken).filter(SubscriptionToken.service_id.in_(legacy)).count() == 0
+
+    assert maintenance.backfill_subscription_tokens(db_session, batch_size=2) >= 3
+    assert maintenance.backfill_subscription_tokens(db_session, batch_size=2) == 0
+    db_session.expire_all()
+    keys = {client["email"] for client in xray._collect_vless_clients(db_session)}
+    assert {s.subscription_token.stats_key for s in services} <= keys